@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+Compare the Parsimonious PEG backend of the CP2K input parser
+with the line-oriented backend on an input with a large &COORD section (parsed with bulk=True).
+"""
+
+from __future__ import print_function
+
+import io
+import time
+import argparse
+
+import synthetic
+
+from cp2k_tools.parser.input import CP2KInputParser
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--atoms', type=int, default=20000, help="number of atoms in &COORD (default: 20000)")
+    args = parser.parse_args()
+
+    content = io.StringIO()
+    synthetic.write_input(content, args.atoms)
+    content = content.getvalue()
+
+    results = {}
+    for backend in CP2KInputParser.BACKENDS:
+        start = time.time()
+        results[backend] = CP2KInputParser(backend, bulk=True).parse(io.StringIO(content))
+        elapsed = time.time() - start
+
+        print("{:6s}  time: {:8.3f} s  throughput: {:8.2f} MB/s  {:10.0f} lines/s".format(
+            backend, elapsed, len(content)/1e6/elapsed, content.count('\n')/elapsed))
+
+    assert results['peg'] == results['lines'], "results differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Measure the throughput of CP2KOutputParser on a scaled-up copy of
+examples/C4H4S_dft-only.out, with the dispatch by leading characters
+and with every element parser tried on every line.
+"""
+
+from __future__ import print_function
+
+import os
+import time
+import argparse
+import tempfile
+
+from cp2k_tools.parser.output import CP2KOutputParser
+
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'examples', 'C4H4S_dft-only.out')
+
+
+def trial_parser():
+    """A parser trying every element parser on every line, as before the dispatch layer"""
+    parser = CP2KOutputParser()
+    parser._dispatch = {}
+    parser._catchall = tuple(parser._parsers)
+    return parser
+
+
+def measure(parser, filename):
+    start = time.time()
+    with open(filename, 'r') as fhandle:
+        parser.parse(fhandle)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', type=int, default=100,
+                        help="number of copies of the example output to parse (default: 100)")
+    args = parser.parse_args()
+
+    with open(EXAMPLE, 'r') as fhandle:
+        content = fhandle.read()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.out') as fhandle:
+        for _ in range(args.scale):
+            fhandle.write(content)
+        fhandle.flush()
+
+        size = os.path.getsize(fhandle.name)
+        print("output: {} copies, {:.1f} MB".format(args.scale, size/1e6))
+
+        for name, cp2kparser in (('trial', trial_parser()), ('dispatch', CP2KOutputParser())):
+            elapsed = measure(cp2kparser, fhandle.name)
+            print("{:10s} time: {:8.3f} s  throughput: {:8.1f} MB/s".format(name, elapsed, size/1e6/elapsed))
+
+
+if __name__ == '__main__':
+    main()
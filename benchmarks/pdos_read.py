@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Compare the readers for the table of a CP2K PDOS file on a synthetic PDOS file:
+np.loadtxt (with the fast reader of numpy >= 1.23) and the conversion of the whole
+table in one go (used by read_pdos for older versions of numpy).
+"""
+
+from __future__ import print_function
+
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from cp2k_tools.pdos import read_pdos
+
+from synthetic import write_pdos
+
+
+def _loadtxt(fhandle):
+    fhandle.readline()  # skip the two header lines
+    fhandle.readline()
+    return np.loadtxt(fhandle, ndmin=2)
+
+
+def _split(fhandle):
+    fhandle.readline()
+    fhandle.readline()
+    return np.array(fhandle.read().split(), dtype=float).reshape(-1, 12)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mos', type=int, default=200000, help="number of eigenvalues (default: 200000)")
+    parser.add_argument('--repeat', type=int, default=5, help="number of runs, the best is reported (default: 5)")
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.pdos') as fhandle:
+        write_pdos(fhandle, args.mos)
+        fhandle.flush()
+
+        size = os.path.getsize(fhandle.name)
+        print("PDOS file: {} eigenvalues, {:.1f} MB, numpy {}".format(args.mos, size/1e6, np.__version__))
+
+        results = {}
+        for name, reader in (('np.loadtxt', _loadtxt), ('split + np.array', _split),
+                             ('read_pdos', lambda fh: read_pdos(fh)[3])):
+            best = None
+            for _ in range(args.repeat):
+                with open(fhandle.name, 'r') as source:
+                    start = time.time()
+                    results[name] = reader(source)
+                    elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            print("{:16s}  time: {:8.3f} s  throughput: {:8.1f} MB/s".format(name, best, size/1e6/best))
+
+        for data in results.values():
+            assert np.array_equal(data, results['read_pdos'])
+
+
+if __name__ == '__main__':
+    main()
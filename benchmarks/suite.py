@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for the parsers, generators and scripts on synthetic inputs.
+
+Each benchmark runs in its own Python process to measure its peak memory (RSS)
+independently of the others. The results are printed and can be stored as JSON
+to compare them with a later run:
+
+    python benchmarks/suite.py --output before.json
+    ... apply changes ...
+    python benchmarks/suite.py --compare before.json
+"""
+
+from __future__ import print_function
+
+import os
+import io
+import sys
+import json
+import time
+import runpy
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import synthetic
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'scripts')
+
+# the sizes of the synthetic inputs for each preset
+SIZES = {
+    'small': {'xyz': (200, 500), 'output': 20, 'input': 500, 'pdos': 2000, 'bs': (4, 100, 50)},
+    'medium': {'xyz': (2000, 500), 'output': 200, 'input': 5000, 'pdos': 10000, 'bs': (10, 500, 100)},
+    'large': {'xyz': (10000, 1000), 'output': 1000, 'input': 20000, 'pdos': 50000, 'bs': (20, 2000, 200)},
+    }
+
+# benchmark name -> (name of the input, function running the benchmark and returning the elapsed time)
+BENCHMARKS = {}
+
+
+def benchmark(name, inputname):
+    def _decorator(func):
+        BENCHMARKS[name] = (inputname, func)
+        return func
+    return _decorator
+
+
+def _timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def _run_script(script, *args):
+    """Run one of the scripts in this process, with its stdout/stderr discarded"""
+    argv, stdout, stderr = sys.argv, sys.stdout, sys.stderr
+    sys.argv = [script] + list(args)
+    sys.stdout = sys.stderr = io.StringIO()
+    try:
+        runpy.run_path(os.path.join(SCRIPTS_DIR, script), run_name='__main__')
+    finally:
+        sys.argv, sys.stdout, sys.stderr = argv, stdout, stderr
+
+
+@benchmark('xyz_parse', 'xyz')
+def bench_xyz_parse(path):
+    from cp2k_tools.parser.xyz import XYZParser
+    with open(path, 'rb') as fhandle:
+        return _timed(XYZParser.parse, fhandle)
+
+
+@benchmark('xyz_parse_arrays', 'xyz')
+def bench_xyz_parse_arrays(path):
+    from cp2k_tools.parser.xyz import XYZParser
+    with open(path, 'rb') as fhandle:
+        return _timed(XYZParser.parse_arrays, fhandle)
+
+
+@benchmark('xyz_count_frames', 'xyz')
+def bench_xyz_count_frames(path):
+    from cp2k_tools.parser.xyz import XYZParser
+    with open(path, 'rb') as fhandle:
+        return _timed(XYZParser.count_frames, fhandle)
+
+
+@benchmark('xyz_generator_write', 'xyz')
+def bench_xyz_generator_write(path):
+    from cp2k_tools.parser.xyz import XYZParser
+    from cp2k_tools.generator.xyz import XYZGenerator
+
+    with open(path, 'rb') as fhandle:
+        frames = XYZParser.parse(fhandle)
+
+    with tempfile.TemporaryFile('w') as output:
+        return _timed(XYZGenerator().write, frames, output)
+
+
+@benchmark('xyz_generator_write_arrays', 'xyz')
+def bench_xyz_generator_write_arrays(path):
+    from cp2k_tools.parser.xyz import XYZParser
+    from cp2k_tools.generator.xyz import XYZGenerator
+
+    with open(path, 'rb') as fhandle:
+        coords, symbols, comments = XYZParser.parse_arrays(fhandle)
+
+    with tempfile.TemporaryFile('w') as output:
+        return _timed(XYZGenerator().write_arrays, coords, symbols, output, comments)
+
+
+@benchmark('output_parser', 'output')
+def bench_output_parser(path):
+    from cp2k_tools.parser.output import CP2KOutputParser
+    with open(path, 'r') as fhandle:
+        return _timed(CP2KOutputParser().parse, fhandle)
+
+
+@benchmark('output_block_parser', 'output')
+def bench_output_block_parser(path):
+    from cp2k_tools.parser.output import CP2KOutputBlockParser
+    with open(path, 'rb') as fhandle:
+        return _timed(CP2KOutputBlockParser().parse_file, fhandle)
+
+
+@benchmark('input_parser', 'input')
+def bench_input_parser(path):
+    from cp2k_tools.parser.input import CP2KInputParser
+    with open(path, 'r') as fhandle:
+        return _timed(CP2KInputParser().parse, fhandle)
+
+
+@benchmark('input_parser_lines', 'input')
+def bench_input_parser_lines(path):
+    from cp2k_tools.parser.input import CP2KInputParser
+    with open(path, 'r') as fhandle:
+        return _timed(CP2KInputParser('lines').parse, fhandle)
+
+
+@benchmark('dict2cp2k', 'input')
+def bench_dict2cp2k(path):
+    from cp2k_tools.parser.input import CP2KInputParser
+    from cp2k_tools.generator import dict2cp2k
+
+    with open(path, 'r') as fhandle:
+        tree = CP2KInputParser().parse(fhandle)
+
+    return _timed(dict2cp2k, tree)
+
+
+@benchmark('cp2k_pdos', 'pdos')
+def bench_cp2k_pdos(path):
+    with tempfile.NamedTemporaryFile('w') as output:
+        return _timed(_run_script, 'cp2k_pdos.py', path, '--output', output.name)
+
+
+@benchmark('cp2k_bs2csv', 'bs')
+def bench_cp2k_bs2csv(path):
+    # the CSV files are written next to the input, which is in a temporary directory
+    return _timed(_run_script, 'cp2k_bs2csv.py', path)
+
+
+def write_inputs(directory, sizes):
+    """Generate the synthetic inputs, returns a dict name -> path"""
+    writers = {
+        'xyz': ('traj.xyz', lambda fh: synthetic.write_trajectory(fh, *sizes['xyz'])),
+        'output': ('run.out', lambda fh: synthetic.write_output(fh, sizes['output'])),
+        'input': ('run.inp', lambda fh: synthetic.write_input(fh, sizes['input'])),
+        'pdos': ('run-C.pdos', lambda fh: synthetic.write_pdos(fh, sizes['pdos'])),
+        'bs': ('run.bs', lambda fh: synthetic.write_bandstructure(fh, *sizes['bs'])),
+        }
+
+    paths = {}
+    for name, (filename, writer) in writers.items():
+        paths[name] = os.path.join(directory, filename)
+        with open(paths[name], 'w') as fhandle:
+            writer(fhandle)
+
+    return paths
+
+
+def _maxrss_kb():
+    import resource
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss // 1024 if sys.platform == 'darwin' else maxrss  # bytes on macOS, kB elsewhere
+
+
+def run_child(name, path):
+    """Run a single benchmark (in the child process) and print the result as JSON"""
+    _, func = BENCHMARKS[name]
+
+    # the modules are imported in the benchmark function, this is only the interpreter
+    baseline = _maxrss_kb()
+    elapsed = func(path)
+
+    print(json.dumps({'seconds': elapsed, 'peak_rss_kb': _maxrss_kb(), 'baseline_rss_kb': baseline}))
+
+
+def run_benchmark(name, path, repeat):
+    """Run a benchmark in child processes, returns the result of the fastest run"""
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([REPO_DIR] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    results = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', name, path], env=env)
+        results.append(json.loads(output.decode('utf8').splitlines()[-1]))
+
+    result = min(results, key=lambda r: r['seconds'])
+    result['bytes'] = os.path.getsize(path)
+    result['mb_per_s'] = result['bytes']/1e6/result['seconds'] if result['seconds'] > 0 else None
+    return result
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.STDOUT).decode('utf8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous, threshold):
+    """Print the changes relative to the previous results, returns the names of the regressed benchmarks"""
+
+    regressions = []
+
+    print("\n{:30s} {:>10s} {:>10s} {:>8s} {:>12s} {:>12s}".format(
+        "benchmark", "before [s]", "after [s]", "ratio", "RSS before", "RSS after"))
+
+    for name, result in sorted(results.items()):
+        if name not in previous:
+            continue
+
+        before = previous[name]
+        ratio = result['seconds']/before['seconds'] if before['seconds'] > 0 else float('inf')
+        rss_ratio = float(result['peak_rss_kb'])/before['peak_rss_kb'] if before['peak_rss_kb'] > 0 else 1.
+
+        flag = ""
+        if ratio > 1. + threshold or rss_ratio > 1. + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+
+        print("{:30s} {:10.3f} {:10.3f} {:8.2f} {:10d}kB {:10d}kB{}".format(
+            name, before['seconds'], result['seconds'], ratio, before['peak_rss_kb'], result['peak_rss_kb'], flag))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', metavar='BENCHMARK', nargs='*',
+                        help="the benchmarks to run (default: all of: {})".format(", ".join(sorted(BENCHMARKS))))
+    parser.add_argument('--size', choices=sorted(SIZES), default='small',
+                        help="size of the synthetic inputs (default: small)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="number of runs per benchmark, the fastest one is reported (default: 3)")
+    parser.add_argument('--output', '-o', type=str, default=None, help="write the results as JSON to this file")
+    parser.add_argument('--compare', type=str, default=None,
+                        help="compare with the results stored in this JSON file, exit with 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="relative slowdown or memory increase considered a regression (default: 0.1)")
+    parser.add_argument('--child', nargs=2, metavar=('BENCHMARK', 'INPUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    names = args.benchmarks or sorted(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmarks: {}".format(", ".join(sorted(unknown))))
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = write_inputs(tmpdir, SIZES[args.size])
+
+        results = {}
+        print("{:30s} {:>10s} {:>10s} {:>12s}".format("benchmark", "time [s]", "MB/s", "peak RSS"))
+
+        for name in names:
+            results[name] = run_benchmark(name, paths[BENCHMARKS[name][0]], args.repeat)
+            print("{:30s} {:10.3f} {:10.1f} {:10d}kB".format(
+                name, results[name]['seconds'], results[name]['mb_per_s'] or 0., results[name]['peak_rss_kb']))
+    finally:
+        import shutil
+        shutil.rmtree(tmpdir)
+
+    report = {
+        'version': 1,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'size': args.size,
+        'results': results,
+        }
+
+    if args.output:
+        with open(args.output, 'w') as fhandle:
+            json.dump(report, fhandle, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, 'r') as fhandle:
+            previous = json.load(fhandle)
+
+        if previous.get('size') != args.size:
+            print("WARNING: comparing with results for input size '{}'".format(previous.get('size')), file=sys.stderr)
+
+        if compare(results, previous['results'], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Generators for large synthetic CP2K files, in the formats read by the parsers and scripts.
+
+All generators are deterministic for a given seed, to be able to compare benchmark runs.
+"""
+
+from __future__ import print_function
+
+import os
+
+import numpy as np
+
+
+EXAMPLE_OUTPUT = os.path.join(os.path.dirname(__file__), '..', 'examples', 'C4H4S_dft-only.out')
+
+ELEMENTS = ['H', 'C', 'N', 'O']
+
+
+def write_trajectory(fhandle, nframes, natoms, seed=42):
+    """Write a random trajectory in the CP2K XYZ output format"""
+    rng = np.random.RandomState(seed)
+    symbols = rng.choice(ELEMENTS, natoms)
+    fmt = ''.join(' %2s %%20.10f%%20.10f%%20.10f\n' % sym for sym in symbols)
+
+    for num in range(nframes):
+        fhandle.write('%8i\n i = %8i, time = %12.3f, E = %20.10f\n' % (natoms, num, 0.5*num, -1.0*num))
+        fhandle.write(fmt % tuple(rng.uniform(-20, 20, natoms*3).tolist()))
+
+
+def write_output(fhandle, scale):
+    """Write `scale` copies of the example CP2K output (a single point calculation)"""
+    with open(EXAMPLE_OUTPUT, 'r') as example:
+        content = example.read()
+
+    for _ in range(scale):
+        fhandle.write(content)
+
+
+def write_input(fhandle, natoms, nkinds=4, seed=42):
+    """Write a CP2K input for a system of `natoms` atoms in the &COORD section"""
+    rng = np.random.RandomState(seed)
+    symbols = rng.choice(ELEMENTS[:nkinds], natoms)
+
+    fhandle.write("""&GLOBAL
+   PROJECT synthetic
+   RUN_TYPE MD
+   PRINT_LEVEL LOW
+&END GLOBAL
+
+&MOTION
+   &MD
+      ENSEMBLE NVT
+      STEPS 1000
+      TIMESTEP [fs] 0.5
+      TEMPERATURE [K] 300
+   &END MD
+&END MOTION
+
+&FORCE_EVAL
+   METHOD Quickstep
+   &DFT
+      BASIS_SET_FILE_NAME BASIS_MOLOPT
+      POTENTIAL_FILE_NAME POTENTIAL
+      &SCF
+         SCF_GUESS ATOMIC
+         MAX_SCF 50
+         EPS_SCF 1.0E-6
+      &END SCF
+      &XC
+         &XC_FUNCTIONAL PBE
+         &END XC_FUNCTIONAL
+      &END XC
+   &END DFT
+   &SUBSYS
+      &CELL
+         ABC [angstrom] 40.0 40.0 40.0
+         PERIODIC XYZ
+      &END CELL
+      &COORD
+""")
+
+    for sym, pos in zip(symbols, rng.uniform(0, 40, (natoms, 3)).tolist()):
+        fhandle.write("         %s %.10f %.10f %.10f\n" % ((sym, ) + tuple(pos)))
+
+    fhandle.write("      &END COORD\n")
+
+    for sym in ELEMENTS[:nkinds]:
+        fhandle.write("""      &KIND {0}
+         ELEMENT {0}
+         BASIS_SET DZVP-MOLOPT-GTH
+         POTENTIAL GTH-PBE
+      &END KIND
+""".format(sym))
+
+    fhandle.write("   &END SUBSYS\n&END FORCE_EVAL\n")
+
+
+def write_pdos(fhandle, nmos, kind='C', efermi=-0.15, seed=42):
+    """Write a CP2K PDOS file of the given atomic kind with `nmos` eigenvalues"""
+    rng = np.random.RandomState(seed)
+    orbitals = ['s', 'py', 'pz', 'px', 'd-2', 'd-1', 'd0', 'd+1', 'd+2']
+
+    fhandle.write("# Projected DOS for atomic kind {} at iteration step i = 0, E(Fermi) = {:12.6f} a.u.\n"
+                  .format(kind, efermi))
+    fhandle.write("#     MO Eigenvalue [a.u.]      Occupation" + "".join("{:>13}".format(o) for o in orbitals) + "\n")
+
+    eigenvalues = np.sort(rng.uniform(-1., 1., nmos))
+    densities = rng.uniform(0, 1, (nmos, len(orbitals)))
+    fmt = "{:8d} {:17.6f} {:15.6f}" + "{:13.5f}"*len(orbitals) + "\n"
+
+    for num, (eigenvalue, density) in enumerate(zip(eigenvalues.tolist(), densities.tolist())):
+        fhandle.write(fmt.format(num + 1, eigenvalue, 2. if eigenvalue < efermi else 0., *density))
+
+
+def write_bandstructure(fhandle, nsets, npoints, nbands, seed=42):
+    """Write a CP2K band structure file with `nsets` k-point sets of `npoints` points each"""
+    rng = np.random.RandomState(seed)
+    nr = 0
+
+    for setnr in range(1, nsets + 1):
+        fhandle.write("  SET: {:6d}                 TOTAL POINTS: {:6d}\n".format(setnr, npoints))
+        fhandle.write("     POINT   1            0.000000    0.000000    0.000000\n")
+        fhandle.write("     POINT   2            0.500000    0.000000    0.500000\n")
+
+        for kpoint in np.linspace(0, 0.5, npoints).tolist():
+            nr += 1
+            fhandle.write("      Nr. {:5d}    Spin 1 K-Point {:12.8f}{:12.8f}{:12.8f}\n"
+                          .format(nr, kpoint, 0., kpoint))
+            fhandle.write("{:16d}\n".format(nbands))
+            values = np.sort(rng.uniform(-10., 10., nbands)).tolist()
+            for start in range(0, nbands, 4):
+                fhandle.write("".join("{:20.8f}".format(v) for v in values[start:start + 4]) + "\n")
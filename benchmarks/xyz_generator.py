@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Compare the throughput of XYZGenerator.write (one write per atom line)
+and XYZGenerator.write_arrays (formatting whole frames, chunked writes).
+"""
+
+from __future__ import print_function
+
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from cp2k_tools.generator.xyz import XYZGenerator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=500, help="number of frames (default: 500)")
+    parser.add_argument('--atoms', type=int, default=1000, help="number of atoms per frame (default: 1000)")
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(42)
+    coords = rng.uniform(-20, 20, (args.frames, args.atoms, 3))
+    symbols = rng.choice(['H', 'C', 'N', 'O'], args.atoms)
+    comments = [' i = %8i, time = %12.3f' % (num, 0.5*num) for num in range(args.frames)]
+
+    frames = [{'comment': comment, 'atoms': [(sym, pos) for sym, pos in zip(symbols, frame.tolist())]}
+              for frame, comment in zip(coords, comments)]
+
+    outputs = {}
+    for name, write in [('write', lambda fh: XYZGenerator().write(frames, fh)),
+                        ('write_arrays', lambda fh: XYZGenerator().write_arrays(coords, symbols, fh, comments))]:
+        with tempfile.NamedTemporaryFile('w', suffix='.xyz', delete=False) as fhandle:
+            start = time.time()
+            write(fhandle)
+            fhandle.flush()
+            elapsed = time.time() - start
+            outputs[name] = fhandle.name
+
+        size = os.path.getsize(outputs[name])
+        print("{:12s}  time: {:8.3f} s  throughput: {:8.1f} MB/s  {:10.0f} atom lines/s".format(
+            name, elapsed, size/1e6/elapsed, args.frames*args.atoms/elapsed))
+
+    with open(outputs['write'], 'rb') as first, open(outputs['write_arrays'], 'rb') as second:
+        assert first.read() == second.read(), "outputs differ"
+
+    for filename in outputs.values():
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Compare the serial and the parallel mode of XYZParser.parse_arrays
+on a synthetic XYZ trajectory.
+"""
+
+from __future__ import print_function
+
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from cp2k_tools.parser.xyz import XYZParser
+
+from synthetic import write_trajectory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=2000, help="number of frames (default: 2000)")
+    parser.add_argument('--atoms', type=int, default=1000, help="number of atoms per frame (default: 1000)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="number of workers for the parallel mode (default: number of CPUs)")
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.xyz') as fhandle:
+        write_trajectory(fhandle, args.frames, args.atoms)
+        fhandle.flush()
+
+        size = os.path.getsize(fhandle.name)
+        print("trajectory: {} frames, {} atoms, {:.1f} MB".format(args.frames, args.atoms, size/1e6))
+
+        # for reference: the serial pass over the frame headers, which the parallel mode
+        # does in the workers (included in its timing below)
+        with open(fhandle.name, 'rb') as source:
+            start = time.time()
+            XYZParser.index(source)
+            print("scanning the frame headers: {:8.3f} s".format(time.time() - start))
+
+        results = {}
+        for workers in (1, args.workers):
+            with open(fhandle.name, 'rb') as source:
+                start = time.time()
+                results[workers] = XYZParser.parse_arrays(source, workers=workers)
+                elapsed = time.time() - start
+
+            print("workers: {:3d}  time: {:8.3f} s  throughput: {:8.1f} MB/s".format(
+                workers, elapsed, size/1e6/elapsed))
+
+        assert np.array_equal(results[1][0], results[args.workers][0])
+        assert results[1][2] == results[args.workers][2]
+
+
+if __name__ == '__main__':
+    main()
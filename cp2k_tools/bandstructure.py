@@ -0,0 +1,220 @@
+"""
+Streaming parser for the band structure files written by CP2K.
+
+The file is read line by line, keeping only the current k-point in memory:
+
+      SET:      1                 TOTAL POINTS:    100
+         POINT   1            0.000000    0.000000    0.000000
+         POINT   2            0.500000    0.000000    0.500000
+          Nr.     1    Spin 1 K-Point  0.00000000  0.00000000  0.00000000
+                  50
+         -9.89412651         -9.87711478         -9.84012346         -9.64098765
+         ...
+
+`iter_kpoints(...)` yields the k-points one by one, `iter_sets(...)` collects
+the k-points of each set into arrays. `bs2csv(...)` and `bs2npz(...)` write one file per set.
+"""
+
+import re
+
+import numpy as np
+
+
+SET_MATCH = re.compile(r'^\s*SET:\s*(?P<setnr>\d+)\s+TOTAL\ POINTS:\s*(?P<totalpoints>\d+)')
+
+SPECIAL_POINT_MATCH = re.compile(r'^\s*POINT\s+(?P<pointnr>\d+)\s+(?P<a>\S+)\s+(?P<b>\S+)\s+(?P<c>\S+)')
+
+KPOINT_MATCH = re.compile(r'''
+^\s*
+  Nr\.\s+(?P<nr>\d+)\s+
+  Spin\s+(?P<spin>\d+)\s+
+  K-Point\s+(?P<a>\S+)\s+(?P<b>\S+)\s+(?P<c>\S+)
+''', re.VERBOSE)
+
+
+def iter_kpoints(fhandle):
+    """Yields each k-point of a band structure file
+
+    Yields:
+        a tuple `(kpoint_set, spin, kpoint, energies)` with kpoint_set a dict with the
+        `setnr`, `totalpoints` and the `special_points` (a list of `(pointnr, array(3))`) of the set
+        the k-point belongs to (the same dict for all its k-points), the kpoint as an array
+        of shape (3, ) and the band energies as an array of shape (nbands, )
+
+    Raises:
+        ValueError: If the file contains a k-point outside of a set or the band energies are incomplete.
+    """
+
+    kpoint_set = None
+    kpoint = None  # the match of the current k-point
+    nbands = None
+    nlines = None
+    values = []
+
+    for line in fhandle:
+        if kpoint is not None:
+            # state: reading the number of bands and the band energies of a k-point
+            if nbands is None:
+                nbands = int(line)
+                if nbands:
+                    continue
+            else:
+                values.append(line)
+                if nlines is None:
+                    # the number of lines follows from the number of values on the first one,
+                    # the remaining lines are only checked for their number of values when converting
+                    perline = max(1, len(line.split()))
+                    nlines = (nbands + perline - 1) // perline
+                if len(values) < nlines:
+                    continue
+
+            try:
+                energies = np.array(' '.join(values).split(), dtype=float)
+            except ValueError as exc:
+                raise ValueError("invalid band energies for k-point {}: {}".format(kpoint.group('nr'), exc))
+
+            if len(energies) != nbands:
+                raise ValueError("expected {} band energies for k-point {}, found {}"
+                                 .format(nbands, kpoint.group('nr'), len(energies)))
+
+            yield (kpoint_set, int(kpoint.group('spin')),
+                   np.array([float(kpoint.group(c)) for c in 'abc']), energies)
+
+            kpoint = None
+            continue
+
+        # state: between k-points
+        match = KPOINT_MATCH.match(line)
+        if match:
+            if kpoint_set is None:
+                raise ValueError("k-point {} found outside of a set".format(match.group('nr')))
+            kpoint, nbands, nlines, values = match, None, None, []
+            continue
+
+        match = SET_MATCH.match(line)
+        if match:
+            kpoint_set = {
+                'setnr': int(match.group('setnr')),
+                'totalpoints': int(match.group('totalpoints')),
+                'special_points': [],
+                }
+            continue
+
+        match = SPECIAL_POINT_MATCH.match(line)
+        if match and kpoint_set is not None:
+            kpoint_set['special_points'].append(
+                (int(match.group('pointnr')), np.array([float(match.group(c)) for c in 'abc'])))
+
+    if kpoint is not None:
+        raise ValueError("incomplete band energies for k-point {}".format(kpoint.group('nr')))
+
+
+def _collect(kpoint_set, spins, kpoints, energies):
+    result = dict(kpoint_set)
+    result['spins'] = np.array(spins, dtype=int)
+    result['kpoints'] = np.array(kpoints).reshape(-1, 3)
+
+    if energies and any(len(e) != len(energies[0]) for e in energies):
+        raise TypeError("the number of bands differs between the k-points of set {}".format(kpoint_set['setnr']))
+
+    result['energies'] = np.array(energies).reshape(len(energies), -1)
+    return result
+
+
+def iter_sets(fhandle):
+    """Yields each set of k-points of a band structure file
+
+    Yields:
+        a dict with the `setnr`, `totalpoints` and `special_points` of the set (see `iter_kpoints(...)`)
+        and the arrays `spins` of shape (nkpoints, ), `kpoints` of shape (nkpoints, 3)
+        and `energies` of shape (nkpoints, nbands)
+
+    Raises:
+        TypeError: If the number of bands is not the same for all k-points of a set.
+    """
+
+    current = None
+    spins, kpoints, energies = [], [], []
+
+    for kpoint_set, spin, kpoint, kenergies in iter_kpoints(fhandle):
+        if kpoint_set is not current:
+            if current is not None:
+                yield _collect(current, spins, kpoints, energies)
+            current = kpoint_set
+            spins, kpoints, energies = [], [], []
+
+        spins.append(spin)
+        kpoints.append(kpoint)
+        energies.append(kenergies)
+
+    if current is not None:
+        yield _collect(current, spins, kpoints, energies)
+
+
+def bs2csv(fhandle, csvpattern="bs.set-{setnr}.csv", fmt='%.8f'):
+    """Write the k-points and band energies of each set to a CSV (space separated) file
+
+    Each line contains the three coordinates of a k-point followed by its band energies,
+    formatted with fmt. The files are written while reading the input, k-point by k-point.
+
+    Args:
+        fhandle: the text file handle to read the band structure from
+        csvpattern: pattern for the filename of each set, `{setnr}` is replaced by the number of the set
+        fmt: the %-format for the values
+
+    Yields:
+        a tuple `(filename, kpoint_set)` for each set written, see `iter_kpoints(...)` for the kpoint_set
+    """
+
+    current = None
+    csvout = None
+    line_fmt = None
+
+    try:
+        for kpoint_set, _, kpoint, energies in iter_kpoints(fhandle):
+            if kpoint_set is not current:
+                if csvout is not None:
+                    csvout.close()
+                    yield csvout.name, current
+
+                current = kpoint_set
+                csvout = open(csvpattern.format(setnr=kpoint_set['setnr']), 'w')
+                line_fmt = None
+
+            if line_fmt is None or len(energies) != nbands:
+                nbands = len(energies)
+                line_fmt = ' '.join([fmt]*(3 + nbands)) + '\n'
+
+            csvout.write(line_fmt % (tuple(kpoint.tolist()) + tuple(energies.tolist())))
+
+        if csvout is not None:
+            csvout.close()
+            yield csvout.name, current
+    finally:
+        if csvout is not None:
+            csvout.close()
+
+
+def bs2npz(fhandle, npzpattern="bs.set-{setnr}.npz"):
+    """Write the arrays returned by `iter_sets(...)` for each set to a compressed NumPy archive
+
+    The `special_points` are stored as the arrays `special_points_nr` and `special_points`.
+
+    Yields:
+        a tuple `(filename, kpoint_set)` for each set written, see `iter_sets(...)` for the kpoint_set
+    """
+
+    for kpoint_set in iter_sets(fhandle):
+        filename = npzpattern.format(setnr=kpoint_set['setnr'])
+
+        with open(filename, 'wb') as npzout:
+            np.savez_compressed(npzout,
+                                setnr=kpoint_set['setnr'],
+                                totalpoints=kpoint_set['totalpoints'],
+                                special_points_nr=np.array([nr for nr, _ in kpoint_set['special_points']], dtype=int),
+                                special_points=np.array([p for _, p in kpoint_set['special_points']]).reshape(-1, 3),
+                                spins=kpoint_set['spins'],
+                                kpoints=kpoint_set['kpoints'],
+                                energies=kpoint_set['energies'])
+
+        yield filename, kpoint_set
@@ -27,7 +27,7 @@ Options:
     g = XYZGenerator()
     with smart_open(arguments['XYZINPUT'], 'r') as source:
         with smart_open(arguments['XYZOUTPUT'], 'w') as dest:
-            g.write([p.parse(source)[-1]], dest)
+            g.write([p.last_frame(source)], dest)
 
 
 def generate_inputs():
@@ -104,55 +104,161 @@ Options:
 
 
 def cp2kparse():
-    """Usage: cp2kparse.py [-hj] [-f FILE]
+    """Usage:
+    cp2kparse.py [-hjc] [-f FILE]
+    cp2kparse.py [-hc] (-g PATTERN | -l LISTFILE)... [-n WORKERS] [--unordered]
 
 Parse cp2k output.
 
 Options:
     -h --help
-    -f --file=FILE    cp2k output file to read [default: -]
-    -j --json         produce JSON output instead of pretty printed python objects
+    -f --file=FILE            cp2k output file to read [default: -]
+    -j --json                 produce JSON output instead of pretty printed python objects
+    -g --glob=PATTERN         parse all files matching PATTERN, the results are
+                              printed as JSON Lines tagged with the filename
+    -l --list=LISTFILE        parse all files listed in LISTFILE, one per line
+    -n --workers=WORKERS      number of parallel workers, defaults to the number of CPUs
+    --unordered               print the results as they finish instead of in input order
+    -c --cache                cache the parse results for unchanged files in
+                              $CP2K_TOOLS_CACHE_DIR (or ~/.cache/cp2k-tools if not set)
 
 """
 
     arguments = docopt(cp2kparse.__doc__)
 
+    if arguments['--glob'] or arguments['--list']:
+        from cp2k_tools.parser.batch import batch_blockparse
+        _print_batch(batch_blockparse, arguments)
+        return
+
+    cache = _cache(arguments)
+    if cache is not None:
+        from cp2k_tools.parser.cache import blockparse_output
+        _print_result(blockparse_output(arguments['--file'], cache), arguments['--json'])
+        return
+
     p = CP2KOutputBlockParser()
     with smart_open(arguments['--file'], 'r') as fh:
-        out = p.parse(fh.read())
-        if arguments['--json']:
-            import json
-            print(json.dumps(out))
-        else:
-            import pprint
-            pp = pprint.PrettyPrinter(indent=2)
-            pp.pprint(out)
+        _print_result(p.parse_file(fh), arguments['--json'])
+
+
+def _cache(arguments):
+    """Returns the parse cache if requested and usable (not for stdin)"""
+
+    if not arguments['--cache'] or (arguments['--file'] == '-' and not (arguments['--glob'] or arguments['--list'])):
+        return None
+
+    from cp2k_tools.parser.cache import ParseCache
+    return ParseCache()
+
+
+def _print_batch(func, arguments, *args):
+    from cp2k_tools.parser.batch import expand_paths
+
+    filenames = expand_paths(arguments['--glob'], arguments['--list'])
+    workers = int(arguments['--workers']) if arguments['--workers'] else None
+
+    for line in func(*(args + (filenames, workers, not arguments['--unordered'], _cache(arguments)))):
+        print(line)
+
+
+def _print_result(data, as_json):
+    if as_json:
+        import json
+        print(json.dumps(json_finite(data), default=json_default, allow_nan=False))
+    else:
+        import pprint
+        pp = pprint.PrettyPrinter(indent=2)
+        pp.pprint(data)
 
 
 def oq():
-    """Usage: oq.py [-hj] [-f FILE] QUERY
+    """Usage:
+    oq.py [-hjc] [-f FILE] QUERY...
+    oq.py [-hj] [-f FILE] [-s STATEFILE] [--follow] QUERY...
+    oq.py [-hc] (-g PATTERN | -l LISTFILE)... [-n WORKERS] [--unordered] QUERY...
 
 Extract data from cp2k output. The syntax is similar to that of the jq tool.
+When multiple queries are given, their results are printed in the given order
+and only the parts of the output required to answer them are parsed.
+
+In batch mode (-g/-l) the files are parsed in parallel and one JSON object per
+file is printed, with the list of query results or the error for that file:
+    {"file": "...", "result": [...]}
+    {"file": "...", "error": "..."}
 
 Options:
     -h --help
-    -f --file=FILE    cp2k output file to read [default: -]
-    -j --json         produce JSON output instead of pretty printed python objects
+    -f --file=FILE            cp2k output file to read [default: -]
+    -j --json                 produce JSON output instead of pretty printed python objects
+    -s --state=STATEFILE      keep the parser state in STATEFILE to only parse
+                              the newly appended output on subsequent calls
+    --follow                  keep polling the output file and print the result
+                              whenever new output got parsed, until the run ended
+    -g --glob=PATTERN         query all files matching PATTERN
+    -l --list=LISTFILE        query all files listed in LISTFILE, one per line
+    -n --workers=WORKERS      number of parallel workers, defaults to the number of CPUs
+    --unordered               print the results as they finish instead of in input order
+    -c --cache                cache the parse results for unchanged files in
+                              $CP2K_TOOLS_CACHE_DIR (or ~/.cache/cp2k-tools if not set)
 
 """
 
     arguments = docopt(oq.__doc__)
 
-    p = CP2KOutputParser()
-    with smart_open(arguments['--file'], 'r') as fh:
-        p.parse(fh)
-        if arguments['--json']:
-            import json
-            print(json.dumps(p.query(arguments['QUERY'])))
+    if arguments['--glob'] or arguments['--list']:
+        from cp2k_tools.parser.batch import batch_query
+        _print_batch(batch_query, arguments, arguments['QUERY'])
+        return
+
+    def print_results():
+        for query in arguments['QUERY']:
+            _print_result(p.query(query), arguments['--json'])
+
+    if not (arguments['--state'] or arguments['--follow']):
+        cache = _cache(arguments)
+        if cache is not None:
+            from cp2k_tools.parser.cache import parse_output
+            p = parse_output(arguments['--file'], cache=cache)
         else:
-            import pprint
-            pp = pprint.PrettyPrinter(indent=2)
-            pp.pprint(p.query(arguments['QUERY']))
+            p = CP2KOutputParser()
+            with smart_open(arguments['--file'], 'r') as fh:
+                p.parse(fh, queries=arguments['QUERY'])
+        print_results()
+        return
+
+    if arguments['--file'] == '-':
+        sys.exit("incremental parsing requires an output file, not stdin")
+
+    import os
+
+    p = None
+    statefile = arguments['--state']
+
+    if statefile and os.path.exists(statefile):
+        with open(statefile, 'rb') as fh:
+            try:
+                p = CP2KOutputParser.load_state(fh)
+            except Exception:  # ignore unusable states and start over
+                p = None
+
+    if p is None:
+        p = CP2KOutputParser()
+
+    def save_state():
+        if statefile:
+            with open(statefile, 'wb') as fh:
+                p.save_state(fh)
+
+    if arguments['--follow']:
+        for _ in p.follow(arguments['--file']):
+            save_state()
+            print_results()
+            sys.stdout.flush()
+    else:
+        p.parse_incremental(arguments['--file'])
+        save_state()
+        print_results()
 
 
 if __name__ == '__main__':
@@ -1,4 +1,6 @@
 from io import BufferedIOBase
+from collections import OrderedDict
+from itertools import chain
 
 from .xyz import XYZGenerator
 
@@ -8,46 +10,132 @@ try:  # Python 2
 except NameError:
     LAST_UNICODE_CHARACTER = chr(0x10ffff)
 
+# list-of-lists sections with at least this many lines are formatted as a whole
+BULK_MIN_ROWS = 100
+# the number of lines formatted at once in such a section
+_BULK_CHUNK_ROWS = 4096
 
-def dict2line_iter(nested, ilevel=0):
+
+def _rows2lines(prefix, rows):
+    """
+    Format the rows of a list-of-lists section, yields blocks of one or more lines (joined by newlines)
+
+    Gives the same as `prefix + ' '.join(str(v) for v in row)` for each row, but large sections
+    with rows of the same length are formatted in chunks with a single format string.
+    """
+
+    lengths = set(len(row) for row in rows)
+
+    if len(rows) < BULK_MIN_ROWS or len(lengths) != 1:
+        for row in rows:
+            yield prefix + ' '.join(str(v) for v in row)
+        return
+
+    line_fmt = prefix.replace('%', '%%') + ' '.join(['%s']*lengths.pop())
+
+    for start in range(0, len(rows), _BULK_CHUNK_ROWS):
+        chunk = rows[start:start + _BULK_CHUNK_ROWS]
+        yield '\n'.join([line_fmt]*len(chunk)) % tuple(chain.from_iterable(chunk))
+
+
+def _is_coordinate_block(val):
+    # the CoordinateBlock of the input parser, without importing it
+    return hasattr(val, 'symbols') and hasattr(val, 'values') and hasattr(val, 'tolist')
+
+
+def _block2lines(prefix, block):
+    """Like _rows2lines(...) for a CoordinateBlock, formats its arrays without creating the rows"""
+
+    prefix = prefix.replace('%', '%%')
+    values_fmt = ' '.join(['%s']*block.values.shape[1])
+
+    for start in range(0, len(block.values), _BULK_CHUNK_ROWS):
+        values = block.values[start:start + _BULK_CHUNK_ROWS]
+
+        if block.symbols is None:
+            chunk_fmt = '\n'.join([prefix + values_fmt]*len(values))
+        else:
+            # the symbols are embedded in the format, as in XYZGenerator.write_arrays
+            chunk_fmt = '\n'.join(prefix + symbol.replace('%', '%%') + ' ' + values_fmt
+                                  for symbol in block.symbols[start:start + _BULK_CHUNK_ROWS])
+
+        yield chunk_fmt % tuple(values.ravel().tolist())
+
+
+def dict2line_iter(nested, ilevel=0, bulk=False, cache=None):
     """
     Iterator to convert a nested python dict to a CP2K input file.
+
+    With bulk=True the lines of large list-of-lists sections (like the `*` of a COORD section)
+    are yielded as blocks of several lines joined by newlines instead of one by one.
+
+    The lines of the sections are taken from the cache if one (a `SectionCache`) is given.
+    The nested dict is not modified.
     """
 
+    return _line_iter(nested.items(), ilevel, bulk, cache)
+
+
+def _keyfunc(keyval):
+    """Custom sorting function to get stable CP2K output"""
+    key, val = keyval
+
+    # ensure subsection generating entrys are sorted after keywords
+    if isinstance(val, (dict, list)) or _is_coordinate_block(val):
+        # .. by prefixing them with the last possible character before sorting
+        return LAST_UNICODE_CHARACTER + key.lower()
+
+    return key.lower()
+
+
+def _section_line_iter(key, section, ilevel, bulk, cache):
+    """Iterator over the lines of a single section, from its `&KEY` to its `&END KEY` line"""
+
     indent = ' '*ilevel
 
-    def _keyfunc(keyval):
-        """Custom sorting function to get stable CP2K output"""
-        key, val = keyval
+    # the parameter of the section is stored with the special key '_', which is read but never removed
+    if '_' in section:
+        yield "{}&{} {}".format(indent, key.upper(), section['_'])
+    else:
+        yield "{}&{}".format(indent, key.upper())
+
+    for line in _line_iter([(k, v) for k, v in section.items() if k != '_'], ilevel + 3, bulk, cache):
+        yield line
 
-        # ensure subsection generating entrys are sorted after keywords
-        if isinstance(val, (dict, list)):
-            # .. by prefixing them with the last possible character before sorting
-            return LAST_UNICODE_CHARACTER + key.lower()
+    yield "{}&END {}".format(indent, key.upper())
 
-        return key.lower()
 
-    for key, val in sorted(nested.items(), key=_keyfunc):
+def _line_iter(items, ilevel, bulk, cache):
+    indent = ' '*ilevel
+
+    # NumPy arrays and the CoordinateBlock of the input parser are written as (nested) lists,
+    # except for the latter in bulk mode
+    items = [(key, val.tolist() if hasattr(val, 'tolist') and not (bulk and _is_coordinate_block(val)) else val)
+             for key, val in items]
+
+    for key, val in sorted(items, key=_keyfunc):
         if isinstance(val, dict):
-            if '_' in val:
-                yield "{}&{} {}".format(indent, key.upper(), val.pop('_'))
+            if cache is not None:
+                lines = cache.lines(key, val, ilevel, bulk)
             else:
-                yield "{}&{}".format(indent, key.upper())
+                lines = _section_line_iter(key, val, ilevel, bulk, cache)
 
-            for line in dict2line_iter(val, ilevel + 3):
+            for line in lines:
                 yield line
 
-            yield "{}&END {}".format(indent, key.upper())
+        elif _is_coordinate_block(val):
+            # if the start special key was used, drop the key completely (as for the list of lists below)
+            for block in _block2lines(indent + ('' if key == '*' else key.upper() + ' '), val):
+                yield block
 
         elif isinstance(val, list):
             # here we have multiple sections (possibly with parameters)
             # and we are going to unfold them again (list of dicts case)
             if isinstance(val[0], dict):
-                for listitem in val:
-                    for line in dict2line_iter({key: listitem}, ilevel):
-                        yield line
-            # in the case of list of lists, unpack them as key/value lines
-            elif isinstance(val[0], list):
+                for line in _line_iter([(key, listitem) for listitem in val], ilevel, bulk, cache):
+                    yield line
+            # in the case of list of lists (or tuples, as for parsed COORD sections), unpack them as key/value lines
+            elif isinstance(val[0], (list, tuple)):
                 thiskey = key.upper()
 
                 # if the start special key was used, drop the key completely
@@ -56,8 +144,12 @@ def dict2line_iter(nested, ilevel=0):
                 else:
                     thiskey += ' '
 
-                for listitem in val:
-                    yield "{}{}{}".format(indent, thiskey, ' '.join(str(v) for v in listitem))
+                if bulk:
+                    for block in _rows2lines(indent + thiskey, val):
+                        yield block
+                else:
+                    for listitem in val:
+                        yield "{}{}{}".format(indent, thiskey, ' '.join(str(v) for v in listitem))
             else:
                 yield "{}{} {}".format(indent, key.upper(), ' '.join(str(v) for v in val))
 
@@ -74,7 +166,113 @@ def dict2line_iter(nested, ilevel=0):
             yield "{}{} {}".format(indent, key.upper(), val)
 
 
-def dict2cp2k(data, output=None, parameters={}):  # pylint: disable=locally-disabled, dangerous-default-value
+class SectionCache(object):
+    """
+    In-memory cache for the lines of the sections generated by dict2line_iter/dict2cp2k
+
+    Entries are keyed by the identity of the section dicts, only their changed (= new) sections
+    are generated again when writing several inputs sharing most of their structure.
+    The number of entries is bounded, the least recently used entries are removed first.
+
+    Since the content of a section is not compared, a cached section dict must not be modified,
+    build a changed input with copies of the dicts along the path of the change instead:
+
+        cache = SectionCache()
+        for cutoff in (300, 400, 500):
+            dft = dict(base['force_eval']['dft'], mgrid={'cutoff': cutoff})
+            data = dict(base, force_eval=dict(base['force_eval'], dft=dft))
+            dict2cp2k(data, 'cutoff-{}.inp'.format(cutoff), cache=cache)
+    """
+
+    DEFAULT_MAX_ENTRIES = 4096
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        :param max_entries: maximum number of sections to keep the lines of
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def lines(self, key, section, ilevel, bulk):
+        """Returns the lines of the section, generates and stores them on a miss"""
+
+        identity = (id(section), key, ilevel, bulk)
+
+        # the section is stored with its lines to keep its id from being reused
+        entry = self._entries.pop(identity, None)
+        if entry is None:
+            entry = (section, list(_section_line_iter(key, section, ilevel, bulk, self)))
+
+        self._entries[identity] = entry  # (re-)inserted as the most recently used
+        self.evict()
+
+        return entry[1]
+
+    def evict(self):
+        """Remove the least recently used entries until at most max_entries are left"""
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries"""
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _format_line(line, parameters):
+    # only lines with placeholders (or escaped braces) need the .format(), none at all without parameters
+    if parameters is not None and ('{' in line or '}' in line):
+        return line.format(**parameters)
+    return line
+
+
+def _iter_chunks(data, parameters, chunk_size, cache=None):
+    """Yields the CP2K input for the nested dict in chunks of about chunk_size characters"""
+
+    chunk = []
+    chunk_len = 0
+    separator = ''  # the lines are separated by newlines, without one at the end
+
+    for block in dict2line_iter(data, bulk=True, cache=cache):
+        chunk.append(separator)
+        chunk.append(_format_line(block, parameters))
+        chunk_len += len(chunk[-1]) + 1
+        separator = '\n'
+
+        if chunk_len >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            chunk_len = 0
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+def write_cp2k(data, fhandle, parameters={}, chunk_size=4*1024*1024, cache=None):  # pylint: disable=locally-disabled, dangerous-default-value
+    """
+    Write a nested python dict as CP2K input file to a file handle
+
+    The lines are written in chunks of about chunk_size characters while being generated,
+    the parameters are substituted (using .format()) only in the lines containing placeholders.
+    With parameters=None the lines are written verbatim, without any substitution.
+
+    Args:
+        data: the nested dict
+        fhandle: text file handle to write to, or a binary one to write UTF-8 to
+        parameters: the values for the placeholders, None to skip the substitution
+        chunk_size: the number of characters to collect before writing them
+        cache: an optional SectionCache to take the lines of unchanged sections from
+    """
+
+    binary = isinstance(fhandle, BufferedIOBase)
+
+    for chunk in _iter_chunks(data, parameters, chunk_size, cache):
+        fhandle.write(chunk.encode('utf-8') if binary else chunk)
+
+
+def dict2cp2k(data, output=None, parameters={}, cache=None):  # pylint: disable=locally-disabled, dangerous-default-value
     """
     Convert and write a nested python dict to a CP2K input file.
 
@@ -84,24 +282,19 @@ def dict2cp2k(data, output=None, parameters={}):  # pylint: disable=locally-disa
     Writes to a file if a handle or filename is given
     or returns the generated file as a string if not.
 
-    The parameters are passed to a .format() call on the final input string.
+    The parameters are passed to a .format() call on each line containing placeholders,
+    see `write_cp2k(...)`, except when writing to a text file handle: there the lines are
+    written verbatim. With a SectionCache, only the sections not found in it are generated.
+    The data is not modified.
     """
 
     if output:
         if isinstance(output, str):
             with open(output, 'w') as fhandle:
-                fhandle.write("\n"
-                              .join(dict2line_iter(data))
-                              .format(**parameters))
+                write_cp2k(data, fhandle, parameters, cache=cache)
         elif isinstance(output, BufferedIOBase):
-            # bytes-like object, need to encode
-            output.write("\n"
-                         .join(dict2line_iter(data))
-                         .format(**parameters)
-                         .encode('utf-8'))
+            write_cp2k(data, output, parameters, cache=cache)
         else:
-            output.write("\n".join(dict2line_iter(data)))
+            write_cp2k(data, output, None, cache=cache)
     else:
-        return ("\n"
-                .join(dict2line_iter(data))
-                .format(**parameters))
+        return ''.join(_iter_chunks(data, parameters, 4*1024*1024, cache))
@@ -1,8 +1,76 @@
+from io import TextIOBase
+
 
 class XYZGenerator:
+    # the line format used by CP2K for the atoms in XYZ trajectories
+    ATOM_FORMAT = ' %2s %20.10f%20.10f%20.10f\n'
+
     def write(self, data, fh):
         for frame in data:
-            fh.write('%8i\n' % len(frame['data']))
+            fh.write('%8i\n' % len(frame['atoms']))
             fh.write(' %s\n' % frame['comment'])
-            for atom in frame['data']:
-                fh.write(' %2s %20.10f%20.10f%20.10f\n' % atom)
+            for atom in frame['atoms']:
+                fh.write(self.ATOM_FORMAT % ((atom[0], ) + tuple(atom[1])))
+
+    def write_arrays(self, coords, symbols, fh, comments=None, chunk_size=4*1024*1024):
+        """Write a trajectory given as arrays, in the same format as write(...)
+
+        The frames are formatted as a whole (with the symbols embedded in a per-frame
+        format string) and written in chunks of about chunk_size characters,
+        instead of formatting and writing each atom line separately.
+
+        Args:
+            coords: array-like of shape `(nframes, natoms, 3)`, as returned by `XYZParser.parse_arrays`
+            symbols: the `natoms` atom symbols, the same for all frames
+            fh: text file handle to write to, or a binary one to write UTF-8 to
+            comments: optional list of `nframes` comments, empty by default
+        """
+
+        import numpy as np
+
+        coords = np.asarray(coords, dtype=float)
+
+        if coords.ndim != 3 or coords.shape[2] != 3:
+            raise TypeError("coords must be of shape (nframes, natoms, 3), got {}".format(coords.shape))
+
+        nframes, natoms, _ = coords.shape
+
+        if len(symbols) != natoms:
+            raise TypeError("number of symbols ({}) does not match the number of atoms ({})"
+                            .format(len(symbols), natoms))
+
+        if comments is None:
+            comments = [''] * nframes
+        elif len(comments) != nframes:
+            raise TypeError("number of comments ({}) does not match the number of frames ({})"
+                            .format(len(comments), nframes))
+
+        binary = not isinstance(fh, TextIOBase)
+
+        # the symbols are fixed, only the coordinates get formatted for each frame
+        atoms_fmt = ''.join(self.ATOM_FORMAT.replace('%2s', '%2s' % s.replace('%', '%%')) for s in symbols)
+        natoms_line = '%8i\n' % natoms
+
+        chunk = []
+        chunk_len = 0
+
+        for frame, comment in zip(coords, comments):
+            chunk.append(natoms_line)
+            chunk.append(' %s\n' % comment)
+            chunk.append(atoms_fmt % tuple(frame.ravel().tolist()))
+            chunk_len += len(chunk[-1])
+
+            if chunk_len >= chunk_size:
+                self._write_chunk(fh, chunk, binary)
+                chunk = []
+                chunk_len = 0
+
+        if chunk:
+            self._write_chunk(fh, chunk, binary)
+
+    @staticmethod
+    def _write_chunk(fh, chunk, binary):
+        if binary:
+            fh.write(''.join(chunk).encode('utf-8'))
+        else:
+            fh.write(''.join(chunk))
@@ -1,3 +1,4 @@
 from .input import CP2KInputParser
 from .output import CP2KOutputParser, CP2KOutputBlockParser
 from .xyz import XYZParser
+from .xyz_store import XYZStore
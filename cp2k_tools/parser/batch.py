@@ -0,0 +1,98 @@
+"""
+Run the output parsers over many cp2k output files in parallel.
+
+Each file is parsed by its own parser instance in a worker process,
+the results are returned as JSON Lines tagged with the filename:
+
+    {"file": "run1/out.log", "result": ...}
+    {"file": "run2/out.log", "error": "IOError: ..."}
+"""
+
+import glob
+import json
+import functools
+import multiprocessing
+
+from ..tools import json_default, json_finite
+from .cache import parse_output, blockparse_output
+
+
+def expand_paths(patterns=(), listfiles=()):
+    """Expand the given glob patterns and the filenames listed in listfiles.
+
+    Patterns not matching anything are passed on unchanged to get an error for them.
+    Files in the list files are given one per line, empty lines and lines
+    starting with a '#' are ignored. Duplicates are removed, the order is kept.
+    """
+
+    paths = []
+
+    for pattern in patterns:
+        paths += sorted(glob.glob(pattern)) or [pattern]
+
+    for listfile in listfiles:
+        with open(listfile, 'r') as fhandle:
+            paths += [l.strip() for l in fhandle if l.strip() and not l.startswith('#')]
+
+    seen = set()
+    return [p for p in paths if not (p in seen or seen.add(p))]
+
+
+def _record(filename, func):
+    try:
+        record = {'file': filename, 'result': func(filename)}
+    except Exception as exc:
+        record = {'file': filename, 'error': "%s: %s" % (type(exc).__name__, exc)}
+
+    # serialize in the worker to avoid sending the (numpy) data back via pickle
+    return json.dumps(json_finite(record), default=json_default, allow_nan=False)
+
+
+def _query(queries, cache, filename):
+    parser = parse_output(filename, queries, cache)
+    return [parser.query(q) for q in queries]
+
+
+def _blockparse(cache, filename):
+    return blockparse_output(filename, cache)
+
+
+def batch_map(func, filenames, workers=None, ordered=True):
+    """Returns an iterator over the JSON Lines records of func applied to each file.
+
+    :param workers: number of worker processes, all CPUs if None, no pool if 1
+    :param ordered: yield the records in the order of filenames instead of as they finish
+    """
+
+    worker = functools.partial(_record, func=func)
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    if workers == 1 or len(filenames) < 2:
+        for filename in filenames:
+            yield worker(filename)
+        return
+
+    # many small files: hand out the files in chunks to keep the IPC overhead low
+    chunksize = max(1, min(64, len(filenames) // (4*workers)))
+
+    pool = multiprocessing.Pool(min(workers, len(filenames)))
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for line in imap(worker, filenames, chunksize):
+            yield line
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def batch_query(queries, filenames, workers=None, ordered=True, cache=None):
+    """Run the given oq queries on each file, the result is the list of the query results"""
+    return batch_map(functools.partial(_query, list(queries), cache), filenames, workers, ordered)
+
+
+def batch_blockparse(filenames, workers=None, ordered=True, cache=None):
+    """Run the CP2KOutputBlockParser on each file"""
+    return batch_map(functools.partial(_blockparse, cache), filenames, workers, ordered)
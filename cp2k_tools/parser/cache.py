@@ -0,0 +1,209 @@
+"""
+On-disk cache for the results of the output parsers.
+
+Entries are keyed by the identity of the parsed file (device, inode, size and mtime)
+or optionally by its content hash, and by the version of the parser producing them.
+The total size of the cache is bounded, the least recently used entries are removed first.
+"""
+
+import os
+import errno
+import pickle
+import hashlib
+import tempfile
+
+from .output import CP2KOutputParser, CP2KOutputBlockParser
+
+
+class ParseCache(object):
+    VERSION = 1
+    SUFFIX = '.pickle'
+    DEFAULT_MAX_SIZE = 512*1024*1024
+    # once max_size is exceeded, entries are removed until this fraction of it is left,
+    # to not have to scan the directory again for every new entry of a full cache
+    EVICT_RATIO = 0.9
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE, content_hash=False):
+        """
+        :param directory: where to keep the cache entries, defaults to $CP2K_TOOLS_CACHE_DIR
+                          or ~/.cache/cp2k-tools
+        :param max_size: maximum total size of the cache entries in bytes
+        :param content_hash: identify files by the SHA1 of their content instead of inode and mtime,
+                             slower but survives copying or touching the files
+        """
+        if directory is None:
+            directory = os.environ.get('CP2K_TOOLS_CACHE_DIR',
+                                       os.path.join(os.path.expanduser('~'), '.cache', 'cp2k-tools'))
+
+        self.directory = directory
+        self.max_size = max_size
+        self.content_hash = content_hash
+        self._size = None  # the (estimated) total size of the entries, unknown until the first scan
+
+    def _identity(self, filename, namespace):
+        stat = os.stat(filename)
+
+        if self.content_hash:
+            sha1 = hashlib.sha1()
+            with open(filename, 'rb') as fhandle:
+                for chunk in iter(lambda: fhandle.read(1024*1024), b''):
+                    sha1.update(chunk)
+            ident = (stat.st_size, sha1.hexdigest())
+        else:
+            mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+            ident = (os.path.abspath(filename), stat.st_dev, stat.st_ino, stat.st_size, mtime)
+
+        return (self.VERSION, namespace) + ident
+
+    def _path(self, identity):
+        digest = hashlib.sha1(repr(identity).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + self.SUFFIX)
+
+    def get(self, filename, namespace, identity=None):
+        """Returns the cached value for filename in the given namespace or None"""
+
+        if identity is None:
+            identity = self._identity(filename, namespace)
+
+        path = self._path(identity)
+
+        try:
+            with open(path, 'rb') as fhandle:
+                stored_identity, value = pickle.load(fhandle)
+        except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+
+        if stored_identity != identity:
+            return None
+
+        try:
+            os.utime(path, None)  # mark as recently used
+        except OSError:
+            pass
+
+        return value
+
+    def put(self, filename, namespace, value, identity=None):
+        """Store the value for the filename, errors writing the cache are ignored"""
+
+        if identity is None:
+            identity = self._identity(filename, namespace)
+
+        try:
+            os.makedirs(self.directory)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                return
+
+        try:
+            fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        except (IOError, OSError):
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as fhandle:
+                pickle.dump((identity, value), fhandle, protocol=pickle.HIGHEST_PROTOCOL)
+                size = fhandle.tell()
+            os.rename(tmppath, self._path(identity))
+        except (IOError, OSError, pickle.PicklingError, TypeError, AttributeError):
+            # the value can not be pickled (TypeError/AttributeError for unpicklable objects) or written
+            try:
+                os.remove(tmppath)
+            except OSError:
+                pass
+            return
+
+        # the directory is only scanned again once the total size (as far as known here) exceeds the limit,
+        # entries replaced or removed meanwhile (also by other processes) are corrected by the scan
+        if self._size is not None:
+            self._size += size
+
+        if self._size is None or self._size > self.max_size:
+            self.evict(int(self.EVICT_RATIO*self.max_size))
+
+    def cached(self, filename, namespace, func):
+        """Returns the cached value for filename, calls func(filename) and caches its result on a miss"""
+
+        # take the identity before parsing, a file modified meanwhile gets re-parsed the next time
+        identity = self._identity(filename, namespace)
+
+        value = self.get(filename, namespace, identity)
+        if value is None:
+            value = func(filename)
+            self.put(filename, namespace, value, identity)
+
+        return value
+
+    def evict(self, max_size=None):
+        """Remove the least recently used entries until the cache fits into max_size (default: self.max_size)"""
+
+        if max_size is None:
+            max_size = self.max_size
+
+        entries = []
+        try:
+            for name in os.listdir(self.directory):
+                if name.endswith(self.SUFFIX):
+                    path = os.path.join(self.directory, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        except OSError:
+            self._size = None
+            return
+
+        total = sum(e[1] for e in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+        self._size = total
+
+    def clear(self):
+        """Remove all entries"""
+        self.max_size, max_size = 0, self.max_size
+        self.evict()
+        self.max_size = max_size
+
+
+def _parse(filename):
+    parser = CP2KOutputParser()
+    with open(filename, 'r') as fhandle:
+        parser.parse(fhandle)
+    return parser
+
+
+def _blockparse(filename):
+    with open(filename, 'rb') as fhandle:
+        return CP2KOutputBlockParser().parse_file(fhandle)
+
+
+def parse_output(filename, queries=None, cache=None):
+    """
+    Parse the given output file with a CP2KOutputParser and return the parser.
+    With a cache, the complete output is parsed (and the queries are ignored)
+    to be able to answer any query from the cache later on.
+    """
+
+    if cache is not None:
+        return cache.cached(filename, 'CP2KOutputParser-%i' % CP2KOutputParser.STATE_VERSION, _parse)
+
+    parser = CP2KOutputParser()
+    with open(filename, 'r') as fhandle:
+        parser.parse(fhandle, queries=queries)
+    return parser
+
+
+def blockparse_output(filename, cache=None):
+    """Parse the given output file with the CP2KOutputBlockParser, returns the parsed data"""
+
+    if cache is not None:
+        return cache.cached(filename, 'CP2KOutputBlockParser-%i' % CP2KOutputBlockParser.VERSION,
+                            _blockparse)
+
+    return _blockparse(filename)
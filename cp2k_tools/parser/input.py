@@ -17,18 +17,22 @@
 
 from collections import OrderedDict
 
+try:
+    from collections.abc import Sequence
+except ImportError:  # Python 2
+    from collections import Sequence
+
+import numpy as np
+import regex
 from parsimonious.grammar import Grammar
 from parsimonious.nodes import NodeVisitor
+from parsimonious.exceptions import IncompleteParseError
 
 
-CP2K_INP_GRAMMAR = Grammar(r"""
-content  = ( cline / section )*
-
-section = section_start section_content section_end
-
+# the rules shared by CP2K_INP_GRAMMAR and CP2K_INP_BULK_GRAMMAR
+_CP2K_INP_RULES = r"""
 section_start = s* "&" sname (s+ value)? comment? nl
 section_end = s* "&" end (s+ value)? comment? nl?
-section_content = (kv / cline / section )*
 
 kv = s* name s* unitspec? values? s* comment? nl
 
@@ -46,13 +50,212 @@ nl = "\r\n" / "\r" / "\n"
 
 comment  = ~r"[#!].*"
 cline = s* comment? nl
-""")
+"""
+
+CP2K_INP_GRAMMAR = Grammar(r"""
+content  = ( cline / section )*
+
+section = section_start section_content section_end
+section_content = (kv / cline / section )*
+""" + _CP2K_INP_RULES)
+
+
+def _value(text):
+    try:
+        return int(text)
+    except:
+        pass
+
+    try:
+        return float(text)
+    except:
+        pass
+
+    return text
+
+
+def _kv_value(unit, values):
+    value = []
+
+    if unit:
+        value.append("[%s]" % unit)
+
+    value += values if values else [None]  # handle lone keywords
+
+    if len(value) == 1:
+        return value[0]
+
+    return tuple(value)
+
+
+# Sections whose lines are the values of their DEFAULT_KEYWORD, stored under the key '*'.
+# For COORD the name of the line is the atomic symbol. The lines of VELOCITY contain only numbers,
+# which the kv rule splits into a name and values. Only with bulk=True they are converted from their text
+# instead, by default they are keywords named by their first number (as for any other section).
+SYMBOL_SECTIONS = ('coord', )
+VALUES_SECTIONS = ('velocity', )
+
+# minimal number of lines of a DEFAULT_KEYWORD with 3 float values (and a symbol) to store them as a CoordinateBlock
+BULK_MIN_LINES = 100
+
+
+class CoordinateBlock(Sequence):
+    """
+    The lines of a COORD (or VELOCITY) section stored as arrays: the list of symbols and
+    a (nlines, 3) float array. Behaves like the list of tuples `(symbol, x, y, z)` (or `(x, y, z)`)
+    the lines of smaller sections are returned as, without creating them in advance.
+    """
+
+    def __init__(self, symbols, values):
+        self.symbols = symbols  # None for sections without symbols
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def _line(self, idx):
+        if self.symbols is None:
+            return tuple(self.values[idx].tolist())
+        return (self.symbols[idx], ) + tuple(self.values[idx].tolist())
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._line(i) for i in range(*idx.indices(len(self)))]
+
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("line index out of range")
+
+        return self._line(idx)
+
+    def __iter__(self):
+        if self.symbols is None:
+            for line in self.values.tolist():
+                yield tuple(line)
+        else:
+            for symbol, line in zip(self.symbols, self.values.tolist()):
+                yield (symbol, ) + tuple(line)
+
+    def __eq__(self, other):
+        if isinstance(other, CoordinateBlock):
+            return self.symbols == other.symbols and np.array_equal(self.values, other.values)
+        if isinstance(other, Sequence) and not isinstance(other, (str, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, list(self))
+
+    def tolist(self):
+        """Returns the lines as a list of lists, also used by json_default and dict2line_iter"""
+        if self.symbols is None:
+            return self.values.tolist()
+        return [[symbol] + line for symbol, line in zip(self.symbols, self.values.tolist())]
+
+
+def _is_float_line(value, symbol):
+    # exactly the lines which would be stored in a CoordinateBlock
+    if not isinstance(value, tuple) or len(value) != 3 + symbol:
+        return False
+    return all(type(v) is float for v in value[symbol:])
+
+
+def _default_keyword(lines, symbol, bulk):
+    """
+    Build the value of a DEFAULT_KEYWORD from its lines, a tuple per line or a CoordinateBlock per bulk run.
+    Only with bulk=True large sections are returned as a CoordinateBlock.
+    """
+
+    nlines = sum(len(l) if isinstance(l, CoordinateBlock) else 1 for l in lines)
+
+    if bulk and nlines >= BULK_MIN_LINES and all(isinstance(l, CoordinateBlock) or _is_float_line(l, symbol) for l in lines):
+        if len(lines) == 1 and isinstance(lines[0], CoordinateBlock):
+            return lines[0]
+
+        blocks = [l if isinstance(l, CoordinateBlock)
+                  else CoordinateBlock([l[0]] if symbol else None, np.array([l[symbol:]], dtype=float))
+                  for l in lines]
+
+        return CoordinateBlock(sum((b.symbols for b in blocks), []) if symbol else None,
+                               np.concatenate([b.values for b in blocks]))
+
+    # unfold the bulk runs again, to get the same as if they were parsed line by line
+    unfolded = []
+    for line in lines:
+        if isinstance(line, CoordinateBlock):
+            unfolded += list(line)
+        else:
+            unfolded.append(line)
+
+    return unfolded[0] if len(unfolded) == 1 else unfolded
+
+
+def _line_values(text):
+    """The values of a line of a VALUES_SECTIONS section, from the text of the line"""
+    return tuple(_value(v) for v in COMMENT_SPLIT(text, 1)[0].split())
+
+
+def _section(name, param, entries, bulk=False):
+    """
+    Build the content of a section from its (key, value) entries (keywords and subsections),
+    entries with the key None are (already converted) lines of the DEFAULT_KEYWORD.
+    """
+
+    content = OrderedDict()
+    default = None  # the lines of the DEFAULT_KEYWORD
+
+    for child in entries:
+        key, value = child
+
+        # DEFAULT_KEYWORDs have to be treated differently since their first
+        # name is actually not a key but already a parameter
+        # TODO: add more sections with default parameters
+        # TODO: maybe delay mangling key names until here
+        if name == 'coord' and key is not None and key not in ['scaled', 'unit']:
+            if isinstance(value, tuple):
+                value = (key.title(),) + value
+            else:
+                value = (key.title(), value)
+            key = None
+
+        if key is None:
+            if default is None:
+                default = []
+                content['*'] = default  # to keep the position of the first line
+            default.append(value)
+            continue
+
+        # if the key already exists we got the same keyword/section multiple times
+        if key in content:
+            if isinstance(content[key], list):  # if it is already a list, simply append to it
+                content[key].append(value)
+            else:  # if not, make it a list
+                content[key] = [content[key], value]
+        else:  # and if the key does not exist, assign it
+            content[key] = value
+
+
+    if default is not None:
+        content['*'] = _default_keyword(default, name in SYMBOL_SECTIONS, bulk)
+
+    if param is not None:
+        content['_'] = param
+
+    return (name, content)
 
 
 class CP2KInput2Dict(NodeVisitor):
     def __init__(self, *args, **kwargs):
+        self.bulk = kwargs.pop('bulk', False)
         super(CP2KInput2Dict, self).__init__(*args, **kwargs)
-        self.grammar = CP2K_INP_GRAMMAR
+        self.grammar = CP2K_INP_BULK_GRAMMAR if self.bulk else CP2K_INP_GRAMMAR
 
     # anonymous nodes
     def generic_visit(self, node, visited_children):
@@ -70,45 +273,20 @@ class CP2KInput2Dict(NodeVisitor):
         return OrderedDict([vc for vc in visited_children if vc is not None])
 
 
-    def visit_section(self, node, visited_children):
+    def visit_section(self, _, visited_children):
         (name, param), entries, _ = visited_children
+        return _section(name, param, entries, self.bulk)
 
-        content = OrderedDict()
-
-        for child in entries:
-            key, value = child
-
-            # DEFAULT_KEYWORDs have to be treated differently since their first
-            # name is actually not a key but already a parameter
-            # TODO: add more sections with default parameters
-            # TODO: maybe delay mangling key names until here
-            if name == 'coord' and key not in ['scaled', 'unit']:
-                if isinstance(value, tuple):
-                    value = (key.title(),) + value
-                else:
-                    value = (key.title(), value)
-                key = '*'
-
-            # if the key already exists we got the same keyword/section multiple times
-            if key in content:
-                if isinstance(content[key], list):  # if it is already a list, simply append to it
-                    content[key].append(value)
-                else:  # if not, make it a list
-                    content[key] = [content[key], value]
-            else:  # and if the key does not exist, assign it
-                content[key] = value
-
-
-        if param is not None:
-            content['_'] = param
-
-        return (name, content)
+    # the COORD/VELOCITY sections of CP2K_INP_BULK_GRAMMAR
+    visit_coord_section = visit_velocity_section = visit_section
 
 
     def visit_section_start(self, _, visited_children):
         _, _, name, value, _, _ = visited_children
         return (name, value)
 
+    visit_coord_start = visit_velocity_start = visit_section_start
+
 
     def visit_section_content(self, _, visited_children):
         if visited_children is None:
@@ -121,26 +299,29 @@ class CP2KInput2Dict(NodeVisitor):
 
         return [vc for vc in visited_children if vc is not None]
 
+    visit_coord_content = visit_velocity_content = visit_section_content
 
 
-    def visit_name(self, node, _):
-        return node.text.lower()
+    def visit_coord_run(self, node, _):
+        return (None, _bulk_run(node.text, True))
 
 
-    def visit_value(self, node, _):
-        value = node.text
+    def visit_velocity_run(self, node, _):
+        return (None, _bulk_run(node.text, False))
+
+
+    def visit_velocity_line(self, node, _):
+        return (None, _line_values(node.text))
+
 
-        try:
-            return int(value)
-        except:
-            pass
+    def visit_name(self, node, _):
+        return node.text.lower()
 
-        try:
-            return float(value)
-        except:
-            pass
+    visit_coord_name = visit_velocity_name = visit_name
 
-        return node.text
+
+    def visit_value(self, node, _):
+        return _value(node.text)
 
 
     def visit_unit(self, _, visited_children):
@@ -155,29 +336,231 @@ class CP2KInput2Dict(NodeVisitor):
 
     def visit_kv(self, _, visited_children):
         _, k, _, unit, values, _, _, _ = visited_children
+        return (k, _kv_value(unit, values))
 
-        value = []
 
-        if unit:
-            value.append("[%s]" % unit)
+    def visit_values(self, _, values):
+        return values
 
-        value += values if values else [None]  # handle lone keywords
 
-        if len(value) == 1:
-            value = value[0]
-        else:
-            value = tuple(value)
+# The line rules of CP2K_INP_GRAMMAR (cline, section_start, section_end, kv) as regexes with the
+# semantics of the PEG: all tokens and choices are atomic and all repetitions possessive,
+# the regex engine never backtracks into something already matched (which the PEG does not either).
+# Same as parsimonious, the regex module is used.
+_S = r'[ \t]'
+_NL = r'(?>\r\n|\r|\n)'
+_VALUE = r'(?>(?i:[A-Z0-9_\-\+\./\"\']+))'
+_NAME = r'(?>(?i:[A-Z0-9_\-]+))'
+_END = r'(?i:END)'
+_COMMENT = r'(?>[#!].*)'
 
-        return (k, value)
+_RULES = {'s': _S, 'nl': _NL, 'value': _VALUE, 'name': _NAME, 'end': _END, 'comment': _COMMENT}
 
+CLINE_MATCH = regex.compile(r'{s}*+{comment}?+{nl}'.format(**_RULES))
 
-    def visit_values(self, _, values):
-        return values
+SECTION_START_MATCH = regex.compile(
+    r'{s}*+&(?!{end})(?P<name>{name})(?:{s}++(?P<param>{value}))?+{comment}?+{nl}'.format(**_RULES))
+
+SECTION_END_MATCH = regex.compile(r'{s}*+&{end}(?:{s}++{value})?+{comment}?+{nl}?+'.format(**_RULES))
+
+KV_MATCH = regex.compile(
+    r'{s}*+(?P<name>{name}){s}*+(?:\[{s}*+(?P<unit>{name}){s}*+\]{s}*+)?+(?P<values>(?:{value}{s}*+)++)?+'
+    r'{s}*+{comment}?+{nl}'.format(**_RULES))
+
+VALUE_MATCH = regex.compile(_VALUE)
+
+COMMENT_SPLIT = regex.compile(r'[#!]').split
+
+# runs of lines of COORD/VELOCITY sections with a symbol (for COORD) and three numbers which are floats
+# (and not ints) for Python, such lines are converted to the same values by _value(...) as by float(...)
+_FLOAT = r'[\-\+]?(?:[0-9]+\.[0-9]*|\.[0-9]+)(?:[eE][\-\+]?[0-9]+)?|[\-\+]?[0-9]+[eE][\-\+]?[0-9]+'
+
+BULK_RUN_MATCH = {
+    # the keywords of COORD are not a symbol
+    True: regex.compile(r'(?:{s}*+(?!(?i:scaled|unit){s})[A-Za-z][A-Za-z0-9_\-]*+(?:{s}++(?>{float})){{3}}{s}*+{nl})++'
+                        .format(float=_FLOAT, **_RULES)),
+    # the first number must be a valid name for the kv rule to match the line
+    False: regex.compile(r'(?:{s}*+(?![\+\.])(?>{float})(?:{s}++(?>{float})){{2}}{s}*+{nl})++'
+                         .format(float=_FLOAT, **_RULES)),
+    }
+
+
+def _bulk_run(text, symbol):
+    """Convert a run of lines matched by BULK_RUN_MATCH[symbol] to a CoordinateBlock"""
+
+    tokens = text.split()
+    ncols = 3 + symbol
+    values = np.array(list(map(float, (t for i, t in enumerate(tokens) if i % ncols >= symbol))), dtype=float)
+
+    symbols = None
+    if symbol:
+        names = tokens[::ncols]
+        titles = {n: n.lower().title() for n in set(names)}  # the same as the key mangling for COORD
+        symbols = [titles[n] for n in names]
+
+    return CoordinateBlock(symbols, values.reshape(-1, 3))
+
+
+def _match_rule(pattern):
+    """A custom parsimonious rule matching the given regex"""
+    match = pattern.match
+
+    def rule(text, pos):
+        run = match(text, pos)
+        return run.end() if run else None
+
+    return rule
+
+
+# The same as CP2K_INP_GRAMMAR, but the runs of plain lines of COORD and VELOCITY sections
+# are matched as a whole (by the same regexes as in CP2KInputLineParser) instead of line by line,
+# to not build a parse tree for each of their lines. The other lines of VELOCITY are matched
+# as by the kv rule, but converted to values only (see VALUES_SECTIONS).
+CP2K_INP_BULK_GRAMMAR = Grammar(r"""
+content  = ( cline / any_section )*
+
+any_section = coord_section / velocity_section / section
+
+section = section_start section_content section_end
+section_content = (kv / cline / any_section )*
+
+coord_section = coord_start coord_content section_end
+coord_start = s* "&" coord_name (s+ value)? comment? nl
+coord_name = ~r"COORD(?![A-Z0-9_\-])"i
+coord_content = (coord_run / kv / cline / any_section )*
+
+velocity_section = velocity_start velocity_content section_end
+velocity_start = s* "&" velocity_name (s+ value)? comment? nl
+velocity_name = ~r"VELOCITY(?![A-Z0-9_\-])"i
+velocity_content = (velocity_run / velocity_line / cline / any_section )*
+""" + _CP2K_INP_RULES, coord_run=_match_rule(BULK_RUN_MATCH[True]), velocity_run=_match_rule(BULK_RUN_MATCH[False]),
+                                velocity_line=_match_rule(KV_MATCH))
+
+
+class CP2KInputLineParser(object):
+    """
+    Line-oriented parser for CP2K input files, returning the same structure as CP2KInput2Dict
+    (and raising the same IncompleteParseError for invalid input) without building a parse tree.
+
+    Each line is matched with one regex per rule, with the sections kept on a stack.
+    """
+
+    def __init__(self, bulk=False):
+        """
+        :param bulk: return large COORD/VELOCITY sections as a (read-only) CoordinateBlock
+                     instead of a list of tuples
+        """
+        self.bulk = bulk
+
+    def parse(self, text):
+        toplevel = []
+        stack = []  # the (name, param, entries) of the open sections
+        pos = 0
+        start = 0  # the start of the current toplevel section, where the PEG stops if the section fails
+
+        # bind the matchers locally, this is the hot loop
+        kv_match = KV_MATCH.match
+        cline_match = CLINE_MATCH.match
+        section_start_match = SECTION_START_MATCH.match
+        section_end_match = SECTION_END_MATCH.match
+        value_findall = VALUE_MATCH.findall
+        values_sections = VALUES_SECTIONS if self.bulk else ()  # see VALUES_SECTIONS
+
+        while True:
+            if stack:
+                # the content of a section: (kv / cline / section)* section_end
+                name = stack[-1][0]
+
+                if name in SYMBOL_SECTIONS or name in values_sections:
+                    symbol = name in SYMBOL_SECTIONS
+                    match = BULK_RUN_MATCH[symbol].match(text, pos)
+                    if match:
+                        stack[-1][2].append((None, _bulk_run(match.group(0), symbol)))
+                        pos = match.end()
+                        continue
+
+                match = kv_match(text, pos)
+                if match and name in values_sections:
+                    stack[-1][2].append((None, _line_values(match.group(0))))
+                    pos = match.end()
+                    continue
+
+                if match:
+                    values = match.group('values')
+                    if values is not None:
+                        values = [_value(v) for v in value_findall(values)]
+                    unit = match.group('unit')
+                    stack[-1][2].append((match.group('name').lower(), _kv_value(unit.lower() if unit else unit, values)))
+                    pos = match.end()
+                    continue
+
+                match = cline_match(text, pos)
+                if match:
+                    pos = match.end()
+                    continue
+
+                match = section_start_match(text, pos)
+                if match:
+                    param = match.group('param')
+                    stack.append((match.group('name').lower(), None if param is None else _value(param), []))
+                    pos = match.end()
+                    continue
+
+                match = section_end_match(text, pos)
+                if not match:
+                    # the open sections fail and with them the toplevel section
+                    break
+
+                section = _section(*stack.pop(), bulk=self.bulk)
+                pos = match.end()
+
+                if stack:
+                    stack[-1][2].append(section)
+                else:
+                    toplevel.append(section)
+                    start = pos
+
+            else:
+                # the toplevel: (cline / section)*
+                if pos == len(text):
+                    break
+
+                match = cline_match(text, pos)
+                if match:
+                    pos = start = match.end()
+                    continue
+
+                match = section_start_match(text, pos)
+                if not match:
+                    break
+
+                param = match.group('param')
+                stack.append((match.group('name').lower(), None if param is None else _value(param), []))
+                pos = match.end()
+
+        if stack or pos != len(text):
+            raise IncompleteParseError(text, start, CP2K_INP_GRAMMAR.default_rule)
+
+        # we can't have duplicate sections on the toplevel
+        return OrderedDict(toplevel)
 
 
 class CP2KInputParser:
-    def __init__(self):
-        self._parser = CP2KInput2Dict()
+    BACKENDS = ('peg', 'lines')
+
+    def __init__(self, backend='peg', bulk=False):
+        """Create a parser using the given backend:
+        the Parsimonious PEG parser ('peg') or the (faster) line-oriented parser ('lines').
+        With bulk=True, COORD and VELOCITY sections with at least BULK_MIN_LINES lines are returned
+        as a (read-only) CoordinateBlock instead of a list of tuples, and the PEG parser matches
+        their plain lines as a whole instead of building a parse tree for each line.
+        The lines of VELOCITY sections are then stored as tuples of their values under '*',
+        instead of as keywords named by their first number."""
+
+        if backend not in self.BACKENDS:
+            raise ValueError("invalid backend '{}', must be one of: {}".format(backend, ", ".join(self.BACKENDS)))
+
+        self._parser = CP2KInput2Dict(bulk=bulk) if backend == 'peg' else CP2KInputLineParser(bulk)
 
     def parse(self, fhandle):
         return self._parser.parse(fhandle.read())
@@ -21,23 +21,28 @@ import pprint
 
 import click
 from .input import CP2KInputParser
+from ..tools import json_default
 
 
 @click.command()
 @click.argument('cp2k-input-file', type=click.File('r'))
 @click.option('--python-output/--no-python-output', default=False,
               help="Yield prettified python output instead of json")
-def cli(cp2k_input_file, python_output):
+@click.option('--backend', type=click.Choice(CP2KInputParser.BACKENDS), default='peg', show_default=True,
+              help="The parser to use: the Parsimonious PEG parser or the faster line-oriented parser")
+@click.option('--bulk/--no-bulk', default=False, show_default=True,
+              help="Convert large COORD/VELOCITY sections in one go (the output is the same)")
+def cli(cp2k_input_file, python_output, backend, bulk):
     """Convert a CP2K input file to a JSON representation as used in AiiDA and other.
     This is a proof-of-concept, using Parsimonious to implement a PEG-based parser."""
-    parser = CP2KInputParser()
+    parser = CP2KInputParser(backend, bulk)
     data = parser.parse(cp2k_input_file)
 
     if python_output:
         pprinter = pprint.PrettyPrinter(indent=4)
         pprinter.pprint(data)
     else:
-        click.echo(json.dumps(data, indent=4))
+        click.echo(json.dumps(data, indent=4, default=json_default))
 
 
 if __name__ == '__main__':
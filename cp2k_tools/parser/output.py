@@ -1,6 +1,26 @@
 
+import os
+import re
+import time
+import pickle
+
+import numpy as np
+
+from ..tools import GrowableArray
+from .xyz import as_byteorstringlike, STRING_TYPES
+
+
+class InvalidValueForKey(ValueError):
+    def __init__(self, key, value):
+        super(InvalidValueForKey, self).__init__("invalid value for key '{}': '{}'".format(key, value))
+
+
 class ElementParserSection:
-    import re
+    # lines of the form ' XXX| ...'
+    dispatch_keys = ('|', )
+
+    _match = re.compile(r'^ (?P<key>[a-zA-Z0-9]+)\| (?P<value>.*)')
+    _desc_value = re.compile(r'^(?P<desc>.+?)(?:\s{2,})(?P<value>.+)')
 
     def __init__(self):
         self._p = {
@@ -14,8 +34,8 @@ class ElementParserSection:
 
     # returns true if parser can parse this line
     def match(self, line):
-        m = re.match('^ (?P<key>[a-zA-Z0-9]+)\| (?P<value>.*)', line)
-        if m:
+        m = self._match.match(line)
+        if m and m.group('key') in self._p:
             self._k = m.group('key')
             self._v = m.group('value')
             return True
@@ -24,7 +44,7 @@ class ElementParserSection:
 
     def parse(self, line):
         if self._k in self._p.keys():
-            ms = re.match('^(?P<desc>.+?)(?:\s{2,})(?P<value>.+)', self._v)
+            ms = self._desc_value.match(self._v)
             if ms:
                 # add the found desc/parameter, but strip ':' beforehand
                 self._p[self._k][ms.group('desc').rstrip(':')] = ms.group('value')
@@ -40,7 +60,11 @@ class ElementParserSection:
 
 
 class ElementParserProgramInfo:
-    import re
+    # the banner lines start with '*' (or with 'PROGRAM' if only blanks are in front)
+    dispatch_keys = ('*', 'P')
+
+    _match = re.compile(r'^ [\* ]{13,} PROGRAM (?P<key>(STARTED (AT|ON|BY|IN))|(RAN (ON|BY))|STOPPED IN|PROCESS ID|ENDED AT)\s+(?P<value>.*)$')
+    _continuation = re.compile(r' \s{42}(?P<value>.+)')
 
     def __init__(self):
         self._k = ''
@@ -53,7 +77,7 @@ class ElementParserProgramInfo:
         # if we are here, we finished parsing before
         self._finished = True
 
-        m = re.match('^ [\* ]{13,} PROGRAM (?P<key>(STARTED (AT|ON|BY|IN))|(RAN (ON|BY))|STOPPED IN|PROCESS ID|ENDED AT)\s+(?P<value>.*)$', line)
+        m = self._match.match(line)
 
         if m:
             self._k = m.group('key')
@@ -72,7 +96,7 @@ class ElementParserProgramInfo:
 
         # possible second line of the value
         else:
-            mp = re.match(' \s{42}(?P<value>.+)', line)
+            mp = self._continuation.match(line)
             if mp:
                 # append the value to the existing one and return True to get another peek,
                 # we might have yet another line after all!
@@ -91,11 +115,13 @@ class ElementParserProgramInfo:
 
 
 class ElementParserError:
-    import re
+    dispatch_keys = ('*', )
+
+    _match = re.compile(r'^ \*{76}$')
 
     # returns true if parser can parse this line
     def match(self, line):
-        m = re.match('^ \*{76}$', line)
+        m = self._match.match(line)
 
         if m:
             return True
@@ -103,13 +129,7 @@ class ElementParserError:
         return False
 
     def parse(self, line):
-        if self._k in self._p.keys():
-            ms = re.match('^(?P<desc>.+?)(?:\s{2,})(?P<value>.+)', self._value)
-            if ms:
-                # add the found desc/parameter, but strip ':' beforehand
-                self._p[self._k][ms.group('desc').rstrip(':')] = ms.group('value')
-            else:
-                raise InvalidValueForKey(self._k, self._value)
+        pass
 
     # this element parser is stateless, always finish directly
     def finished(self):
@@ -120,14 +140,16 @@ class ElementParserError:
 
 
 class ElementParserTable:
-    import re
+    dispatch_keys = ('*', )
+
+    _match = re.compile(r'^ \*\*\* (?P<tablename>.+?) \*\*\*$')
 
     def __init__(self):
         self._tn = ''
 
     # returns true if parser can parse this line
     def match(self, line):
-        m = re.match('^ \*\*\* (?P<tablename>.+?) \*\*\*$', line)
+        m = self._match.match(line)
 
         if m:
             self._tn = m.group('tablename')
@@ -145,45 +167,397 @@ class ElementParserTable:
     def data(self):
         return {}
 
+class ElementParserSCF:
+    """
+    Collects the iterations of all SCF runs (from the 'SCF WAVEFUNCTION OPTIMIZATION' tables)
+    as columns, with the index of the SCF run each iteration belongs to in the 'run' column.
+    """
+
+    # the table header ('Step ...'), the iterations and the final '*** SCF run ...' line
+    dispatch_keys = ('S', '*') + tuple('0123456789')
+
+    _header = re.compile(r'^\s+Step\s+Update method\s+Time\s+Convergence\s+Total energy\s+Change')
+    _iteration = re.compile(r"""
+        ^\s+ (?P<step>\d+)
+        \s+ (?P<method>[A-Za-z_./]+(?:[ ][A-Za-z_./]+)?)
+        \s+ (?P<stepsize>\S+)
+        \s+ (?P<time>\d+\.\d*)
+        \s+ (?:(?P<convergence>\d*\.\d+(?:[Ee][\+\-]?\d+)?) \s+)?  # not printed for line search steps
+        (?P<energy>[\+\-]?\d+\.\d+)
+        (?:\s+ (?P<change>[\+\-]?\d*\.\d+[Ee][\+\-]?\d+))?
+        \s*$
+        """, re.VERBOSE)
+    _end = re.compile(r'^\s+\*\*\* SCF run (?P<not>NOT )?converged')
+
+    _columns = (
+        ('run', int),
+        ('step', int),
+        ('stepsize', float),
+        ('time', float),
+        ('convergence', float),
+        ('energy', float),
+        ('change', float),
+        )
+
+    def __init__(self):
+        self._c = {name: GrowableArray(dtype) for name, dtype in self._columns}
+        self._converged = GrowableArray(bool)
+        self._in_table = False
+        self._m = None
+
+    def match(self, line):
+        if self._header.match(line):
+            self._m = None
+            return True
+
+        if self._in_table:
+            self._m = self._iteration.match(line) or self._end.match(line)
+            return self._m is not None
+
+        return False
+
+    def parse(self, line):
+        # do not keep the match around, the parser state must remain picklable
+        m, self._m = self._m, None
+
+        if m is None:  # the header of a new SCF run
+            self._in_table = True
+            self._converged.append(False)
+            return
+
+        if m.re is self._end:
+            self._in_table = False
+            self._converged.set_last(not m.group('not'))
+            return
+
+        row = m.groupdict()
+        row['run'] = len(self._converged) - 1
+
+        for name, dtype in self._columns:
+            value = row[name]
+            if dtype is float:
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):  # for optional or unparseable values
+                    value = np.nan
+            self._c[name].append(value)
+
+    # the state of the table is tracked independently, other parsers can consume lines in between
+    def finished(self):
+        return True
+
+    def data(self):
+        data = {name: column.array() for name, column in self._c.items()}
+        data['converged'] = self._converged.array()
+        return {'SCF': data}
+
+
+class ElementParserMD:
+    """
+    Collects the per-step information of MD runs as columns,
+    for both the ' MD| ...' output format and the one of older CP2K versions (' STEP NUMBER  = ...').
+    """
+
+    dispatch_keys = ('|', 'S', 'T', 'C', 'P', 'K')
+
+    _match = re.compile(r"""
+        ^[ ] (?:
+            MD\|[ ] (?P<key>Step[ ]number|Time[ ]\[fs\]|Conserved[ ]quantity[ ]\[hartree\]|
+                          Potential[ ]energy[ ]\[hartree\]|Kinetic[ ]energy[ ]\[hartree\]|Temperature[ ]\[K\])
+            \s+ (?P<value>\S+)
+            |
+            (?P<oldkey>STEP[ ]NUMBER|TIME[ ]\[fs\]|CONSERVED[ ]QUANTITY[ ]\[hartree\]|
+                       POTENTIAL[ ]ENERGY[ ]?\[hartree\]|KINETIC[ ]ENERGY[ ]\[hartree\]|TEMPERATURE[ ]\[K\])
+            \s+ = \s+ (?P<oldvalue>\S+)
+        )
+        """, re.VERBOSE)
+
+    _keys = {
+        'step number': 'step',
+        'time [fs]': 'time',
+        'conserved quantity [hartree]': 'conserved',
+        'potential energy [hartree]': 'potential',
+        'potential energy[hartree]': 'potential',
+        'kinetic energy [hartree]': 'kinetic',
+        'temperature [k]': 'temperature',
+        }
+
+    _columns = (
+        ('step', int),
+        ('time', float),
+        ('conserved', float),
+        ('potential', float),
+        ('kinetic', float),
+        ('temperature', float),
+        )
+
+    def __init__(self):
+        self._c = {name: GrowableArray(dtype) for name, dtype in self._columns}
+        self._k = ''
+        self._v = ''
+
+    def match(self, line):
+        m = self._match.match(line)
+
+        if m:
+            self._k = self._keys[(m.group('key') or m.group('oldkey')).lower()]
+            self._v = m.group('value') or m.group('oldvalue')
+            return True
+
+        return False
+
+    def parse(self, line):
+        if self._k == 'step':
+            # a new step starts a new row, with all other values filled in as they appear
+            for name, _ in self._columns[1:]:
+                self._c[name].append(np.nan)
+            self._c['step'].append(int(self._v))
+
+        elif len(self._c['step']):  # ignore values before the first step (initialization)
+            self._c[self._k].set_last(float(self._v))
+
+    def finished(self):
+        return True
+
+    def data(self):
+        return {'MD': {name: column.array() for name, column in self._c.items()}}
+
+
+def dispatch_key(line):
+    """
+    Classify a line of CP2K output by its leading characters, to only try
+    the element parsers registered for this key (see `dispatch_keys`):
+    '|' for lines of the form ' XXX| ...', otherwise the first non-blank character
+    (or the empty string for blank lines).
+    """
+    bar = line.find('|', 1, 32)
+
+    if bar > 1 and line[0] == ' ' and line[1:bar].isalnum():
+        return '|'
+
+    return line.lstrip()[:1]
+
+
 class CP2KOutputParser:
+    # bump this whenever the element parsers change in a way incompatible with saved states
+    STATE_VERSION = 3
+
+    # the number of bytes at the beginning of a file used to recognize it again
+    HEAD_SIZE = 256
+
+    # The element parser classes, in the order they are tried on a line.
+    # Each element parser declares the dispatch keys of the lines it can parse in `dispatch_keys`,
+    # or None if it has to see every line (which should be avoided for performance reasons).
+    # Element parsers can implement `complete(keys)` to tell whether the data for the
+    # given query keys can not change anymore, to stop parsing early for queries.
+    # This must include the lines of further runs appended to the same output, which overwrite
+    # the values of the previous runs (the header sections and the program info do not implement it).
+    ELEMENT_PARSERS = (
+        ElementParserSection,
+        ElementParserError,
+        ElementParserProgramInfo,
+        ElementParserSCF,
+        ElementParserMD,
+        )
+
+    @classmethod
+    def register(cls, element_parser):
+        """
+        Register an additional element parser class,
+        it is only tried on lines matching one of its `dispatch_keys`.
+        Can be used as a class decorator.
+        """
+        cls.ELEMENT_PARSERS = tuple(cls.ELEMENT_PARSERS) + (element_parser, )
+        return element_parser
+
     def __init__(self):
-        self._parsers = [
-                ElementParserSection(),
-                ElementParserError(),
-                ElementParserProgramInfo(),
-                ] 
-
-    def parse(self, fh):
-        p = None
-        for line in fh:
-            line = line.strip('\n')
-
-            # if we still have an element parser set and it is not done yet, continue with that one
-            if p is not None and not p.finished():
-                # in case the parser needed a lookahead but was in fact done, it will return false
-                if p.parse(line):
-                    continue
-
-            # otherwise restart with all possible parsers
-            for p in self._parsers:
-                if p.match(line):
-                    p.parse(line)
+        self._parsers = [p() for p in self.ELEMENT_PARSERS]
+        self._dispatch, self._catchall = self._dispatch_table(self._parsers)
+
+        # which element parser provides the data for which toplevel key
+        self._providers = {k: p for p in self._parsers for k in p.data()}
+
+        self._current = None  # the element parser which consumed the last line
+
+        # position and identity of the file when parsing incrementally
+        self._offset = 0
+        self._file_id = None
+        self._head = b''
+
+    @staticmethod
+    def _dispatch_table(parsers):
+        """Build the table of element parsers to try, by dispatch key"""
+        catchall = tuple(p for p in parsers if p.dispatch_keys is None)
+        keys = set(k for p in parsers if p.dispatch_keys is not None for k in p.dispatch_keys)
+
+        dispatch = {
+            k: tuple(p for p in parsers if p.dispatch_keys is None or k in p.dispatch_keys)
+            for k in keys}
+
+        return dispatch, catchall
+
+    def _parse_line(self, line):
+        p = self._current
+
+        # if we still have an element parser set and it is not done yet, continue with that one
+        if p is not None and not p.finished():
+            # in case the parser needed a lookahead but was in fact done, it will return false
+            if p.parse(line):
+                return
+
+        # otherwise restart with all element parsers registered for this kind of line
+        self._current = None
+        for p in self._dispatch.get(dispatch_key(line), self._catchall):
+            if p.match(line):
+                p.parse(line)
+                self._current = p
+                break
+
+    def parse(self, fh, queries=None):
+        """
+        Parse the CP2K output from the given file handle (or any other iterable of lines).
+
+        If a list of queries is given, only the element parsers providing data
+        for these queries are run, so the results of other queries are undefined afterwards.
+        The results of the given queries are the same as after parsing everything, parsing
+        stops early only if the element parsers of all queries tell that their results are complete.
+        """
+
+        if queries is None:
+            for line in fh:
+                self._parse_line(line.strip('\n'))
+            return
+
+        queries = [compile_query(q) for q in queries]
+
+        needed = set()
+        for query in queries:
+            if query.root in self._providers:
+                needed.add(self._providers[query.root])
+            elif query.steps is not None:  # invalid queries need nothing, everything else needs all
+                needed.update(self._parsers)
+
+        # without a complete() check for one of the queries, parsing can not stop early
+        stoppable = all(q.steps is None or hasattr(self._providers.get(q.root), 'complete') for q in queries)
+
+        saved = self._dispatch, self._catchall
+        self._dispatch, self._catchall = self._dispatch_table([p for p in self._parsers if p in needed])
+
+        try:
+            if not stoppable:
+                for line in fh:
+                    self._parse_line(line.strip('\n'))
+                return
+
+            for line in fh:
+                active = self._current is not None
+                self._parse_line(line.strip('\n'))
+
+                # check only after a line changed the state of an element parser
+                if (active or self._current is not None) and all(self._complete(q) for q in queries):
                     break
-#            else:
-#                if len(line.strip()) > 0:
-#                    print('no parser found for: "%s"' % line)
+        finally:
+            self._dispatch, self._catchall = saved
 
-    # the query language is supposed to follow the one from the 'jq' tool,
-    # but for now we support only '.' (for everything), '.foo.bar' and 
-    def query(self, q):
-        import re
+    def _complete(self, query):
+        """Whether the result of the (compiled) query can not change anymore by parsing further"""
+        if query.steps is None:
+            return True
 
-        keys = q.split('.')
+        provider = self._providers.get(query.root)
+        complete = getattr(provider, 'complete', None)
 
-        # the string should start with a '.', so the first segment is always empty
-        # TODO: throw exception here
-        if keys[0]:
-            return {}
+        return complete is not None and complete(query.keys)
+
+    def parse_incremental(self, filename):
+        """
+        Parse only the content appended to the given file since the last call,
+        a partially written last line is left for the next call.
+        If the file was replaced or truncated in the meantime, parsing starts over.
+        Returns the number of bytes parsed.
+        """
+
+        with open(filename, 'rb') as fhandle:
+            fstat = os.fstat(fhandle.fileno())
+            head = fhandle.read(self.HEAD_SIZE)
+
+            if ((self._file_id is not None and self._file_id != (fstat.st_dev, fstat.st_ino))
+                    or fstat.st_size < self._offset
+                    or head[:len(self._head)] != self._head):
+                self.__init__()
+
+            self._file_id = (fstat.st_dev, fstat.st_ino)
+            if len(self._head) < self.HEAD_SIZE:
+                self._head = head
+
+            fhandle.seek(self._offset)
+
+            nbytes = 0
+            for line in fhandle:
+                if not line.endswith(b'\n'):
+                    break
+
+                self._parse_line(line.decode('utf8').strip('\n'))
+                nbytes += len(line)
+
+            self._offset += nbytes
+
+        return nbytes
+
+    def follow(self, filename, interval=1., timeout=None):
+        """
+        Poll the given (growing) file and parse new content as it appears.
+
+        Yields the parser itself whenever new content has been parsed
+        and stops when the CP2K run ended or when no new content
+        appeared for `timeout` seconds (if given).
+        """
+
+        idle = 0.
+
+        while True:
+            if self.parse_incremental(filename):
+                idle = 0.
+                yield self
+
+                if self.ended():
+                    return
+
+            elif timeout is not None and idle >= timeout:
+                return
+
+            else:
+                time.sleep(interval)
+                idle += interval
+
+    def ended(self):
+        """Whether the end of the CP2K run has been parsed"""
+        return 'ENDED AT' in self.query('.PROGRAM')
+
+    def save_state(self, fhandle):
+        """Store the state of the parser (including all parsed data) in the given binary file handle"""
+        pickle.dump((self.STATE_VERSION, self), fhandle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load_state(cls, fhandle):
+        """
+        Restore a parser from a state stored with save_state(...).
+        Raises a ValueError if the state was stored by an incompatible version.
+        """
+        version, parser = pickle.load(fhandle)
+
+        if version != cls.STATE_VERSION or not isinstance(parser, cls):
+            raise ValueError("incompatible parser state")
+
+        return parser
+
+    def query(self, q):
+        """Query the parsed data, see CP2KOutputQuery for the syntax"""
+        query = compile_query(q)
+
+        if query.root in self._providers:
+            # only fetch the data of the element parser providing it
+            return query.evaluate({query.root: self._providers[query.root].data()[query.root]})
 
         d = {}
 
@@ -192,22 +566,65 @@ class CP2KOutputParser:
             for k, v in p.data().items():
                 d[k] = v
 
+        return query.evaluate(d)
+
+
+class CP2KOutputQuery(object):
+    """
+    A query for the data of the CP2KOutputParser compiled into an access plan.
+
+    The query language is supposed to follow the one from the 'jq' tool,
+    but for now we support only '.' (for everything), '.foo.bar' and '.foo[0][1]',
+    where dicts are sorted by key (which makes them a list of pairs) when indexed.
+    """
+
+    _segment = re.compile(r'(?P<k>[^\[\]]*)(\[(?P<i>[\d\[\]]+)\])?$')
+
+    def __init__(self, q):
+        self.q = q
+        self.steps = None  # a list of (key, [index, ...]), None for an invalid query
+        self.keys = []
+
+        keys = q.split('.')
+
+        # the string should start with a '.', so the first segment is always empty
+        # TODO: throw exception here
+        if keys[0]:
+            return
+
         # if the second key is empty, '.' was passed and we return everything
-        if not keys[1] and len(keys) is 2:
-            return d
+        if not keys[1] and len(keys) == 2:
+            self.steps = []
+            return
+
+        steps = []
+        for k in keys[1:]:
+            m = self._segment.match(k)
+            if m is None:
+                return
+            steps.append((m.group('k'), [int(i) for i in m.group('i').split('][')] if m.group('i') else []))
+
+        self.steps = steps
+        self.keys = [k for k, _ in steps]
+
+    @property
+    def root(self):
+        """The toplevel key of the data accessed, None for everything"""
+        return self.keys[0] if self.keys else None
+
+    def evaluate(self, d):
+        if self.steps is None:
+            return {}
 
         # the first key is always in one of the parsers
         try:
-            for k in keys[1:]:
-                m = re.match(r'(?P<k>[^\[\]]*)(\[(?P<i>[\d\[\]]+)\])?$', k)
-                if m.group('k') is not None:
-                    d = d[m.group('k')]
-                if m.group('i') is not None:
-                    for i in m.group('i').split(']['):
-                        # for dictionaries sort it alphabetically first (which makes it automatically a list of pairs)
-                        if type(d) is dict:
-                            d = sorted(d.items())
-                        d = d[int(i)]
+            for k, indexes in self.steps:
+                d = d[k]
+                for i in indexes:
+                    # for dictionaries sort it alphabetically first (which makes it automatically a list of pairs)
+                    if type(d) is dict:
+                        d = sorted(d.items())
+                    d = d[i]
 
         # ignore key or type errors (when walking the parser data objects)
         except (TypeError, KeyError, IndexError):
@@ -215,12 +632,33 @@ class CP2KOutputParser:
 
         return d
 
+
+_COMPILED_QUERIES = {}
+
+
+def compile_query(q):
+    """Return the compiled CP2KOutputQuery for the query string, cached"""
+    if isinstance(q, CP2KOutputQuery):
+        return q
+
+    try:
+        return _COMPILED_QUERIES[q]
+    except KeyError:
+        pass
+
+    if len(_COMPILED_QUERIES) > 1024:
+        _COMPILED_QUERIES.clear()
+
+    query = _COMPILED_QUERIES[q] = CP2KOutputQuery(q)
+    return query
+
+
 class BlockParserReferences:
     name = 'references'
 
     import regex
 
-    _ref_table = regex.compile(r'''
+    _ref_table_regex = r'''
 \ \-+\n                                     # {
 \ \-\ +\-\n                                 #
 \ \-\ +R\ E\ F\ E\ R\ E\ N\ C\ E\ S\ +\-\n  #   match the header
@@ -230,12 +668,17 @@ class BlockParserReferences:
 (\ CP2K.+\n){2}                             # also consume the two header CP2K declaration lines
 \n
 (                                           # match one block/reference
+  (?!\ \-)                                  #   which does not start with ' -' (the next table)
   (?P<references>(?s).*?                    #   non-greedily match everything (including newlines)
   (?=\n\n))                                 #   .. except two newlines
   \n+                                       #   now consume all newlines
 )+                                          # there can be multiple references of course
 (?=\ \-+\n)                                 # stop at ' --' because that marks the next table
-        ''', regex.X | regex.M | regex.VERSION1)
+        '''
+
+    _ref_table = regex.compile(_ref_table_regex, regex.X | regex.M | regex.VERSION1)
+    # the same for byte-likes (like a mmapped file), to avoid decoding the complete output
+    _ref_table_bytes = regex.compile(_ref_table_regex.encode('ascii'), regex.X | regex.M | regex.VERSION1)
 
     _ref_block = regex.compile(r'''
 \s*                                         # consume the whitespace at the beginning
@@ -252,13 +695,9 @@ class BlockParserReferences:
 (?P<url>http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+)
         ''', regex.X)
 
-    @classmethod
-    def parse(cls, txt):
-        """
-        Parse the provided string for reference block and return
-        a tuple (content, nonparsedstring).
-        """
-        entry = lambda r: {
+    @staticmethod
+    def _entry(r):
+        return {
             'authors': r.captures('authors'),
             'journal': r.group('journal'),
             'volume':  r.group('volume'),
@@ -267,25 +706,101 @@ class BlockParserReferences:
             'title':   r.group('title'),
             'url':     r.group('url'),
             }
-        return ([entry(cls._ref_block.search(ref.replace('\n', '')))
-                for ref in cls._ref_table.search(txt).captures('references')],
-            cls._ref_table.sub("", txt))
+
+    @staticmethod
+    def empty():
+        """The content returned if there is no references block"""
+        return []
+
+    @classmethod
+    def search(cls, buf, pos=0, endpos=None):
+        """
+        Search the references block in the provided string or byte-like (e.g. a mmap)
+        between pos and endpos and return a tuple (content, span),
+        where span is the (start, end) of the block or None if none was found.
+        """
+
+        if isinstance(buf, STRING_TYPES):
+            match = cls._ref_table.search(buf, pos, endpos)
+            decode = lambda ref: ref
+        else:
+            match = cls._ref_table_bytes.search(buf, pos, endpos)
+            decode = lambda ref: ref.decode('utf-8')
+
+        if match is None:
+            return cls.empty(), None
+
+        # only the extracted references get copied out of the buffer
+        return ([cls._entry(cls._ref_block.search(decode(ref).replace('\n', '')))
+                 for ref in match.captures('references')],
+                match.span())
+
+    @classmethod
+    def parse(cls, txt):
+        """
+        Parse the provided string for reference block and return
+        a tuple (content, nonparsedstring).
+        """
+        content, span = cls.search(txt)
+
+        if span is None:
+            return content, txt
+
+        return content, txt[:span[0]] + txt[span[1]:]
+
+
+def _unclaimed(spans, size):
+    """Yields the (pos, endpos) of the regions between the given (sorted) spans"""
+
+    pos = 0
+    for start, end in spans:
+        if start > pos:
+            yield pos, start
+        pos = max(pos, end)
+
+    if pos < size:
+        yield pos, size
 
 
 class CP2KOutputBlockParser:
     """
     Parser working on a complete CP2K output log string and parsing it block by block
     (in contrast to the line-by-line streaming parser operating on a file handle)
+
+    The block parsers report the span of the block they parsed instead of returning
+    a copy of the output without it. Subsequent block parsers skip those spans,
+    which allows them to work directly on a read-only mmapped file.
+    If a block parser finds nothing, its `empty()` result is used.
     """
 
+    # to be increased whenever the structure of the parsed data changes
+    VERSION = 1
+
     def __init__(self):
         self._bparsers = [
             BlockParserReferences
         ]
 
     def parse(self, txt):
+        """Parse the given string or byte-like (e.g. a mmap) of a complete CP2K output"""
+
         out = {}
+        spans = []
+
         for p in self._bparsers:
-            out[p.name], txt = p.parse(txt)
+            for pos, endpos in _unclaimed(spans, len(txt)):
+                out[p.name], span = p.search(txt, pos, endpos)
+
+                if span is not None:
+                    spans = sorted(spans + [span])
+                    break
+            else:
+                out[p.name] = p.empty()
 
         return out
+
+    def parse_file(self, fh):
+        """Parse the output from the given file handle, using mmap if possible"""
+
+        with as_byteorstringlike(fh) as (content, _):
+            return self.parse(content)
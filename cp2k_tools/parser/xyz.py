@@ -1,7 +1,17 @@
 
+import os
 import re
+import io
+import json
 import contextlib
 
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # PY2 and Python < 3.8
+    shared_memory = None
+
 
 try:
     # PY2, bytes are also strings and need to be imbued
@@ -25,7 +35,14 @@ def as_byteorstringlike(fh_or_content):
     else:
         # if the handle is a file handle, use mmap to return a bitelike object
         import mmap
-        mmapped = mmap.mmap(fh_or_content.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            mmapped = mmap.mmap(fh_or_content.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, ValueError, EnvironmentError):
+            # not a real file (pipe, in-memory file handle) or an empty one which can not be mmapped
+            content = fh_or_content.read()
+            yield content, isinstance(content, STRING_TYPES)
+            return
 
         try:
             yield mmapped, False
@@ -43,6 +60,11 @@ POS_MATCH_REGEX = r"""
 (?P<z> [\-\+]? (\d*\.\d+|\d+\.?\d*) ([Ee][\+\-]?\d+)? )         # Get z
 """
 
+# MULTILINE and VERBOSE regex to match the first line of a frame (the number of atoms):
+NATOMS_LINE_REGEX = r"""
+^[ \t]* [0-9]+ [ \t]* $
+"""
+
 # MULTILINE and VERBOSE regex to match frames:
 FRAME_MATCH_REGEX = r"""
                                         # First line contains an integer
@@ -79,19 +101,186 @@ FRAME_MATCH_REGEX = r"""
 )                                       # A positions block should be one or more lines
 """
 
+# MULTILINE and VERBOSE regex to match the lines in a block of positions which are not atom entries
+# (but accepted by FRAME_MATCH_REGEX): commented out lines and lines containing only white space.
+# To be searched from the newline before the block, starting with it lets the search skip ahead quickly.
+SKIP_LINE_REGEX = r"""
+[\n] [ \t\r\f\v]* [\#\n]
+"""
+
+# the comment line written by CP2K for frames of MD and GEO_OPT trajectories
+CP2K_COMMENT_MATCH = re.compile(r"""
+^[ \t]* i    [ ] = [ \t]+ (?P<iteration> \d+),
+ [ \t]* time [ ] = [ \t]+ (?P<time> [\+\-]?  ( \d*[\.]\d+  | \d+[\.]?\d* )  ([Ee][\+\-]?\d+)? ),
+ [ \t]* E    [ ] = [ \t]+ (?P<energy> [\+\-]?  ( \d*[\.]\d+  | \d+[\.]?\d* )  ([Ee][\+\-]?\d+)? )
+""", re.VERBOSE)
+
+
+class BlockIterator(object):
+    """
+    An iterator for wrapping the iterator returned by `match.finditer`
+    to extract the required fields directly from the match object
+    """
+    def __init__(self, it, natoms, is_string=True):
+        self._it = it
+        self._natoms = natoms
+        self._is_string = is_string
+        self._catom = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            match = next(self._it)
+        except StopIteration:
+            # if we reached the number of atoms declared, everything is well
+            # and we re-raise the StopIteration exception
+            if self._catom == self._natoms:
+                raise
+            else:
+                # otherwise we got too less entries
+                raise TypeError("Number of atom entries ({}) is smaller "
+                                "than the number of atoms ({})".format(
+                                    self._catom, self._natoms))
+
+        self._catom += 1
+
+        if self._catom > self._natoms:
+            raise TypeError("Number of atom entries ({}) is larger "
+                            "than the number of atoms ({})".format(
+                                self._catom, self._natoms))
+
+        return (
+            match.group('sym') if self._is_string else match.group('sym').decode('utf8'),
+            (
+                float(match.group('x')),
+                float(match.group('y')),
+                float(match.group('z'))
+                ))
+
+    def next(self):
+        """
+        The iterator method expected by python 2.x,
+        implemented as python 3.x style method.
+        """
+        return self.__next__()
+
+
+class XYZFrameIndex(object):
+    """
+    Byte offset, number of atoms and comment of every frame in an XYZ file,
+    to be able to seek directly to a frame instead of matching all the frames before it.
+
+    For files on disk the index can be stored as a sidecar file next to the XYZ file (on request),
+    it is only used again if size and modification time of the XYZ file still match.
+    """
+
+    VERSION = 2
+    SIDECAR_SUFFIX = '.idx'
+
+    def __init__(self, offsets, natoms, comments, size=None, mtime=None):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.natoms = np.asarray(natoms, dtype=np.int64)
+        self.comments = list(comments)
+        self.size = size
+        self.mtime = mtime
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @classmethod
+    def build(cls, content, is_string, size=None, mtime=None):
+        """Build the index with a single pass over the frame headers of the (mmapped) content"""
+        offsets = []
+        natoms = []
+        comments = []
+
+        for start, _, fnatoms, comment_start, comment_end in _scan_headers(content, is_string):
+            offsets.append(start)
+            natoms.append(fnatoms)
+            comments.append(_decode(content[comment_start:comment_end], is_string))
+
+        return cls(offsets, natoms, comments, size, mtime)
+
+    @classmethod
+    def sidecar_path(cls, filename):
+        return filename + cls.SIDECAR_SUFFIX
+
+    @classmethod
+    def load(cls, filename, size, mtime):
+        """
+        Load the sidecar index of the given XYZ file,
+        returns None if there is none or if it does not match the given size and modification time.
+        """
+        try:
+            with open(cls.sidecar_path(filename), 'r') as fhandle:
+                data = json.load(fhandle)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if data.get('version') != cls.VERSION or data.get('size') != size or data.get('mtime') != mtime:
+            return None
+
+        return cls(data['offsets'], data['natoms'], data['comments'], size, mtime)
+
+    def save(self, filename):
+        """Write the index as sidecar of the given XYZ file, silently skipped if not possible"""
+        sidecar = self.sidecar_path(filename)
+
+        try:
+            # write to a temporary file first to never leave a partial index behind
+            with open(sidecar + '.tmp', 'w') as fhandle:
+                json.dump({
+                    'version': self.VERSION,
+                    'size': self.size,
+                    'mtime': self.mtime,
+                    'offsets': self.offsets.tolist(),
+                    'natoms': self.natoms.tolist(),
+                    'comments': self.comments,
+                    }, fhandle)
+            os.rename(sidecar + '.tmp', sidecar)
+        except (IOError, OSError):
+            pass
+
+    @classmethod
+    def for_content(cls, fh_or_string, content, is_string, sidecar=False):
+        """
+        Return the index for an already opened content. With `sidecar=True`
+        the sidecar is used (and updated) if the content comes from a file on disk.
+        """
+        filename = _filename(fh_or_string)
+
+        if filename is None:
+            return cls.build(content, is_string)
+
+        fstat = os.fstat(fh_or_string.fileno())
+
+        index = cls.load(filename, fstat.st_size, fstat.st_mtime) if sidecar else None
+
+        if index is None:
+            index = cls.build(content, is_string, fstat.st_size, fstat.st_mtime)
+            if sidecar:
+                index.save(filename)
+
+        return index
+
 
 class XYZParser:
     @staticmethod
-    def parse_iter(fh_or_string):
+    def parse_iter(fh_or_string, lazy=False):
         """Generates nested tuples for frames in XYZ files.
 
         Args:
             string: a string containing XYZ-structured text
+            lazy: locate the frames by their header only (see `iter_headers(...)`)
+                and validate and parse the atom entries only when iterating over them.
 
         Yields:
             tuple: `(natoms, comment, atomiter)` for each frame
             in the XYZ data where `atomiter` is an iterator yielding a
             nested tuple `(symbol, (x, y, z))` for each entry.
+            For a file handle, `atomiter` can only be consumed while the frames are being iterated over.
 
         Raises:
             TypeError: If the number of atoms specified for the frame does not match
@@ -124,64 +313,18 @@ class XYZParser:
             3
         """
 
-        class BlockIterator(object):
-            """
-            An iterator for wrapping the iterator returned by `match.finditer`
-            to extract the required fields directly from the match object
-            """
-            def __init__(self, it, natoms):
-                self._it = it
-                self._natoms = natoms
-                self._catom = 0
-
-            def __iter__(self):
-                return self
-
-            def __next__(self):
-                try:
-                    match = next(self._it)
-                except StopIteration:
-                    # if we reached the number of atoms declared, everything is well
-                    # and we re-raise the StopIteration exception
-                    if self._catom == self._natoms:
-                        raise
-                    else:
-                        # otherwise we got too less entries
-                        raise TypeError("Number of atom entries ({}) is smaller "
-                                        "than the number of atoms ({})".format(
-                                            self._catom, self._natoms))
-
-                self._catom += 1
-
-                if self._catom > self._natoms:
-                    raise TypeError("Number of atom entries ({}) is larger "
-                                    "than the number of atoms ({})".format(
-                                        self._catom, self._natoms))
-
-                return (
-                    match.group('sym'),
-                    (
-                        float(match.group('x')),
-                        float(match.group('y')),
-                        float(match.group('z'))
-                        ))
-
-            def next(self):
-                """
-                The iterator method expected by python 2.x,
-                implemented as python 3.x style method.
-                """
-                return self.__next__()
-
-
         with as_byteorstringlike(fh_or_string) as (content, is_string):
-            if is_string:
-                frame_match = re.compile(FRAME_MATCH_REGEX, re.MULTILINE | re.VERBOSE)
-                pos_match = re.compile(POS_MATCH_REGEX, re.MULTILINE | re.VERBOSE)
-            else:
-                # TODO: at this point we might have to care about the encoding of the content as well
-                frame_match = re.compile(FRAME_MATCH_REGEX.encode('utf8'), re.MULTILINE | re.VERBOSE)
-                pos_match = re.compile(POS_MATCH_REGEX.encode('utf8'), re.MULTILINE | re.VERBOSE)
+            frame_match = _compile(FRAME_MATCH_REGEX, is_string)
+            pos_match = _compile(POS_MATCH_REGEX, is_string)
+
+            if lazy:
+                for _, end, natoms, comment_start, comment_end in _scan_headers(content, is_string):
+                    yield (
+                        natoms,
+                        _decode(content[comment_start:comment_end], is_string),
+                        _lazy_atom_iter(content, comment_end + 1, end, natoms, pos_match, is_string)
+                        )
+                return
 
             for block in frame_match.finditer(content):
                 natoms = int(block.group('natoms'))
@@ -190,9 +333,30 @@ class XYZParser:
                     block.group('comment') if is_string else block.group('comment').decode('utf8'),
                     BlockIterator(
                         pos_match.finditer(block.group('positions')),
-                        natoms)
+                        natoms, is_string)
                     )
 
+    @staticmethod
+    def iter_headers(fh_or_string):
+        """Generates a tuple `(natoms, comment)` for each frame, without parsing the atom entries.
+
+        The frames are located by skipping the declared number of atom lines after each header,
+        the atom entries themselves are not validated. Content not starting with a frame header
+        (like an incomplete frame) is skipped up to the next valid frame, an incomplete frame
+        at the end is ignored.
+        """
+
+        with as_byteorstringlike(fh_or_string) as (content, is_string):
+            for _, _, natoms, comment_start, comment_end in _scan_headers(content, is_string):
+                yield natoms, _decode(content[comment_start:comment_end], is_string)
+
+    @staticmethod
+    def count_frames(fh_or_string):
+        """Count the frames, by reading only their headers (see `iter_headers(...)`)"""
+
+        with as_byteorstringlike(fh_or_string) as (content, is_string):
+            return sum(1 for _ in _scan_headers(content, is_string))
+
     @staticmethod
     def parse(fh_or_string):
         """
@@ -202,3 +366,541 @@ class XYZParser:
         return [{'natoms': natoms,
                  'comment': comment,
                  'atoms': list(atomiter)} for (natoms, comment, atomiter) in XYZParser.parse_iter(fh_or_string)]
+
+    @staticmethod
+    def index(fh_or_string, sidecar=False):
+        """
+        Return the XYZFrameIndex for the given content.
+        With `sidecar=True` and for files on disk a valid sidecar index is used if available,
+        otherwise it is (re-)created. Nothing is written next to the file by default.
+        """
+        with as_byteorstringlike(fh_or_string) as (content, is_string):
+            return XYZFrameIndex.for_content(fh_or_string, content, is_string, sidecar)
+
+    @staticmethod
+    def frames(fh_or_string, key, index=None):
+        """Random access to frames in XYZ files using a frame index.
+
+        Args:
+            fh_or_string: a file handle, string or bytes containing XYZ-structured text
+            key: an integer or a slice (including strides) selecting the frames
+            index: an XYZFrameIndex for the content (see `index(...)`), built if not given
+
+        Returns:
+            A single frame dict (for an integer key) or a list of frame dicts (for a slice),
+            in the same format as returned by `parse(...)`.
+        """
+
+        with as_byteorstringlike(fh_or_string) as (content, is_string):
+            if index is None:
+                index = XYZFrameIndex.for_content(fh_or_string, content, is_string)
+
+            frame_match = _compile(FRAME_MATCH_REGEX, is_string)
+            pos_match = _compile(POS_MATCH_REGEX, is_string)
+
+            if isinstance(key, slice):
+                return [_frame_dict(_match_at(frame_match, content, offset), pos_match, is_string)
+                        for offset in index.offsets[key].tolist()]
+
+            return _frame_dict(_match_at(frame_match, content, int(index.offsets[key])), pos_match, is_string)
+
+    @staticmethod
+    def frame(fh_or_string, num, index=None):
+        """The same as frames(...) but for a single frame number"""
+        return XYZParser.frames(fh_or_string, int(num), index)
+
+    @staticmethod
+    def last_n(fh_or_string, num):
+        """Return the last `num` complete frames without reading the rest of the content.
+
+        The content is scanned backwards from its end for frame headers and only
+        the frames found are parsed. An incomplete last frame (for example as left
+        behind by a killed job) is detected and skipped.
+
+        Args:
+            fh_or_string: a file handle, string or bytes containing XYZ-structured text
+            num: the (maximum) number of frames to return
+
+        Returns:
+            list: up to `num` frame dicts (in the same format as returned by `parse(...)`)
+            in the order they appear in the content.
+        """
+
+        frames = []
+
+        with as_byteorstringlike(fh_or_string) as (content, is_string):
+            pos_match = _compile(POS_MATCH_REGEX, is_string)
+
+            if num > 0:
+                for block in _reverse_frame_iter(content, is_string):
+                    frames.append(_frame_dict(block, pos_match, is_string))
+
+                    # stop before the iterator goes on scanning for the next frame
+                    if len(frames) == num:
+                        break
+
+        frames.reverse()
+        return frames
+
+    @staticmethod
+    def last_frame(fh_or_string):
+        """
+        The same as last_n(..., 1) but returns the frame dict directly.
+
+        Raises:
+            IndexError: If the content does not contain a complete frame.
+        """
+        frames = XYZParser.last_n(fh_or_string, 1)
+
+        if not frames:
+            raise IndexError("no complete frame found")
+
+        return frames[0]
+
+    @staticmethod
+    def pipeline(fh_or_string):
+        """Returns a lazy XYZPipeline over the frames, to filter and stride them without parsing skipped frames.
+
+        Examples:
+            >>> pipeline = XYZParser.pipeline(fhandle).dedup().stride(10).atoms(range(3))
+            >>> coords, symbols, comments = pipeline.arrays()
+        """
+        from .xyz_pipeline import XYZPipeline
+        return XYZPipeline(fh_or_string)
+
+    @staticmethod
+    def parse_arrays(fh_or_string, workers=1):
+        """Parse all frames of an XYZ trajectory into NumPy arrays.
+
+        In contrast to `parse_iter(...)` no Python objects are created per atom,
+        the coordinate block of each frame is converted directly by NumPy.
+        All frames must contain the same number of atoms and the symbols
+        are taken from the first frame.
+
+        Args:
+            fh_or_string: a file handle, string or bytes containing XYZ-structured text
+            workers: number of processes to parse the frames with. The parallel mode
+                is only available for files on disk, everything else is parsed serially.
+
+        Returns:
+            tuple: `(coords, symbols, comments)` where `coords` is a float64 array
+            of shape `(nframes, natoms, 3)`, `symbols` is an array of `natoms` strings
+            and `comments` a list with the comment of each frame.
+
+        Raises:
+            TypeError: If the number of atom entries in a frame does not match
+                the number of atoms declared, or if the number of atoms changes
+                between frames.
+            ValueError: If the last frame is incomplete (anything but white space
+                follows the last complete frame).
+        """
+
+        if workers > 1 and shared_memory is not None and _filename(fh_or_string) is not None:
+            with as_byteorstringlike(fh_or_string) as (content, _):
+                return _parse_arrays_parallel(fh_or_string, content, workers)
+
+        chunks = list(XYZParser.iter_arrays(fh_or_string))
+
+        if not chunks:
+            return np.empty((0, 0, 3)), np.empty((0, ), dtype=str), []
+
+        return (np.concatenate([c[0] for c in chunks]),
+                chunks[0][1],
+                [comment for c in chunks for comment in c[2]])
+
+    @staticmethod
+    def iter_arrays(fh_or_string, chunk_frames=1024):
+        """Parse the frames of an XYZ trajectory into NumPy arrays, in chunks of frames.
+
+        The same as `parse_arrays(...)`, but yields a tuple `(coords, symbols, comments)`
+        for every (up to) `chunk_frames` frames, to convert trajectories not fitting into memory.
+
+        Raises:
+            TypeError: If the number of atom entries in a frame does not match
+                the number of atoms declared, or if the number of atoms changes
+                between frames.
+            ValueError: If the last frame is incomplete.
+        """
+
+        coords = []
+        symbols = None
+        comments = []
+        end = 0  # end of the last complete frame
+
+        with as_byteorstringlike(fh_or_string) as (content, is_string):
+            frame_match = _compile(FRAME_MATCH_REGEX, is_string)
+            newline = '\n' if is_string else b'\n'
+
+            for block in frame_match.finditer(content):
+                natoms = int(block.group('natoms'))
+                positions = block.group('positions')
+
+                if symbols is None:
+                    symbols = _symbols_array(positions, is_string)
+                elif natoms != len(symbols):
+                    raise TypeError("Number of atoms ({}) differs from the number "
+                                    "of atoms in the first frame ({})".format(natoms, len(symbols)))
+
+                try:
+                    coords.append(_positions_array(positions, natoms, is_string))
+                except TypeError:
+                    # too few atom lines and no frame following: the content got cut off
+                    if positions.count(newline) < natoms and frame_match.search(content, block.end()) is None:
+                        _check_content_end(content, end)
+                    raise
+
+                comments.append(block.group('comment') if is_string else block.group('comment').decode('utf8'))
+                end = block.end()
+
+                if len(coords) == chunk_frames:
+                    yield np.stack(coords), symbols, comments
+                    coords = []
+                    comments = []
+
+            _check_content_end(content, end)
+
+            if coords:
+                yield np.stack(coords), symbols, comments
+
+
+def _frame_dict(block, pos_match, is_string):
+    """Convert a frame match object to the dict as returned by XYZParser.parse(...)"""
+    natoms = int(block.group('natoms'))
+
+    return {'natoms': natoms,
+            'comment': block.group('comment') if is_string else block.group('comment').decode('utf8'),
+            'atoms': list(BlockIterator(pos_match.finditer(block.group('positions')), natoms, is_string))}
+
+
+def _lazy_atom_iter(content, start, end, natoms, pos_match, is_string):
+    """
+    Iterate over the atom entries of the block content[start:end] only when iterated itself.
+
+    The block is copied out of the content first: a regex iterator running directly on a mmap
+    would keep it from being closed for as long as the iterator exists.
+    """
+    for atom in BlockIterator(pos_match.finditer(content[start:end]), natoms, is_string):
+        yield atom
+
+
+def _match_at(frame_match, content, offset):
+    """Match the frame at the given offset (from the frame index)"""
+    block = frame_match.match(content, offset)
+
+    if block is None:
+        raise TypeError("invalid frame at offset {}".format(offset))
+
+    return block
+
+
+def _decode(value, is_string):
+    return value if is_string else value.decode('utf8')
+
+
+def _scan_headers(content, is_string, start=0, stop=None):
+    """
+    Yields a tuple `(start, end, natoms, comment_start, comment_end)` for each frame
+    starting in `[start, stop)` by jumping from frame header to frame header:
+
+    The end of a frame is found by skipping `natoms` atom lines after the comment line,
+    commented out and blank lines in between are skipped as well (as in FRAME_MATCH_REGEX).
+    Since CP2K writes fixed-width atom lines, the size of the atom block is first guessed
+    from the previous frame and verified by counting the newlines in it and checking that it
+    contains no lines to skip (at C speed), only if that fails, the lines are read one by one.
+
+    If a line where a frame should start is not a number of atoms,
+    the regex for complete frames is used to resync with the next frame.
+    """
+
+    newline = '\n' if is_string else b'\n'
+
+    if isinstance(content, STRING_TYPES + (bytes, )):
+        count = lambda start, end: content.count(newline, start, end)
+    else:  # a mmap has no count(), but slicing it copies only the given block
+        count = lambda start, end: content[start:end].count(newline)
+
+    skip_line = _compile(SKIP_LINE_REGEX, is_string)
+    frame_match = None
+    block_size = None
+    block_natoms = None
+    size = len(content)
+    limit = size if stop is None else min(stop, size)
+    pos = start
+
+    while pos < limit:
+        eol = content.find(newline, pos)
+        if eol < 0:
+            return
+
+        try:
+            natoms = int(content[pos:eol])
+        except ValueError:
+            natoms = -1
+
+        if natoms < 0:
+            if frame_match is None:
+                frame_match = _compile(FRAME_MATCH_REGEX, is_string)
+
+            block = frame_match.search(content, eol + 1)
+            if block is None:
+                return
+
+            pos = block.start()
+            continue
+
+        comment_end = content.find(newline, eol + 1)
+        if comment_end < 0:
+            return
+
+        block_start = comment_end + 1
+        end = block_start + block_size if natoms == block_natoms else -1
+
+        if not (0 < end <= size and content[end - 1:end] == newline and count(block_start, end) == natoms
+                and not skip_line.search(content, comment_end, end)):
+            end = block_start
+            found = 0
+            while found < natoms:
+                line_end = content.find(newline, end)
+                if line_end < 0:
+                    return  # incomplete frame at the end
+
+                if not skip_line.match(content, end - 1, line_end + 1):
+                    found += 1
+                end = line_end + 1
+
+        yield pos, end, natoms, eol + 1, comment_end
+
+        block_size = end - block_start
+        block_natoms = natoms
+        pos = end
+
+
+def _check_content_end(content, end):
+    """Raise a ValueError if anything but white space follows the last complete frame ending at `end`"""
+    rest = content[end:]
+    stripped = rest.lstrip()
+
+    if stripped:
+        raise ValueError("incomplete frame at the end of the content "
+                         "(offset {})".format(end + len(rest) - len(stripped)))
+
+
+def _frame_complete(block, pos_match):
+    """Check whether the number of atom entries of a frame matches the number of atoms declared"""
+    natoms = int(block.group('natoms'))
+    return natoms == sum(1 for _ in pos_match.finditer(block.group('positions')))
+
+
+def _reverse_frame_iter(content, is_string):
+    """
+    Yields the match objects of all complete frames, starting with the last one,
+    by scanning the content backwards line by line for frame headers.
+    """
+
+    newline = '\n' if is_string else b'\n'
+    frame_match = _compile(FRAME_MATCH_REGEX, is_string)
+    pos_match = _compile(POS_MATCH_REGEX, is_string)
+    header_match = _compile(NATOMS_LINE_REGEX, is_string)
+
+    def _line_start(pos):
+        # start of the line ending at `pos` (pos - 1 being its newline or the end of the content)
+        return content.rfind(newline, 0, max(pos - 1, 0)) + 1
+
+    def _candidate(lstart, bound):
+        if not header_match.match(content, lstart):
+            return None
+
+        block = frame_match.match(content, lstart)
+
+        if block and block.end() <= bound and _frame_complete(block, pos_match):
+            return block
+
+        return None
+
+    bound = len(content)  # a frame must end before the start of the frame following it
+    pos = len(content)
+
+    while pos > 0:
+        lstart = _line_start(pos)
+        block = _candidate(lstart, bound)
+
+        if block:
+            # the line we found could also be the comment line (containing only a number)
+            # of the actual frame starting one line above, which then takes precedence
+            if lstart > 0:
+                previous = _candidate(_line_start(lstart), bound)
+                if previous and previous.end() == block.end():
+                    block = previous
+
+            yield block
+
+            bound = block.start()
+            lstart = block.start()
+
+        pos = lstart
+
+
+def _parse_arrays_parallel(fhandle, content, workers):
+    """
+    Parallel version of XYZParser.parse_arrays(...):
+    the file is split at byte offsets into consecutive ranges in which a pool of processes
+    looks for the frame headers, the frames found are then split in consecutive chunks which are
+    parsed by a second pool, directly into a coordinate array in shared memory.
+    """
+
+    # use more chunks than workers to balance the load
+    bounds = sorted(set(np.linspace(0, len(content), 4*workers + 1).astype(np.int64).tolist()))
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+
+    scans = _pool_map(workers, _scan_headers_chunk, [(fhandle.name, start, stop) for start, stop in ranges])
+    headers = _join_headers(content, ranges, scans)
+
+    _check_content_end(content, headers[-1][1] if headers else 0)
+
+    if not headers:
+        return np.empty((0, 0, 3)), np.empty((0, ), dtype=str), []
+
+    offsets = np.array([h[0] for h in headers], dtype=np.int64)
+    nframeatoms = np.array([h[2] for h in headers], dtype=np.int64)
+    natoms = int(nframeatoms[0])
+
+    if (nframeatoms != natoms).any():
+        raise TypeError("Number of atoms ({}) differs from the number "
+                        "of atoms in the first frame ({})".format(
+                            int(nframeatoms[nframeatoms != natoms][0]), natoms))
+
+    block = _compile(FRAME_MATCH_REGEX, False).match(content, int(offsets[0]))
+    symbols = _symbols_array(block.group('positions'), False)
+
+    shape = (len(offsets), natoms, 3)
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape))*8, 1))
+
+    try:
+        chunks = [(fhandle.name, shm.name, shape, int(frames[0]), offsets[frames].tolist())
+                  for frames in np.array_split(np.arange(len(offsets)), 4*workers) if len(frames)]
+
+        _pool_map(workers, _parse_arrays_chunk, chunks)
+
+        coords = np.array(np.ndarray(shape, dtype=np.float64, buffer=shm.buf))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return coords, symbols, [h[3] for h in headers]
+
+
+def _pool_map(workers, func, args):
+    """Run func over the args with a pool of processes, returns the results in order"""
+    import multiprocessing
+
+    # a new pool for every pass: the processes for the parsing must be started
+    # after the shared memory got created to share its resource tracking
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(func, args)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _join_headers(content, ranges, scans):
+    """
+    Join the frame headers found by _scan_headers_chunk(...) in the given byte ranges.
+
+    A worker has to guess where the first frame in its range starts (it may as well start
+    in the middle of the atom block of a frame). The guess is accepted if it matches the end
+    of the last frame found before, otherwise the range is scanned again from there.
+    """
+    headers = []
+    pos = 0
+
+    for (_, stop), scan in zip(ranges, scans):
+        if pos >= stop:
+            continue  # all of the range is covered by the last frame
+
+        if not scan or scan[0][0] != pos:
+            scan = [(start, end, natoms, _decode(content[comment_start:comment_end], False))
+                    for start, end, natoms, comment_start, comment_end
+                    in _scan_headers(content, False, pos, stop)]
+
+        if scan:
+            headers.extend(scan)
+            pos = scan[-1][1]
+
+    return headers
+
+
+def _scan_headers_chunk(args):
+    """
+    Worker for _parse_arrays_parallel(...), returns `(start, end, natoms, comment)`
+    for the frames starting within the given byte range, resyncing to the first frame header after its start
+    """
+    filename, start, stop = args
+
+    with open(filename, 'rb') as fhandle, as_byteorstringlike(fhandle) as (content, _):
+        if start > 0:  # start at the beginning of the next line
+            start = content.find(b'\n', start - 1) + 1 or len(content)
+
+        return [(fstart, end, natoms, _decode(content[comment_start:comment_end], False))
+                for fstart, end, natoms, comment_start, comment_end
+                in _scan_headers(content, False, start, stop)]
+
+
+def _parse_arrays_chunk(args):
+    """Worker for _parse_arrays_parallel(...), parses the frames at the given offsets into the shared array"""
+    filename, shm_name, shape, first, offsets = args
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        coords = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        frame_match = _compile(FRAME_MATCH_REGEX, False)
+
+        with open(filename, 'rb') as fhandle, as_byteorstringlike(fhandle) as (content, _):
+            for num, offset in enumerate(offsets, first):
+                block = frame_match.match(content, offset)
+                coords[num] = _positions_array(block.group('positions'), shape[1], False)
+
+        del coords  # release the exported buffer before closing the shared memory
+    finally:
+        shm.close()
+
+
+def _filename(fh_or_string):
+    """Return the name of the file on disk behind a file handle, None for anything else"""
+    filename = getattr(fh_or_string, 'name', None)
+
+    if isinstance(filename, STRING_TYPES) and os.path.isfile(filename):
+        return filename
+
+    return None
+
+
+def _compile(regex, is_string):
+    """Compile one of the module-level regexes for either string or byte-like content"""
+    if is_string:
+        return re.compile(regex, re.MULTILINE | re.VERBOSE)
+
+    # TODO: at this point we might have to care about the encoding of the content as well
+    return re.compile(regex.encode('utf8'), re.MULTILINE | re.VERBOSE)
+
+
+def _loadtxt(positions, is_string, **kwargs):
+    """Run the (C-implemented) np.loadtxt over a block of coordinate lines"""
+    return np.loadtxt(io.StringIO(positions) if is_string else io.BytesIO(positions),
+                      comments='#', ndmin=2, encoding='utf8', **kwargs)
+
+
+def _positions_array(positions, natoms, is_string):
+    """Convert the positions block of a frame into a (natoms, 3) float64 array"""
+    coords = _loadtxt(positions, is_string, usecols=(1, 2, 3), dtype=np.float64)
+
+    if coords.shape[0] != natoms:
+        raise TypeError("Number of atom entries ({}) does not match "
+                        "the number of atoms ({})".format(coords.shape[0], natoms))
+
+    return coords
+
+
+def _symbols_array(positions, is_string):
+    """Extract the symbols column of the positions block of a frame"""
+    return _loadtxt(positions, is_string, usecols=(0, ), dtype=str).ravel()
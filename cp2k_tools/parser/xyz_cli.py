@@ -2,65 +2,124 @@
 
 from __future__ import print_function
 
-import re
-import contextlib
-import mmap
-
 import click
 
-from .xyz import FRAME_MATCH_REGEX
 
-@contextlib.contextmanager
-def mmapped(fhandle):
-    fmapped = mmap.mmap(fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+@click.command()
+@click.argument('source', type=click.File('rb'))
+@click.argument('output', type=click.File('wb'))
+@click.option('--max-frames', type=click.IntRange(min=1), default=10000,
+              help=("Maximum number of frames to keep in flight, bounding the memory used (default: 10000). "
+                    "A restart can only drop frames which are still in flight, a warning is printed otherwise."))
+def xyz_restart_cleaner(source, output, max_frames):
+    """
+    Remove the frames from a CP2K XYZ trajectory which were re-run after a restart.
+
+    Frames are located by their header in the mmapped SOURCE (see XYZPipeline.dedup)
+    and written to OUTPUT as soon as they can no longer be dropped.
+    """
+
+    from .xyz import XYZParser
+
+    def on_flush(nflush, restart):
+        if restart is None:
+            click.echo("flushing remaining {flush} frames".format(flush=nflush))
+            return
+
+        iteration, ndrop, complete = restart
+        if not complete:
+            click.echo(
+                "WARNING: found earlier restart point than previous one, can not drop already flushed frames",
+                err=True)
+        click.echo(("found restart point @{iteration},"
+                    " dropping {drop} frames, flushing {flush}"
+                   ).format(flush=nflush, drop=ndrop, iteration=iteration))
+
+    XYZParser.pipeline(source).dedup(max_pending=max_frames, on_flush=on_flush).write(output)
+
+
+@click.command()
+@click.argument('source', type=click.File('rb'))
+@click.argument('store', type=click.Path(file_okay=False))
+@click.option('--single', 'dtype', flag_value='float32',
+              help="Store the coordinates in single precision.")
+@click.option('--double', 'dtype', flag_value='float64', default=True,
+              help="Store the coordinates in double precision (default).")
+@click.option('--append', is_flag=True,
+              help="Append the frames to an existing STORE instead of creating a new one.")
+@click.option('--chunk-frames', type=click.IntRange(min=1), default=1024,
+              help="Number of frames to convert at once (default: 1024).")
+def xyz2store(source, store, dtype, append, chunk_frames):
+    """
+    Convert the XYZ trajectory SOURCE to a binary STORE directory,
+    to be loaded with cp2k_tools.parser.XYZStore (memory mapped).
+    """
+
+    from .xyz_store import XYZStore
 
     try:
-        yield fmapped
-    finally:
-        fmapped.close()
+        xyzstore = XYZStore.from_xyz(source, store, dtype, append, chunk_frames)
+    except (TypeError, ValueError, EnvironmentError) as exc:
+        raise click.ClickException(str(exc))
 
+    click.echo("{store}: {nframes} frames of {natoms} atoms".format(
+        store=store, nframes=len(xyzstore), natoms=xyzstore.natoms))
 
-CP2K_COMMENT_MATCH = re.compile(r"""
-^[ \t]* i    [ ] = [ \t]+ (?P<iteration> \d+),
- [ \t]* time [ ] = [ \t]+ (?P<time> [\+\-]?  ( \d*[\.]\d+  | \d+[\.]?\d* )  ([Ee][\+\-]?\d+)? ),
- [ \t]* E    [ ] = [ \t]+ (?P<energy> [\+\-]?  ( \d*[\.]\d+  | \d+[\.]?\d* )  ([Ee][\+\-]?\d+)? )
-""", re.VERBOSE)
 
-# this one acts directly on the mmapped byte-like contnet:
-FRAME_MATCH = re.compile(FRAME_MATCH_REGEX.encode('utf8'), re.VERBOSE | re.MULTILINE)
+def _parse_ranges(ctx, param, value):
+    """Convert a list of indices and (inclusive) ranges like '0-9,12' to a list of indices"""
+    if value is None:
+        return None
+
+    try:
+        indices = []
+        for item in value.split(','):
+            first, _, last = item.partition('-')
+            indices += range(int(first), int(last or first) + 1)
+        return indices
+    except ValueError:
+        raise click.BadParameter("expected a list of (0-based) indices and ranges, like 0-9,12")
 
 
 @click.command()
 @click.argument('source', type=click.File('rb'))
 @click.argument('output', type=click.File('wb'))
-def xyz_restart_cleaner(source, output):
-    iteration = -1
-    frames_cache = []
-
-    with mmapped(source) as content:
-
-        for frame in FRAME_MATCH.finditer(content):
-            comment_match = CP2K_COMMENT_MATCH.match(frame.group('comment').decode('utf8'))
-
-            last_iteration = iteration
-            iteration = int(comment_match.group('iteration'))
-
-            if iteration <= last_iteration:
-                ndrop = last_iteration - iteration + 1
-                if ndrop > len(frames_cache):
-                    click.echo(
-                        "WARNING: found earlier restart point than previous one, can not drop already flushed frames",
-                        err=True)
-                nflush = max(0, len(frames_cache) - ndrop)  # we can't flush more than what's inside the cache
-                click.echo(("found restart point @{iteration},"
-                            " dropping {drop} frames, flushing {flush}"
-                           ).format(flush=nflush, drop=ndrop, iteration=last_iteration))
-                for cached_frame in frames_cache[:-ndrop]:
-                    output.write(cached_frame)
-                del frames_cache[:]  # .clear(), but compatible with python 2
-
-            frames_cache.append(frame.group(0))  # the 0. group is always the complete match
-
-        click.echo("flushing remaining {flush} frames".format(flush=len(frames_cache)))
-        for frame in frames_cache:
-            output.write(frame)
+@click.option('--dedup', is_flag=True,
+              help="Drop frames re-run after a restart (by their iteration number, as xyz_restart_cleaner).")
+@click.option('--from-time', type=float, default=None, help="Drop frames before this time [fs].")
+@click.option('--to-time', type=float, default=None, help="Drop frames after this time [fs].")
+@click.option('--stride', type=click.IntRange(min=1), default=1, help="Keep only every n-th frame (default: 1).")
+@click.option('--start', type=click.IntRange(min=0), default=0,
+              help="Index of the first frame to keep, after the other filters (default: 0).")
+@click.option('--atoms', callback=_parse_ranges, default=None,
+              help="Keep only the atoms with the given (0-based) indices, like 0-9,12 (default: all).")
+def xyz_filter(source, output, dedup, from_time, to_time, stride, start, atoms):
+    """
+    Write a filtered and/or downsampled copy of the XYZ trajectory SOURCE to OUTPUT.
+
+    The filters are applied in the order: dedup, time window, stride and atom selection.
+    Only the header of the dropped frames is read, the kept ones are copied verbatim.
+    """
+
+    from .xyz import XYZParser
+
+    pipeline = XYZParser.pipeline(source)
+
+    if dedup:
+        pipeline = pipeline.dedup()
+
+    if from_time is not None or to_time is not None:
+        pipeline = pipeline.time_window(from_time, to_time)
+
+    if stride > 1 or start > 0:
+        pipeline = pipeline.stride(stride, start)
+
+    if atoms is not None:
+        pipeline = pipeline.atoms(atoms)
+
+    try:
+        nframes = pipeline.write(output)
+    except IndexError as exc:
+        raise click.ClickException(str(exc))
+
+    click.echo("wrote {nframes} frames".format(nframes=nframes))
@@ -0,0 +1,283 @@
+"""
+Lazy filtering and striding of XYZ trajectories.
+
+Frames are located by their header only (the number of atoms and the comment line),
+the coordinate lines are skipped without parsing them. Only the frames passing
+all the stages of a pipeline get their coordinates parsed, or are copied verbatim.
+
+    >>> pipeline = XYZParser.pipeline(fhandle).time_window(100., 200.).stride(10)
+    >>> with open('filtered.xyz', 'wb') as output:
+    ...     pipeline.write(output)
+"""
+
+import io
+import itertools
+import collections
+
+import numpy as np
+
+from .xyz import (as_byteorstringlike, BlockIterator, POS_MATCH_REGEX, CP2K_COMMENT_MATCH,
+                  _compile, _scan_headers, _positions_array, _symbols_array)
+
+
+class XYZFrameRef(object):
+    """
+    A frame referenced by its position in the (mmapped) content of a trajectory.
+    Only valid while iterating over the pipeline which generated it.
+    """
+
+    def __init__(self, content, is_string, start, end, natoms, comment_span, atoms=None):
+        self.content = content
+        self.is_string = is_string
+        self.start = start
+        self.end = end
+        self.natoms = natoms
+        self.comment_span = comment_span
+        self.atoms = atoms  # selected atom indices, all if None
+        self._fields = None
+
+    @property
+    def nselected(self):
+        """The number of (selected) atoms"""
+        return self.natoms if self.atoms is None else len(self.atoms)
+
+    @property
+    def comment(self):
+        comment = self.content[self.comment_span[0]:self.comment_span[1]]
+        return comment if self.is_string else comment.decode('utf8')
+
+    @property
+    def fields(self):
+        """The iteration, time and energy from a CP2K comment line or None"""
+
+        if self._fields is None:
+            match = CP2K_COMMENT_MATCH.match(self.comment)
+            self._fields = {
+                'iteration': int(match.group('iteration')),
+                'time': float(match.group('time')),
+                'energy': float(match.group('energy')),
+                } if match else {}
+
+        return self._fields or None
+
+    def select(self, atoms):
+        """Returns the frame restricted to the given atom indices"""
+        if self.atoms is not None:
+            atoms = [self.atoms[i] for i in atoms]
+        return XYZFrameRef(self.content, self.is_string, self.start, self.end,
+                           self.natoms, self.comment_span, list(atoms))
+
+    def positions(self):
+        """The block of (selected) coordinate lines of the frame"""
+        positions = self.content[self.comment_span[1] + 1:self.end]
+
+        if self.atoms is None:
+            return positions
+
+        newline, comment = ('\n', '#') if self.is_string else (b'\n', b'#')
+        # only the atom lines, without commented out and blank lines (and the empty string after the last newline)
+        lines = [line for line in positions.split(newline) if line.strip() and not line.lstrip().startswith(comment)]
+        return newline.join(lines[i] for i in self.atoms) + newline
+
+    def raw(self):
+        """The frame as it appears in the trajectory, but with only the selected atoms"""
+
+        if self.atoms is None:
+            return self.content[self.start:self.end]
+
+        header = '%8i\n' % len(self.atoms)
+        return ((header if self.is_string else header.encode('utf8'))
+                + self.content[self.comment_span[0]:self.comment_span[1] + 1]
+                + self.positions())
+
+    def arrays(self):
+        """Returns a tuple `(coords, symbols)` of the (selected) atoms"""
+        positions = self.positions()
+        return _positions_array(positions, self.nselected, self.is_string), _symbols_array(positions, self.is_string)
+
+    def to_dict(self):
+        """The frame in the format returned by XYZParser.parse(...)"""
+        pos_match = _compile(POS_MATCH_REGEX, self.is_string)
+
+        return {'natoms': self.nselected,
+                'comment': self.comment,
+                'atoms': list(BlockIterator(pos_match.finditer(self.positions()), self.nselected, self.is_string))}
+
+
+def _scan_frames(content, is_string):
+    """Yields a XYZFrameRef for each frame, by reading only the header of each frame"""
+
+    for start, end, natoms, comment_start, comment_end in _scan_headers(content, is_string):
+        yield XYZFrameRef(content, is_string, start, end, natoms, (comment_start, comment_end))
+
+
+class XYZPipeline(object):
+    """
+    A lazy pipeline of frame filters, use `XYZParser.pipeline(...)` to create one.
+    Each stage returns a new pipeline, nothing is read before iterating over it.
+    """
+
+    def __init__(self, fh_or_string, stages=()):
+        self._source = fh_or_string
+        self._stages = tuple(stages)
+
+    def _add(self, stage):
+        return XYZPipeline(self._source, self._stages + (stage, ))
+
+    def stride(self, step, start=0):
+        """Only keep every step-th frame, beginning with the frame at index start"""
+        if step < 1 or start < 0:
+            raise ValueError("step must be positive and start non-negative")
+        return self._add(lambda frames: itertools.islice(frames, start, None, step))
+
+    def time_window(self, start=None, stop=None, field='time'):
+        """
+        Only keep frames whose CP2K comment field (time, iteration or energy)
+        is within [start, stop]. Frames without a CP2K comment line are dropped.
+        """
+        if field not in ('time', 'iteration', 'energy'):
+            raise ValueError("invalid field: {}".format(field))
+
+        def _stage(frames):
+            for frame in frames:
+                fields = frame.fields
+                if fields is None:
+                    continue
+                if (start is None or fields[field] >= start) and (stop is None or fields[field] <= stop):
+                    yield frame
+        return self._add(_stage)
+
+    def atoms(self, indices):
+        """Only keep the atoms with the given (0-based) indices, in the given order.
+        Negative indices count from the end, as for lists."""
+        indices = list(indices)
+
+        def _stage(frames):
+            for frame in frames:
+                natoms = frame.nselected
+                for idx in indices:
+                    if not -natoms <= idx < natoms:
+                        raise IndexError("atom index {} out of range for a frame of {} atoms".format(idx, natoms))
+                yield frame.select([idx % natoms for idx in indices])
+        return self._add(_stage)
+
+    def dedup(self, keep='last', max_pending=None, on_flush=None):
+        """
+        Drop the frames re-run after a restart, found by their CP2K iteration not being larger
+        than the one of the previous frame. Frames without a CP2K comment line are always kept.
+
+        Args:
+            keep: 'last' to keep the frames of the re-run and drop the frames written before
+                  the restart from the same iteration on (as done by the xyz_restart_cleaner),
+                  which holds back the frames since the last restart until the next one.
+                  'first' to keep the frames written first and drop the re-run ones instead,
+                  without holding back any frames.
+            max_pending: with keep='last', the maximum number of frames to hold back (default: all
+                  since the last restart). Older frames are passed on and can not be dropped anymore.
+            on_flush: with keep='last', called with `(nflushed, restart)` before held back frames
+                  are passed on: at each restart with `restart` being a tuple
+                  `(last_iteration, ndropped, complete)`, where `complete` is False if frames from
+                  the iteration of the restart on may have been passed on already, and with
+                  `restart=None` for the frames remaining at the end.
+        """
+        if keep not in ('last', 'first'):
+            raise ValueError("invalid keep: {}, must be 'last' or 'first'".format(keep))
+
+        def _keep_first(frames):
+            last = None
+            for frame in frames:
+                fields = frame.fields
+                if fields is not None:
+                    if last is not None and fields['iteration'] <= last:
+                        continue
+                    last = fields['iteration']
+                yield frame
+
+        def _keep_last(frames):
+            last = None
+            pending = collections.deque()  # the frames since the last restart
+            for frame in frames:
+                fields = frame.fields
+                if fields is not None:
+                    if last is not None and fields['iteration'] <= last:
+                        # the frames from the iteration of the restart on were re-run
+                        restart = fields['iteration']
+                        kept = [p for p in pending if p.fields is None or p.fields['iteration'] < restart]
+                        first = next((p.fields['iteration'] for p in pending if p.fields is not None), None)
+
+                        if on_flush is not None:
+                            complete = first is not None and first <= restart
+                            on_flush(len(kept), (last, len(pending) - len(kept), complete))
+
+                        for previous in kept:
+                            yield previous
+                        pending.clear()
+                    last = fields['iteration']
+                pending.append(frame)
+
+                # frames falling out of the window can not be dropped anymore
+                if max_pending is not None and len(pending) > max_pending:
+                    yield pending.popleft()
+
+            if on_flush is not None:
+                on_flush(len(pending), None)
+
+            for frame in pending:
+                yield frame
+
+        return self._add(_keep_last if keep == 'last' else _keep_first)
+
+    def __iter__(self):
+        with as_byteorstringlike(self._source) as (content, is_string):
+            frames = _scan_frames(content, is_string)
+
+            for stage in self._stages:
+                frames = stage(frames)
+
+            for frame in frames:
+                yield frame
+
+    def frames(self):
+        """Yields the frames as dicts, in the format of XYZParser.parse(...)"""
+        for frame in self:
+            yield frame.to_dict()
+
+    def arrays(self):
+        """Returns a tuple `(coords, symbols, comments)` as XYZParser.parse_arrays(...)"""
+        coords = []
+        symbols = None
+        comments = []
+
+        for frame in self:
+            fcoords, fsymbols = frame.arrays()
+            if symbols is None:
+                symbols = fsymbols
+            elif len(fsymbols) != len(symbols):
+                raise TypeError("Number of atoms ({}) differs from the number "
+                                "of atoms in the first frame ({})".format(len(fsymbols), len(symbols)))
+            coords.append(fcoords)
+            comments.append(frame.comment)
+
+        if symbols is None:
+            return np.empty((0, 0, 3)), np.empty((0, ), dtype=str), comments
+
+        return np.stack(coords), symbols, comments
+
+    def write(self, fh):
+        """Write the frames (verbatim, except for the atom selection) to the given file handle"""
+
+        text = isinstance(fh, io.TextIOBase)
+        count = 0
+
+        for frame in self:
+            raw = frame.raw()
+
+            if frame.is_string and not text:
+                raw = raw.encode('utf8')
+            elif not frame.is_string and text:
+                raw = raw.decode('utf8')
+
+            fh.write(raw)
+            count += 1
+
+        return count
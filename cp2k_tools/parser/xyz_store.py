@@ -0,0 +1,208 @@
+"""
+A binary store for XYZ trajectories, to avoid re-parsing the text files for every analysis.
+
+The store is a directory containing:
+
+    meta.json     the number of frames and atoms, the coordinate dtype and the (interned) symbols
+    coords.bin    the raw coordinates as a C-ordered (nframes, natoms, 3) array
+    comments.txt  the UTF-8 encoded comment of each frame, one per line
+
+The coordinates are read via `np.memmap`, accessing frames does not read the whole file.
+Frames can be appended, the frame count in meta.json gets updated last,
+data of an interrupted append is therefore ignored and overwritten by the next one.
+"""
+
+import os
+import json
+
+import numpy as np
+
+from .xyz import XYZParser
+
+
+class XYZStore(object):
+    VERSION = 1
+    META = 'meta.json'
+    COORDS = 'coords.bin'
+    COMMENTS = 'comments.txt'
+
+    DTYPES = ('float32', 'float64')
+
+    def __init__(self, path):
+        """Open an existing store, use `XYZStore.create(...)` to create a new one"""
+
+        self.path = path
+
+        with open(os.path.join(path, self.META), 'r') as fhandle:
+            meta = json.load(fhandle)
+
+        if meta.get('version') != self.VERSION:
+            raise ValueError("unsupported XYZ store version: {}".format(meta.get('version')))
+
+        self._nframes = meta['nframes']
+        self._comments_size = meta['comments_size']
+        self._dtype = np.dtype(meta['dtype']).newbyteorder('<')
+        self._kinds = meta['kinds']
+        self._symbol_kinds = np.array(meta['symbols'], dtype=np.intp)
+        self._coords = None
+        self._comments = None
+
+    @classmethod
+    def create(cls, path, symbols, dtype='float64'):
+        """Create a new (empty) store for a trajectory of the given symbols
+
+        Args:
+            path: the directory to create
+            symbols: the atom symbols, the same for all frames
+            dtype: the dtype to store the coordinates with, `float32` or `float64`
+        """
+
+        if np.dtype(dtype).name not in cls.DTYPES:
+            raise ValueError("unsupported coordinate dtype: {}".format(dtype))
+
+        # intern the symbols, a trajectory usually contains only a few different kinds
+        kinds, symbol_kinds = np.unique(np.asarray(symbols, dtype=str), return_inverse=True)
+
+        os.makedirs(path)
+        open(os.path.join(path, cls.COORDS), 'wb').close()
+        open(os.path.join(path, cls.COMMENTS), 'wb').close()
+
+        cls._write_meta(path, {
+            'version': cls.VERSION,
+            'nframes': 0,
+            'comments_size': 0,
+            'natoms': len(symbol_kinds),
+            'dtype': np.dtype(dtype).name,
+            'kinds': kinds.tolist(),
+            'symbols': symbol_kinds.tolist(),
+            })
+
+        return cls(path)
+
+    @classmethod
+    def _write_meta(cls, path, meta):
+        tmppath = os.path.join(path, cls.META + '.tmp')
+        with open(tmppath, 'w') as fhandle:
+            json.dump(meta, fhandle)
+        os.rename(tmppath, os.path.join(path, cls.META))
+
+    def __len__(self):
+        return self._nframes
+
+    @property
+    def natoms(self):
+        return len(self._symbol_kinds)
+
+    @property
+    def symbols(self):
+        return np.array(self._kinds, dtype=str)[self._symbol_kinds]
+
+    @property
+    def coords(self):
+        """The read-only memory mapped (nframes, natoms, 3) coordinates"""
+
+        if self._coords is None:
+            if self._nframes == 0:  # mmap does not support empty files
+                self._coords = np.empty((0, self.natoms, 3), dtype=self._dtype)
+            else:
+                self._coords = np.memmap(os.path.join(self.path, self.COORDS), dtype=self._dtype, mode='r',
+                                         shape=(self._nframes, self.natoms, 3))
+
+        return self._coords
+
+    @property
+    def comments(self):
+        if self._comments is None:
+            with open(os.path.join(self.path, self.COMMENTS), 'rb') as fhandle:
+                content = fhandle.read(self._comments_size).decode('utf8')
+            self._comments = content.split('\n')[:-1]
+
+        return self._comments
+
+    def __getitem__(self, key):
+        """Returns the coordinates of the frame(s), a view on the memory mapped file"""
+        return self.coords[key]
+
+    def append(self, coords, comments=None):
+        """Append frames to the store
+
+        Args:
+            coords: array-like of shape `(nframes, natoms, 3)` or `(natoms, 3)` for a single frame
+            comments: optional list of the comments of the frames
+
+        Raises:
+            TypeError: If the number of atoms does not match the store or the number
+                of comments does not match the number of frames.
+        """
+
+        coords = np.asarray(coords)
+        if coords.ndim == 2:
+            coords = coords[np.newaxis]
+
+        if coords.ndim != 3 or coords.shape[1:] != (self.natoms, 3):
+            raise TypeError("coords must be of shape (nframes, {}, 3), got {}".format(self.natoms, coords.shape))
+
+        if comments is None:
+            comments = [''] * len(coords)
+        elif len(comments) != len(coords):
+            raise TypeError("number of comments ({}) does not match the number of frames ({})"
+                            .format(len(comments), len(coords)))
+
+        if any('\n' in comment for comment in comments):
+            raise ValueError("comments can not contain newlines")
+
+        framesize = self.natoms * 3 * self._dtype.itemsize
+
+        with open(os.path.join(self.path, self.COORDS), 'r+b') as fhandle:
+            # drop data left over by an interrupted append
+            fhandle.truncate(self._nframes * framesize)
+            fhandle.seek(0, os.SEEK_END)
+            np.ascontiguousarray(coords, dtype=self._dtype).tofile(fhandle)
+
+        comments = u''.join(u'{}\n'.format(comment) for comment in comments).encode('utf8')
+
+        with open(os.path.join(self.path, self.COMMENTS), 'r+b') as fhandle:
+            fhandle.truncate(self._comments_size)
+            fhandle.seek(0, os.SEEK_END)
+            fhandle.write(comments)
+
+        with open(os.path.join(self.path, self.META), 'r') as fhandle:
+            meta = json.load(fhandle)
+
+        meta['nframes'] = self._nframes + len(coords)
+        meta['comments_size'] = self._comments_size + len(comments)
+        self._write_meta(self.path, meta)
+
+        self._nframes = meta['nframes']
+        self._comments_size = meta['comments_size']
+        self._coords = None
+        self._comments = None
+
+    @classmethod
+    def from_xyz(cls, fh_or_string, path, dtype='float64', append=False, chunk_frames=1024):
+        """Convert an XYZ trajectory to a store, chunk by chunk
+
+        Args:
+            fh_or_string: a file handle, string or bytes containing XYZ-structured text
+            path: the directory of the store
+            dtype: the dtype to store the coordinates with (for a new store)
+            append: append the frames to an existing store instead of creating a new one
+
+        Raises:
+            TypeError: If the number of atoms in a frame changes or does not match the store.
+        """
+
+        store = cls(path) if append else None
+
+        for coords, symbols, comments in XYZParser.iter_arrays(fh_or_string, chunk_frames):
+            if store is None:
+                store = cls.create(path, symbols, dtype)
+            elif not np.array_equal(store.symbols, symbols):
+                raise TypeError("the symbols of the trajectory do not match the ones in the store")
+
+            store.append(coords, comments)
+
+        if store is None:
+            raise ValueError("no frames found to create the store from")
+
+        return store
@@ -0,0 +1,390 @@
+"""
+Broadening of discrete (P)DOS eigenvalues to a smooth curve with gaussians.
+
+The result is the same as evaluating, for every mesh point `x`,
+
+    sum_j exp(-(x - e_j)^2 / (2 sigma^2)) / (sigma sqrt(2 pi)) * de * w_j
+
+with the eigenvalues `e_j`, their weights (orbital projections) `w_j` and the mesh spacing `de`,
+like the original (Fortran) PDOS tool. The available methods are:
+
+    direct  the full (nmesh x nMO) gaussian matrix, evaluated in blocks of mesh points
+            to limit the memory usage. Exact (up to floating point rounding), O(nmesh * nMO).
+
+    window  like direct, but only the eigenvalues within `cutoff` sigmas of a block of
+            mesh points are taken into account (using the sorted eigenvalues).
+            The relative error is below exp(-cutoff^2/2), i.e. 2e-22 for the default cutoff of 10.
+            O(nmesh * nMO_in_window) which is usually much less than for direct.
+
+    fft     the weights are distributed to the two nearest mesh points (linear binning) and then
+            convolved with the gaussian sampled on the mesh, using FFTs. O(N log N) with N = nmesh.
+            The binning broadens each gaussian by at most de^2/4 in variance, the relative error
+            of the peaks is therefore about (de/sigma)^2/8 (3e-4 for de = sigma/20).
+            Requires an equidistant mesh.
+
+The broadened curves can be written with `write_table(...)` as text (in the format
+of the cp2k_pdos.py script) or with `save_table(...)` also as binary NumPy files.
+
+For batch processing, `group_pdos_files(...)` groups the PDOS files of many calculations
+by their project name and `batch_broaden(...)` broadens all the files of a calculation
+in parallel on a common energy mesh.
+"""
+
+import io
+import os
+import re
+import gzip
+import warnings
+import functools
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+
+
+METHODS = ('direct', 'window', 'fft')
+
+HEADER_MATCH = re.compile(
+    r'\# Projected DOS for atomic kind (?P<element>\w+) at iteration step i = \d+, E\(Fermi\) = [ \t]* (?P<Efermi>[^\t ]+) a\.u\.')
+
+# the names of the PDOS files written by CP2K: <project>-[ALPHA_|BETA_]k<kind>-<step>.pdos,
+# with a new step for each time the PDOS got printed (for example during an MD or GEO_OPT)
+FILENAME_MATCH = re.compile(r'^(?P<project>.+?)-(?:(?P<spin>ALPHA|BETA)_)?k(?P<kind>\d+)-(?P<step>\d+)\.pdos$')
+
+# Column indexes, starting from 0
+EIGENVALUE_COLUMN = 1
+DENSITY_COLUMN = 3
+
+# limit for the number of elements of the temporary gaussian matrices
+_BLOCK_ELEMENTS = 1 << 22
+
+# number of values formatted at once by write_table(...)
+_WRITE_CHUNK_ELEMENTS = 1 << 16
+
+# whether np.loadtxt has the fast reader, used by read_pdos(...)
+_FAST_LOADTXT = np.lib.NumpyVersion(np.__version__) >= '1.23.0'
+
+# the formats supported by save_table(...), by filename extension
+TABLE_FORMATS = ('text', 'gz', 'npy', 'npz')
+
+
+def energy_mesh(eigenvalues, sigma, de, margin=10.):
+    """
+    Returns an equidistant energy mesh with spacing de, covering all the given eigenvalues
+    with an additional margin of `margin*sigma` to not cut off gaussians at the borders.
+    """
+
+    emin = np.min(eigenvalues) - margin*sigma
+    emax = np.max(eigenvalues) + margin*sigma
+    nmesh = int((emax-emin)/de)+1  # calculate manually instead of using np.arange to ensure emax inside the mesh
+    return np.linspace(emin, emax, nmesh)
+
+
+def broaden(eigenvalues, weights, xmesh, sigma, method='window', cutoff=10., de=None):
+    """Broaden the eigenvalues with the given weights on the mesh with gaussians of width sigma.
+
+    Args:
+        eigenvalues: array of shape (nMO, )
+        weights: array of shape (nMO, ncols), the weights of each eigenvalue for each column
+        xmesh: the (equidistant) mesh of shape (nmesh, ), for example from energy_mesh(...)
+        sigma: the width of the gaussians
+        method: one of 'direct', 'window' or 'fft', see the module documentation for their accuracy
+        cutoff: number of sigmas after which a gaussian is considered zero (for 'window' and 'fft')
+        de: the integration step to scale the gaussians with, defaults to the spacing of the mesh
+            (which can differ slightly from the step the mesh was created with by energy_mesh(...))
+
+    Returns:
+        array of shape (nmesh, ncols)
+    """
+
+    eigenvalues = np.asarray(eigenvalues, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    xmesh = np.asarray(xmesh, dtype=float)
+
+    if weights.ndim == 1:
+        return broaden(eigenvalues, weights[:, np.newaxis], xmesh, sigma, method, cutoff, de)[:, 0]
+
+    if weights.shape[0] != eigenvalues.shape[0]:
+        raise TypeError("number of weights ({}) does not match the number of eigenvalues ({})"
+                        .format(weights.shape[0], eigenvalues.shape[0]))
+
+    if method not in METHODS:
+        raise ValueError("invalid broadening method '{}', must be one of: {}".format(method, ", ".join(METHODS)))
+
+    if len(xmesh) < 2:
+        raise ValueError("the mesh must contain at least two points")
+
+    if de is None:
+        de = (xmesh[-1] - xmesh[0])/(len(xmesh) - 1)
+
+    fact = de/(sigma*np.sqrt(2.0*np.pi))
+
+    if method == 'fft':
+        return _broaden_fft(eigenvalues, weights, xmesh, sigma, cutoff)*fact
+
+    if method == 'window':
+        order = np.argsort(eigenvalues, kind='stable')
+        eigenvalues = eigenvalues[order]
+        weights = weights[order]
+
+    ymesh = np.zeros((len(xmesh), weights.shape[1]))
+    block = max(1, _BLOCK_ELEMENTS // max(1, len(eigenvalues)))
+
+    for start in range(0, len(xmesh), block):
+        xblock = xmesh[start:start+block]
+
+        if method == 'window':
+            lower, upper = np.searchsorted(eigenvalues, [xblock[0] - cutoff*sigma, xblock[-1] + cutoff*sigma])
+        else:
+            lower, upper = 0, len(eigenvalues)
+
+        if lower == upper:
+            continue
+
+        gauss = np.exp(-(xblock[:, np.newaxis] - eigenvalues[np.newaxis, lower:upper])**2/(2.0*sigma**2))
+        ymesh[start:start+block] = gauss.dot(weights[lower:upper])
+
+    return ymesh*fact
+
+
+def _broaden_fft(eigenvalues, weights, xmesh, sigma, cutoff):
+    nmesh = len(xmesh)
+    de = (xmesh[-1] - xmesh[0])/(nmesh - 1)
+
+    # linear binning: split each weight among the two neighbouring mesh points
+    pos = (eigenvalues - xmesh[0])/de
+    left = np.floor(pos).astype(int)
+    frac = (pos - left)[:, np.newaxis]
+
+    # extend the binning grid by the kernel size to not lose contributions of eigenvalues outside the mesh
+    nkernel = int(np.ceil(cutoff*sigma/de))
+    offset = nkernel + 1
+    nbins = nmesh + 2*offset
+
+    inside = (left + offset >= 0) & (left + offset + 1 < nbins)
+    bins = np.zeros((nbins, weights.shape[1]))
+    np.add.at(bins, left[inside] + offset, weights[inside]*(1. - frac[inside]))
+    np.add.at(bins, left[inside] + offset + 1, weights[inside]*frac[inside])
+
+    kernel = np.exp(-(np.arange(-nkernel, nkernel+1)*de)**2/(2.0*sigma**2))
+
+    # linear (not circular) convolution by zero-padding to at least nbins + len(kernel) - 1
+    nfft = 1 << int(np.ceil(np.log2(nbins + len(kernel) - 1)))
+    convolved = np.fft.irfft(np.fft.rfft(bins, nfft, axis=0) * np.fft.rfft(kernel, nfft)[:, np.newaxis],
+                             nfft, axis=0)
+
+    # the kernel is centered at index nkernel
+    return convolved[offset + nkernel:offset + nkernel + nmesh]
+
+
+def write_table(fhandle, xmesh, ymesh, headers=None):
+    """Write the mesh and the curves as a text table, one mesh point per line
+
+    The values are formatted with `{:16.8f}` and separated by a space, many lines at once
+    using a format string for a whole chunk of lines instead of formatting each value separately.
+
+    Args:
+        fhandle: text file handle to write to
+        xmesh: array of shape (nmesh, )
+        ymesh: array of shape (nmesh, ncols)
+        headers: optional list of the names of the ncols columns, for a header line
+    """
+
+    xmesh = np.asarray(xmesh, dtype=float)
+    ymesh = np.asarray(ymesh, dtype=float)
+
+    if ymesh.ndim == 1:
+        ymesh = ymesh[:, np.newaxis]
+
+    if ymesh.shape[0] != xmesh.shape[0]:
+        raise TypeError("number of mesh points ({}) does not match the number of rows ({})"
+                        .format(xmesh.shape[0], ymesh.shape[0]))
+
+    ncols = ymesh.shape[1]
+
+    if headers is not None:
+        if len(headers) != ncols:
+            raise TypeError("number of headers ({}) does not match the number of columns ({})"
+                            .format(len(headers), ncols))
+        fhandle.write(("{:>16}" + " {:>16}"*ncols + "\n").format("Energy_[eV]", *headers))
+
+    table = np.column_stack((xmesh, ymesh))
+    line_fmt = "%16.8f" + " %16.8f"*ncols + "\n"  # identical to "{:16.8f}" for floats
+    nlines = max(1, _WRITE_CHUNK_ELEMENTS // (ncols + 1))
+
+    for start in range(0, len(table), nlines):
+        chunk = table[start:start+nlines]
+        fhandle.write((line_fmt*len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
+def save_table(filename, xmesh, ymesh, headers=None, fmt=None):
+    """Save the mesh and the curves to a file, in the format given by fmt or the filename extension
+
+    The formats are:
+
+        text  the table from write_table(...)
+        gz    the same, gzip compressed
+        npy   a single array of shape (nmesh, 1 + ncols) with the mesh as the first column (without headers)
+        npz   a compressed NumPy archive with the arrays `energy`, `pdos` and `headers`
+    """
+
+    if fmt is None:
+        fmt = os.path.splitext(filename)[1].lstrip('.')
+        if fmt not in TABLE_FORMATS:
+            fmt = 'text'
+
+    if fmt not in TABLE_FORMATS:
+        raise ValueError("invalid table format '{}', must be one of: {}".format(fmt, ", ".join(TABLE_FORMATS)))
+
+    # pass file handles to NumPy, it would otherwise append the extension if missing
+    if fmt == 'npy':
+        with open(filename, 'wb') as fhandle:
+            np.save(fhandle, np.column_stack((xmesh, ymesh)))
+    elif fmt == 'npz':
+        with open(filename, 'wb') as fhandle:
+            np.savez_compressed(fhandle, energy=xmesh, pdos=ymesh,
+                                headers=np.array(headers if headers is not None else [], dtype=str))
+    elif fmt == 'gz':
+        with io.TextIOWrapper(gzip.open(filename, 'wb')) as fhandle:
+            write_table(fhandle, xmesh, ymesh, headers)
+    else:
+        with open(filename, 'w') as fhandle:
+            write_table(fhandle, xmesh, ymesh, headers)
+
+
+def read_pdos(fhandle):
+    """Read a CP2K PDOS file
+
+    Returns:
+        a tuple `(element, efermi, header, data)` with the column names in header
+        (starting with 'MO', 'Eigenvalue [a.u.]', 'Occupation', followed by the orbitals)
+        and data the array of shape (nMO, ncols)
+
+    Raises:
+        ValueError: If the file does not look like a CP2K PDOS file.
+    """
+
+    match = HEADER_MATCH.match(fhandle.readline().rstrip())
+    if not match:
+        raise ValueError("not a CP2K PDOS file")
+
+    # header is originally: ['#', 'MO', 'Eigenvalue', '[a.u.]', 'Occupation', 's', 'py', ...]
+    header = fhandle.readline().rstrip().split()[1:]  # remove the comment directly
+    header[1:3] = [' '.join(header[1:3])]  # rejoin "Eigenvalue" and its unit
+
+    # the rest is a plain table of floats: np.loadtxt has a fast reader (written in C) since numpy 1.23,
+    # for older versions converting the whole table in one go is much faster than np.loadtxt
+    # (see benchmarks/pdos_read.py)
+    if _FAST_LOADTXT:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)  # an empty table is not an error
+            try:
+                data = np.loadtxt(fhandle, ndmin=2)
+            except ValueError as exc:
+                raise ValueError("invalid PDOS data: {}".format(exc))
+
+        if data.size and data.shape[1] != len(header):
+            raise ValueError("invalid PDOS data, expected {} columns".format(len(header)))
+
+        return match.group('element'), float(match.group('Efermi')), header, data.reshape(-1, len(header))
+
+    try:
+        data = np.array(fhandle.read().split(), dtype=float)
+    except ValueError as exc:
+        raise ValueError("invalid PDOS data: {}".format(exc))
+
+    if data.size % len(header):
+        raise ValueError("invalid PDOS data, expected {} columns".format(len(header)))
+
+    return match.group('element'), float(match.group('Efermi')), header, data.reshape(-1, len(header))
+
+
+def group_pdos_files(filenames):
+    """Group the PDOS files by calculation (directory, project name and print step)
+
+    Returns:
+        an OrderedDict mapping the calculation (the path of the files without the
+        kind/spin suffix, `<directory>/<project>-<step>`) to the list of its PDOS files,
+        ordered by kind and spin (alpha first).
+        Files with a name not following the CP2K naming scheme are a calculation of their own.
+    """
+
+    groups = OrderedDict()
+
+    for filename in filenames:
+        match = FILENAME_MATCH.match(os.path.basename(filename))
+
+        if match:
+            calculation = os.path.join(os.path.dirname(filename),
+                                       '{}-{}'.format(match.group('project'), match.group('step')))
+            key = (int(match.group('kind')), match.group('spin') == 'BETA')
+        else:
+            calculation = os.path.splitext(filename)[0]
+            key = (0, False)
+
+        groups.setdefault(calculation, []).append((key, filename))
+
+    return OrderedDict((calculation, [f for _, f in sorted(files)]) for calculation, files in groups.items())
+
+
+def _read_pdos_file(filename):
+    with open(filename, 'r') as fhandle:
+        try:
+            return read_pdos(fhandle)
+        except ValueError as exc:
+            raise ValueError("{}: {}".format(filename, exc))
+
+
+def _broaden_columns(sigma, method, de, args):
+    eigenvalues, weights, xmesh = args
+    return broaden(eigenvalues, weights, xmesh, sigma, method, de=de)
+
+
+def batch_broaden(groups, sigma=0.02, de=0.001, method='window', workers=None):
+    """Broaden the PDOS files of many calculations, in parallel
+
+    Args:
+        groups: a dict calculation -> list of PDOS files, for example from group_pdos_files(...)
+        sigma, de, method: see broaden(...), the mesh is created using energy_mesh(...)
+            over the eigenvalues of all files of a calculation
+        workers: number of worker processes, all CPUs if None, no pool if 1
+
+    Yields:
+        a tuple `(calculation, efermi, xmesh, ymesh, headers)` per calculation, with the
+        Fermi energy of the first file, the (unshifted) mesh in a.u., the densities of
+        all orbitals of all files as columns and their names `<element>[_<spin>]_<orbital>`
+    """
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    nfiles = sum(len(filenames) for filenames in groups.values())
+    pool = multiprocessing.Pool(min(workers, nfiles)) if workers > 1 and nfiles > 1 else None
+    imap = pool.imap if pool else map
+
+    try:
+        for calculation, filenames in groups.items():
+            pdos = list(imap(_read_pdos_file, filenames))
+
+            eigenvalues = np.concatenate([data[:, EIGENVALUE_COLUMN] for _, _, _, data in pdos])
+            xmesh = energy_mesh(eigenvalues, sigma, de)
+
+            tasks = [(data[:, EIGENVALUE_COLUMN], data[:, DENSITY_COLUMN:], xmesh) for _, _, _, data in pdos]
+            ymesh = np.hstack(list(imap(functools.partial(_broaden_columns, sigma, method, de), tasks)))
+
+            headers = []
+            for filename, (element, _, header, _) in zip(filenames, pdos):
+                match = FILENAME_MATCH.match(os.path.basename(filename))
+                prefix = element
+                if match and match.group('spin'):
+                    prefix += '_' + match.group('spin').lower()
+                headers += ['{}_{}'.format(prefix, orbital) for orbital in header[DENSITY_COLUMN:]]
+
+            yield calculation, pdos[0][1], xmesh, ymesh, headers
+
+        if pool:
+            pool.close()
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
@@ -1,7 +1,10 @@
 # originally from http://stackoverflow.com/questions/17602878/how-to-handle-both-with-open-and-sys-stdout-nicely
 import contextlib
+import math
 import sys
 
+import numpy as np
+
 @contextlib.contextmanager
 def smart_open(filename=None, flag='w'):
     if filename and filename != '-':
@@ -17,3 +20,58 @@ def smart_open(filename=None, flag='w'):
     finally:
         if (fh is not sys.stdout) and (fh is not sys.stdin):
             fh.close()
+
+
+class GrowableArray(object):
+    """
+    A 1D NumPy array with amortized O(1) appends, to collect
+    large numbers of values without creating a Python object for each of them.
+    """
+
+    def __init__(self, dtype=float, capacity=64):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        if self._size == len(self._data):
+            data = np.empty(2*len(self._data), dtype=self._data.dtype)
+            data[:self._size] = self._data
+            self._data = data
+
+        self._data[self._size] = value
+        self._size += 1
+
+    def set_last(self, value):
+        self._data[self._size - 1] = value
+
+    def array(self):
+        """Return the values appended so far (as a view, without copying)"""
+        return self._data[:self._size]
+
+
+def json_finite(obj):
+    """
+    Replace non-finite floats (like the NaN fill values of the time series) in nested dicts
+    and lists by None, to write them as null when dumping with `allow_nan=False` (strict JSON)
+    """
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+
+    if isinstance(obj, dict):
+        return {key: json_finite(value) for key, value in obj.items()}
+
+    if isinstance(obj, (list, tuple)):
+        return [json_finite(value) for value in obj]
+
+    return obj
+
+
+def json_default(obj):
+    """To be used as `default` for json.dump(s), serializes NumPy arrays and scalars (non-finite values as null)"""
+    if hasattr(obj, 'tolist'):
+        return json_finite(obj.tolist())
+
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
@@ -3,68 +3,40 @@
 Convert the CP2K band structure output to CSV files
 """
 
-import re
-import argparse
-
-SET_MATCH = re.compile(r'''
-[ ]*
-  SET: [ ]* (?P<setnr>\d+) [ ]*
-  TOTAL [ ] POINTS: [ ]* (?P<totalpoints>\d+) [ ]*
-  \n
-(?P<content>
-  [\s\S]*?(?=\n.*?[ ] SET|$)  # match everything until next 'SET' or EOL
-)
-''', re.VERBOSE)
+from __future__ import print_function
 
-SPOINTS_MATCH = re.compile(r'''
-[ ]*
-  POINT [ ]+ (?P<pointnr>\d+) [ ]+ (?P<a>\S+) [ ]+ (?P<b>\S+) [ ]+ (?P<c>\S+)
-''', re.VERBOSE)
+import argparse
 
-POINTS_MATCH = re.compile(r'''
-[ ]*
-  Nr\. [ ]+ (?P<nr>\d+) [ ]+
-  Spin [ ]+ (?P<spin>\d+) [ ]+
-  K-Point [ ]+ (?P<a>\S+) [ ]+ (?P<b>\S+) [ ]+ (?P<c>\S+) [ ]*
-  \n
-[ ]* (?P<npoints>\d+) [ ]* \n
-(?P<values>
-  [\s\S]*?(?=\n.*?[ ] Nr|$)  # match everything until next 'Nr.' or EOL
-)
-''', re.VERBOSE)
+from cp2k_tools.bandstructure import bs2csv, bs2npz
 
 
-def convert_bs2csv(ifile, csvpattern="bs.set-{setnr}.csv"):
+def convert_bs2csv(ifile, csvpattern="bs.set-{setnr}.csv", fmt='csv'):
     """
     Convert the input from the given input file handle and write
     CSV output files based on the given pattern.
     """
-    for kpoint_set in SET_MATCH.finditer(ifile.read()):
-        filename = csvpattern.format(setnr=kpoint_set.group('setnr'))
-        set_content = kpoint_set.group('content')
 
-        with open(filename, 'w') as csvout:
-            print(("writing point set {}"
-                   " (total number of k-points: {totalpoints})"
-                   .format(filename, **kpoint_set.groupdict())))
+    converter = bs2npz if fmt == 'npz' else bs2csv
 
-            print("  with the following special points:")
-            for point in SPOINTS_MATCH.finditer(set_content):
-                print("  {pointnr}: {a}/{b}/{c}".format(
-                    **point.groupdict()))
+    for filename, kpoint_set in converter(ifile, csvpattern):
+        print(("wrote point set {}"
+               " (total number of k-points: {totalpoints})"
+               .format(filename, **kpoint_set)))
 
-            for point in POINTS_MATCH.finditer(set_content):
-                results = point.groupdict()
-                results['values'] = " ".join(results['values'].split())
-                csvout.write("{a} {b} {c} {values}\n".format(**results))
+        print("  with the following special points:")
+        for pointnr, point in kpoint_set['special_points']:
+            print("  {}: {:.6f}/{:.6f}/{:.6f}".format(pointnr, *point))
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('bsfilename', metavar='bandstructure-file', type=str,
                         help="the band structure file generated by CP2K")
+    parser.add_argument('--format', '-f', type=str, choices=('csv', 'npz'), default='csv',
+                        help="write CSV files or compressed NumPy archives with the arrays"
+                        " kpoints, energies and spins (default: csv)")
 
     args = parser.parse_args()
 
     with open(args.bsfilename, 'r') as fhandle:
-        convert_bs2csv(fhandle, "{}.set-{{setnr}}.csv".format(args.bsfilename))
+        convert_bs2csv(fhandle, "{}.set-{{setnr}}.{}".format(args.bsfilename, args.format), args.format)
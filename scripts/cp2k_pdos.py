@@ -28,34 +28,51 @@ and normalizes by the number of atoms of this kind.
 from __future__ import print_function
 
 import sys
-import re
 import argparse
-import contextlib
 
 import numpy as np
 
+from cp2k_tools.pdos import (METHODS, TABLE_FORMATS, EIGENVALUE_COLUMN, DENSITY_COLUMN,
+                             read_pdos, energy_mesh, broaden, group_pdos_files, batch_broaden,
+                             write_table, save_table)
 
-HEADER_MATCH = re.compile(
-    r'\# Projected DOS for atomic kind (?P<element>\w+) at iteration step i = \d+, E\(Fermi\) = [ \t]* (?P<Efermi>[^\t ]+) a\.u\.')
 
-# Column indexes, starting from 0
-EIGENVALUE_COLUMN = 1
-DENSITY_COLUMN = 3
+def write_output(filename, xmesh, ymesh, efermi, orb_headers, args):
+    ncols = ymesh.shape[1]
 
+    if args.total_sum:
+        finalsum = np.sum(ymesh, 0)*args.de
+        print("Sum over all meshpoints, per orbital:", file=sys.stderr)
+        print(("{:16.8f}"*ncols).format(*finalsum), file=sys.stderr)
+
+    xmesh -= efermi  # put the Fermi energy at 0
+    xmesh *= 27.211384  # convert to eV
+    ymesh *= args.scale  # scale
+
+    headers = None if args.no_header else orb_headers
 
-# from https://stackoverflow.com/a/17603000/1400465
-@contextlib.contextmanager
-def smart_open(filename=None):
     if filename and filename != '-':
-        fhandle = open(filename, 'w')
+        save_table(filename, xmesh, ymesh, headers, args.format)
     else:
-        fhandle = sys.stdout
+        write_table(sys.stdout, xmesh, ymesh, headers)
+
+
+def batch(args):
+    from cp2k_tools.parser.batch import expand_paths
+
+    groups = group_pdos_files(expand_paths(args.pdosfilenames))
+    pattern = args.output or "{calculation}-pdos.dat"
 
     try:
-        yield fhandle
-    finally:
-        if fhandle is not sys.stdout:
-            fhandle.close()
+        for calculation, efermi, xmesh, ymesh, headers in batch_broaden(
+                groups, args.sigma, args.de, args.method, args.workers):
+            filename = pattern.format(calculation=calculation)
+            print("Writing {} ({} files, {} mesh points) to {}".format(
+                calculation, len(groups[calculation]), len(xmesh), filename), file=sys.stderr)
+            write_output(filename, xmesh, ymesh, efermi, headers, args)
+    except (IOError, ValueError) as exc:
+        print("Batch processing failed: {}".format(exc), file=sys.stderr)
+        sys.exit(1)
 
 
 def main():
@@ -66,6 +83,9 @@ def main():
                         help="sigma for the gaussian distribution (default: 0.02)")
     parser.add_argument('--de', '-d', type=float, default=0.001,
                         help="integration step size (default: 0.001)")
+    parser.add_argument('--method', '-m', type=str, choices=METHODS, default='window',
+                        help="broadening method: 'direct' and 'window' are exact, 'fft' is fastest with a relative"
+                        " error of about (de/sigma)^2/8 (default: window)")
     parser.add_argument('--scale', '-c', type=float, default=1,
                         help="scale the density by this factor (default: 1)")
     parser.add_argument('--total-sum', action='store_true',
@@ -73,27 +93,39 @@ def main():
     parser.add_argument('--no-header', action='store_true', default=False,
                         help="do not print a header (default: print header)")
     parser.add_argument('--output', '-o', type=str, default=None,
-                        help="write output to specified file (default: write to standard output)")
+                        help="write output to specified file (default: write a text table to standard output),"
+                        " in batch mode a pattern containing {calculation} (default: {calculation}-pdos.dat)")
+    parser.add_argument('--format', '-f', type=str, choices=TABLE_FORMATS, default=None,
+                        help="format of the output file: text, gzip compressed text, NumPy .npy (energies as"
+                        " first column) or compressed .npz (default: by the extension of the output file, text)")
+    parser.add_argument('--batch', '-b', action='store_true',
+                        help="the PDOS files (or glob patterns) are from many calculations: group them by"
+                        " calculation and spin and write one output per calculation (default: no)")
+    parser.add_argument('--workers', '-n', type=int, default=None,
+                        help="number of worker processes in batch mode (default: number of CPUs)")
     args = parser.parse_args()
 
+    # only the text table is written to the standard output
+    if args.format not in (None, 'text') and args.output in (None, '-'):
+        parser.error("--format {} requires an output file (--output)".format(args.format))
+
+    if args.batch:
+        batch(args)
+        return
+
     alldata = []
     orb_headers = []
 
     for pdosfilename in args.pdosfilenames:
         with open(pdosfilename, 'r') as fhandle:
-            match = HEADER_MATCH.match(fhandle.readline().rstrip())
-            if not match:
+            try:
+                _, efermi, header, data = read_pdos(fhandle)
+            except ValueError:
                 print(("The file '{}' does not look like a CP2K PDOS output.\n"
                        "If it is indeed a correct output file, please report an issue at\n"
                        "    https://github.com/dev-zero/cp2k-tools/issues").format(pdosfilename))
                 sys.exit(1)
 
-            efermi = float(match.group('Efermi'))
-            # header is originally: ['#', 'MO', 'Eigenvalue', '[a.u.]', 'Occupation', 's', 'py', ...]
-            header = fhandle.readline().rstrip().split()[1:]  # remove the comment directly
-            header[1:3] = [' '.join(header[1:3])]  # rejoin "Eigenvalue" and its unit
-            data = np.loadtxt(fhandle)  # load the rest directly with numpy
-
         alldata.append(data)
 
         orb_headers += header[DENSITY_COLUMN:]
@@ -101,11 +133,9 @@ def main():
     # take the boundaries over all energy eigenvalues (not guaranteed to be the same)
     # add a margin to not cut-off Gaussians at the borders
     margin = 10 * args.sigma
-    emin = min(np.min(data[:, EIGENVALUE_COLUMN]) for data in alldata) - margin
-    emax = max(np.max(data[:, EIGENVALUE_COLUMN]) for data in alldata) + margin
+    xmesh = energy_mesh(np.concatenate([data[:, EIGENVALUE_COLUMN] for data in alldata]), args.sigma, args.de)
+    emin, emax, nmesh = xmesh[0], xmesh[-1], len(xmesh)
     ncols = sum(data.shape[1] - DENSITY_COLUMN for data in alldata)
-    nmesh = int((emax-emin)/args.de)+1  # calculate manually instead of using np.arange to ensure emax inside the mesh
-    xmesh = np.linspace(emin, emax, nmesh)
     ymesh = np.zeros((nmesh, ncols))
 
     # printing to stderr makes it possible to simply redirect the stdout to a file
@@ -115,33 +145,17 @@ def main():
     print("Maximum energy:    {:14.5f} + {:.5f}".format(emax-margin, margin), file=sys.stderr)
     print("Nr of mesh points: {:14d}".format(nmesh), file=sys.stderr)
 
-    fact = args.de/(args.sigma*np.sqrt(2.0*np.pi))
-
     coloffset = 0
     for fname, data in zip(args.pdosfilenames, alldata):
         print("Nr of lines:       {:14d} in {}".format(data.shape[0], fname), file=sys.stderr)
         ncol = data.shape[1] - DENSITY_COLUMN
 
-        for idx in range(nmesh):
-            func = np.exp(-(xmesh[idx]-data[:, EIGENVALUE_COLUMN])**2/(2.0*args.sigma**2))*fact
-            ymesh[idx, coloffset:(coloffset+ncol)] = func.dot(data[:, DENSITY_COLUMN:])
+        ymesh[:, coloffset:(coloffset+ncol)] = broaden(data[:, EIGENVALUE_COLUMN], data[:, DENSITY_COLUMN:],
+                                                       xmesh, args.sigma, args.method, de=args.de)
 
         coloffset += ncol
 
-    if args.total_sum:
-        finalsum = np.sum(ymesh, 0)*args.de
-        print("Sum over all meshpoints, per orbital:", file=sys.stderr)
-        print(("{:16.8f}"*ncols).format(*finalsum), file=sys.stderr)
-
-    xmesh -= efermi  # put the Fermi energy at 0
-    xmesh *= 27.211384  # convert to eV
-    ymesh *= args.scale  # scale
-
-    with smart_open(args.output) as fhandle:
-        if not args.no_header:
-            print(("{:>16}" + " {:>16}"*ncols).format("Energy_[eV]", *orb_headers), file=fhandle)
-        for idx in range(nmesh):
-            print(("{:16.8f}" + " {:16.8f}"*ncols).format(xmesh[idx], *ymesh[idx, :]), file=fhandle)
+    write_output(args.output, xmesh, ymesh, efermi, orb_headers, args)
 
 
 if __name__ == '__main__':
@@ -39,6 +39,8 @@ setup(
             'cp2k_inp2json = cp2k_tools.parser.input_cli:cli',
             'cp2k_json2inp = cp2k_tools.generator.cli:cli',
             'cp2k_xyz_restart_cleaner = cp2k_tools.parser.xyz_cli:xyz_restart_cleaner',
+            'cp2k_xyz2store = cp2k_tools.parser.xyz_cli:xyz2store',
+            'cp2k_xyz_filter = cp2k_tools.parser.xyz_cli:xyz_filter',
         ],
     },
     scripts=[
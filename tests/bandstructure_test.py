@@ -0,0 +1,110 @@
+# vim: set fileencoding=utf8 :
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cp2k_tools.bandstructure import iter_kpoints, iter_sets, bs2csv, bs2npz
+
+BANDSTRUCTURE = u"""\
+  SET:      1                 TOTAL POINTS:      2
+     POINT   1            0.000000    0.000000    0.000000
+     POINT   2            0.500000    0.000000    0.500000
+      Nr.     1    Spin 1 K-Point  0.00000000  0.00000000  0.00000000
+               5
+         -9.89412651         -9.87711478         -9.84012346         -9.64098765
+          1.00000000
+      Nr.     2    Spin 1 K-Point  0.50000000  0.00000000  0.50000000
+               5
+         -8.89412651         -8.87711478         -8.84012346         -8.64098765
+          2.00000000
+  SET:      2                 TOTAL POINTS:      1
+     POINT   1            0.500000    0.000000    0.500000
+      Nr.     3    Spin 1 K-Point  0.50000000  0.00000000  0.50000000
+               5
+         -7.89412651         -7.87711478         -7.84012346         -7.64098765
+          3.00000000
+"""
+
+class TestBandstructure(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_iter_kpoints(self):
+        kpoints = list(iter_kpoints(io.StringIO(BANDSTRUCTURE)))
+        self.assertEqual(len(kpoints), 3)
+
+        kpoint_set, spin, kpoint, energies = kpoints[1]
+        self.assertEqual(kpoint_set['setnr'], 1)
+        self.assertEqual(kpoint_set['totalpoints'], 2)
+        self.assertEqual([nr for nr, _ in kpoint_set['special_points']], [1, 2])
+        np.testing.assert_array_equal(kpoint_set['special_points'][1][1], [0.5, 0., 0.5])
+        self.assertEqual(spin, 1)
+        np.testing.assert_array_equal(kpoint, [0.5, 0., 0.5])
+        np.testing.assert_array_equal(energies, [-8.89412651, -8.87711478, -8.84012346, -8.64098765, 2.])
+
+        self.assertIs(kpoints[0][0], kpoint_set)
+        self.assertEqual(kpoints[2][0]['setnr'], 2)
+
+    def test_iter_kpoints_invalid(self):
+        # a truncated file
+        with self.assertRaises(ValueError):
+            list(iter_kpoints(io.StringIO(BANDSTRUCTURE.rsplit('\n', 2)[0])))
+
+        # missing band energies
+        with self.assertRaises(ValueError):
+            list(iter_kpoints(io.StringIO(BANDSTRUCTURE.replace(u"          1.00000000\n", u""))))
+
+        # an invalid band energy
+        with self.assertRaises(ValueError):
+            list(iter_kpoints(io.StringIO(BANDSTRUCTURE.replace(u"-9.87711478", u"-9.877x1478"))))
+
+        # a k-point before the first set
+        with self.assertRaises(ValueError):
+            list(iter_kpoints(io.StringIO(BANDSTRUCTURE.split('\n', 3)[3])))
+
+    def test_iter_sets(self):
+        sets = list(iter_sets(io.StringIO(BANDSTRUCTURE)))
+        self.assertEqual([s['setnr'] for s in sets], [1, 2])
+
+        self.assertEqual(sets[0]['kpoints'].shape, (2, 3))
+        self.assertEqual(sets[0]['energies'].shape, (2, 5))
+        self.assertEqual(sets[1]['energies'].shape, (1, 5))
+        np.testing.assert_array_equal(sets[0]['spins'], [1, 1])
+        np.testing.assert_array_equal(sets[0]['energies'][:, 4], [1., 2.])
+
+        with self.assertRaises(TypeError):
+            list(iter_sets(io.StringIO(BANDSTRUCTURE.replace(
+                u"               5\n         -8.89412651         -8.87711478         -8.84012346         -8.64098765\n"
+                u"          2.00000000\n",
+                u"               4\n         -8.89412651         -8.87711478         -8.84012346         -8.64098765\n"))))
+
+    def test_bs2csv(self):
+        pattern = os.path.join(self.tmpdir, 'bs.set-{setnr}.csv')
+        written = list(bs2csv(io.StringIO(BANDSTRUCTURE), pattern))
+
+        self.assertEqual([f for f, _ in written], [pattern.format(setnr=1), pattern.format(setnr=2)])
+        self.assertEqual(written[0][1]['totalpoints'], 2)
+
+        with open(pattern.format(setnr=1), 'r') as fhandle:
+            self.assertEqual(fhandle.read(),
+                             "0.00000000 0.00000000 0.00000000 -9.89412651 -9.87711478 -9.84012346 -9.64098765 1.00000000\n"
+                             "0.50000000 0.00000000 0.50000000 -8.89412651 -8.87711478 -8.84012346 -8.64098765 2.00000000\n")
+
+    def test_bs2npz(self):
+        pattern = os.path.join(self.tmpdir, 'bs.set-{setnr}.npz')
+        written = list(bs2npz(io.StringIO(BANDSTRUCTURE), pattern))
+        self.assertEqual(len(written), 2)
+
+        with np.load(pattern.format(setnr=1)) as archive:
+            self.assertEqual(int(archive['setnr']), 1)
+            np.testing.assert_array_equal(archive['special_points_nr'], [1, 2])
+            np.testing.assert_array_equal(archive['kpoints'], written[0][1]['kpoints'])
+            np.testing.assert_array_equal(archive['energies'], written[0][1]['energies'])
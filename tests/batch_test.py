@@ -0,0 +1,63 @@
+# vim: set fileencoding=utf8 :
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from cp2k_tools.parser.batch import expand_paths, batch_query, batch_blockparse
+
+from . import from_test_dir
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.files = []
+        for num in range(4):
+            self.files.append(os.path.join(self.tmpdir, 'run%i.out' % num))
+            shutil.copy(from_test_dir('output_parser_test-C4H4S.out'), self.files[-1])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_expand_paths(self):
+        listfile = os.path.join(self.tmpdir, 'files.txt')
+        with open(listfile, 'w') as fhandle:
+            fhandle.write("# some runs\n\n%s\n%s\n" % (self.files[3], self.files[0]))
+
+        nonexistent = os.path.join(self.tmpdir, 'missing*.out')
+
+        paths = expand_paths([os.path.join(self.tmpdir, '*.out'), nonexistent], [listfile])
+        self.assertEqual(paths, self.files + [nonexistent])
+
+    def test_query(self):
+        filenames = self.files + [os.path.join(self.tmpdir, 'missing.out')]
+
+        for workers in [1, 2]:
+            records = [json.loads(l) for l in batch_query(['.GLOBAL.Run type', '.SCF.energy[0]'],
+                                                          filenames, workers=workers)]
+
+            self.assertEqual([r['file'] for r in records], filenames)
+
+            for record in records[:-1]:
+                self.assertEqual(record['result'], ['ENERGY', -35.2463124153])
+
+            self.assertNotIn('result', records[-1])
+            self.assertIn('missing.out', records[-1]['error'])
+
+        # the NaN of line search steps is written as null to keep the records strict JSON
+        records = [json.loads(l, parse_constant=self.fail) for l in batch_query(['.SCF.convergence'], self.files[:1])]
+        self.assertIsNone(records[0]['result'][0][1])
+
+        records = [json.loads(l) for l in batch_query(['.GLOBAL.Run type'], filenames,
+                                                      workers=2, ordered=False)]
+        self.assertEqual(sorted(r['file'] for r in records), sorted(filenames))
+
+    def test_blockparse(self):
+        records = [json.loads(l) for l in batch_blockparse(self.files[:2], workers=2)]
+
+        self.assertEqual([r['file'] for r in records], self.files[:2])
+        self.assertEqual(records[0]['result'], records[1]['result'])
+        self.assertIn('references', records[0]['result'])
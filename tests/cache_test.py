@@ -0,0 +1,138 @@
+# vim: set fileencoding=utf8 :
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from cp2k_tools.parser.cache import ParseCache, parse_output, blockparse_output
+
+from . import from_test_dir
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = ParseCache(os.path.join(self.tmpdir, 'cache'))
+        self.filename = os.path.join(self.tmpdir, 'run.out')
+        shutil.copy(from_test_dir('output_parser_test-C4H4S.out'), self.filename)
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _func(self, filename):
+        self.calls.append(filename)
+        with open(filename, 'r') as fhandle:
+            return len(fhandle.read())
+
+    def _touch(self, filename, content):
+        with open(filename, 'a') as fhandle:
+            fhandle.write(content)
+        # make sure the mtime changes even on filesystems with a coarse resolution
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+
+    def test_cached(self):
+        size = os.path.getsize(self.filename)
+
+        self.assertEqual(self.cache.cached(self.filename, 'test', self._func), size)
+        self.assertEqual(self.cache.cached(self.filename, 'test', self._func), size)
+        self.assertEqual(len(self.calls), 1)
+
+        # a different namespace (i.e. parser version) gets its own entry
+        self.cache.cached(self.filename, 'test-2', self._func)
+        self.assertEqual(len(self.calls), 2)
+
+        # modifying the file invalidates the entry
+        self._touch(self.filename, "\n")
+        self.assertEqual(self.cache.cached(self.filename, 'test', self._func), size + 1)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_content_hash(self):
+        cache = ParseCache(self.cache.directory, content_hash=True)
+        cache.cached(self.filename, 'test', self._func)
+
+        # a copy with the same content is found as well
+        copy = os.path.join(self.tmpdir, 'copy.out')
+        shutil.copy(self.filename, copy)
+        cache.cached(copy, 'test', self._func)
+        self.assertEqual(self.calls, [self.filename])
+
+        # but not with the default file identity
+        self.cache.cached(copy, 'test', self._func)
+        self.assertEqual(self.calls, [self.filename, copy])
+
+    def test_evict(self):
+        filenames = []
+        for num in range(4):
+            filenames.append(os.path.join(self.tmpdir, 'run%i.out' % num))
+            shutil.copy(self.filename, filenames[-1])
+            self.cache.cached(filenames[-1], 'test', self._func)
+
+        entries = os.listdir(self.cache.directory)
+        self.assertEqual(len(entries), 4)
+        entry_size = os.path.getsize(os.path.join(self.cache.directory, entries[0]))
+
+        # use the first entry to make it the most recently used one
+        now = time.time()
+        for num, entry in enumerate(entries):
+            os.utime(os.path.join(self.cache.directory, entry), (now - 100 + num, now - 100 + num))
+        self.cache.cached(filenames[0], 'test', self._func)
+
+        # the entries are evicted down to 90% of the maximum size
+        self.cache.max_size = int(2.5*entry_size)
+        self.cache.cached(filenames[3], 'test', self._func)  # evicts on the next put only
+        self.cache.put(filenames[3], 'test', 1)
+
+        self.assertEqual(len(os.listdir(self.cache.directory)), 2)
+        self.assertEqual(self.cache.get(filenames[3], 'test'), 1)
+        self.assertEqual(self.cache.get(filenames[0], 'test'), os.path.getsize(self.filename))
+
+        self.cache.clear()
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_evict_scans(self):
+        scans = []
+        evict = self.cache.evict
+        self.cache.evict = lambda *args: scans.append(args) or evict(*args)
+
+        # the directory is only scanned for the first entry and when the maximum size is exceeded
+        for num in range(10):
+            self.cache.put(self.filename, 'test-%02i' % num, num)
+        self.assertEqual(len(scans), 1)
+
+        entry_size = max(os.path.getsize(os.path.join(self.cache.directory, e)) for e in os.listdir(self.cache.directory))
+        self.cache.max_size = 12*entry_size
+
+        self.cache.put(self.filename, 'test-10', 10)
+        self.cache.put(self.filename, 'test-11', 11)
+        self.assertEqual(len(scans), 1)
+
+        # exceeding the maximum size evicts down to 90% of it, leaving room for the next entry
+        self.cache.put(self.filename, 'test-12', 12)
+        self.assertEqual(len(scans), 2)
+        self.assertEqual(len(os.listdir(self.cache.directory)), 10)
+
+        self.cache.put(self.filename, 'test-13', 13)
+        self.assertEqual(len(scans), 2)
+
+    def test_unpicklable(self):
+        value = self.cache.cached(self.filename, 'test', lambda filename: (lambda: None))
+        self.assertTrue(callable(value))
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_parse_output(self):
+        uncached = parse_output(self.filename, queries=['.SCF.energy'])
+
+        for _ in range(2):
+            parser = parse_output(self.filename, cache=self.cache)
+            self.assertEqual(parser.query('.GLOBAL.Run type'), 'ENERGY')
+            self.assertEqual(parser.query('.SCF.energy').tolist(), uncached.query('.SCF.energy').tolist())
+
+        self.assertEqual(len(os.listdir(self.cache.directory)), 1)
+
+        for _ in range(2):
+            self.assertIn('references', blockparse_output(self.filename, cache=self.cache))
+
+        self.assertEqual(len(os.listdir(self.cache.directory)), 2)
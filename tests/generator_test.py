@@ -0,0 +1,159 @@
+# vim: set fileencoding=utf8 :
+
+import io
+import os
+import shutil
+import tempfile
+import copy
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+
+from cp2k_tools.generator import dict2cp2k, dict2line_iter, write_cp2k, SectionCache, BULK_MIN_ROWS
+from cp2k_tools.parser.input import CoordinateBlock
+
+
+class TestDict2CP2K(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        natoms = BULK_MIN_ROWS + 10
+
+        self.symbols = ['H', 'O%'] * (natoms // 2)
+        self.values = rng.uniform(-10., 10., (natoms, 3))
+        self.rows = [[s] + v for s, v in zip(self.symbols, self.values.tolist())]
+
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _struct(self, coords):
+        return OrderedDict([
+            ('global', OrderedDict([('project', '{project}'), ('run_type', 'ENERGY')])),
+            ('force_eval', OrderedDict([
+                ('dft', {'charge': 0, 'qs': {'eps_default': 1e-10}, 'escaped': '{{x}}'}),
+                ('subsys', {'coord': {'*': coords, 'unit': 'angstrom'},
+                            'kind': [{'_': 'H', 'element': 'H'}, {'_': 'O', 'element': 'O'}]}),
+                ])),
+            ])
+
+    def test_output(self):
+        expected = "\n".join(dict2line_iter(self._struct(self.rows))).format(project='test')
+        self.assertEqual(len(expected.splitlines()), 24 + len(self.rows))
+
+        self.assertEqual(dict2cp2k(self._struct(self.rows), parameters={'project': 'test'}), expected)
+        self.assertEqual(dict2cp2k(self._struct(CoordinateBlock(self.symbols, self.values)),
+                                   parameters={'project': 'test'}), expected)
+
+        # text handles get the lines verbatim, without substituting the parameters
+        output = io.StringIO()
+        dict2cp2k(self._struct(self.rows), output, {'project': 'test'})
+        self.assertEqual(output.getvalue(), "\n".join(dict2line_iter(self._struct(self.rows))))
+        self.assertIn("PROJECT {project}", output.getvalue())
+        self.assertIn("ESCAPED {{x}}", output.getvalue())
+
+        output = io.StringIO()
+        write_cp2k(self._struct(self.rows), output, {'project': 'test'})
+        self.assertEqual(output.getvalue(), expected)
+
+        raw = io.BytesIO()
+        output = io.BufferedWriter(raw)
+        dict2cp2k(self._struct(self.rows), output, {'project': 'test'})
+        output.flush()
+        self.assertEqual(raw.getvalue().decode('utf-8'), expected)
+
+        filename = os.path.join(self.tmpdir, 'test.inp')
+        dict2cp2k(self._struct(self.rows), filename, {'project': 'test'})
+        with io.open(filename, 'r') as fhandle:
+            self.assertEqual(fhandle.read(), expected)
+
+    def test_chunks(self):
+        import cp2k_tools.generator
+
+        expected = "\n".join(dict2line_iter(self._struct(self.rows))).format(project='test')
+
+        # the result must not depend on how the lines got split into chunks
+        limit = cp2k_tools.generator._BULK_CHUNK_ROWS
+        cp2k_tools.generator._BULK_CHUNK_ROWS = 7
+        try:
+            for coords in (self.rows, CoordinateBlock(self.symbols, self.values)):
+                output = io.StringIO()
+                write_cp2k(self._struct(coords), output, {'project': 'test'}, chunk_size=1)
+                self.assertEqual(output.getvalue(), expected)
+        finally:
+            cp2k_tools.generator._BULK_CHUNK_ROWS = limit
+
+    def test_rows(self):
+        # rows of different lengths and values which are not numbers
+        rows = [[1, 2], (3, 'x', True)] * BULK_MIN_ROWS
+        struct = {'a': {'*': rows, 'list': [[1, '%s']] * BULK_MIN_ROWS}}
+
+        lines = dict2cp2k(struct).splitlines()
+        self.assertEqual(lines[:3], ['&A', '   1 2', '   3 x True'])
+        self.assertEqual(lines[-2:], ['   LIST 1 %s', '&END A'])
+        self.assertEqual(len(lines), 2 + 3*BULK_MIN_ROWS)
+
+        velocities = CoordinateBlock(None, self.values)
+        self.assertEqual(dict2cp2k({'velocity': {'*': velocities}}).splitlines()[1:-1],
+                         ["   " + " ".join(str(v) for v in line) for line in self.values.tolist()])
+
+
+class TestSectionCache(unittest.TestCase):
+    def setUp(self):
+        self.base = {
+            'global': {'project': 'test', 'run_type': 'ENERGY'},
+            'force_eval': {
+                'dft': {'mgrid': {'cutoff': 300}, 'xc': {'xc_functional': {'_': 'PBE'}}},
+                'subsys': {'coord': {'*': [['H', 0., 0., float(i)] for i in range(BULK_MIN_ROWS)]},
+                           'kind': [{'_': 'H', 'element': 'H'}]},
+                },
+            }
+
+    def _changed(self, cutoff):
+        # a copy of the dicts along the path of the change, sharing all other sections
+        dft = dict(self.base['force_eval']['dft'], mgrid={'cutoff': cutoff})
+        return dict(self.base, force_eval=dict(self.base['force_eval'], dft=dft))
+
+    def test_not_modified(self):
+        expected = copy.deepcopy(self.base)
+
+        output = dict2cp2k(self.base)
+        self.assertIn("&XC_FUNCTIONAL PBE", output)
+        self.assertIn("&KIND H", output)
+        self.assertEqual(self.base, expected)
+
+        # the same output a second time, the section parameters were not removed
+        self.assertEqual(dict2cp2k(self.base), output)
+
+        dict2cp2k(self.base, cache=SectionCache())
+        self.assertEqual(self.base, expected)
+
+    def test_cached(self):
+        cache = SectionCache()
+
+        for cutoff in (300, 400, 300):
+            self.assertEqual(dict2cp2k(self._changed(cutoff), cache=cache),
+                             dict2cp2k(self._changed(cutoff)))
+
+        # a new input only adds the sections on the path of the change (force_eval, dft and mgrid)
+        nentries = len(cache)
+        dict2cp2k(self._changed(500), cache=cache)
+        self.assertEqual(len(cache), nentries + 3)
+
+        # the lines of the cached sections are not generated again
+        self.base['force_eval']['subsys']['kind'][0]['element'] = 'X'
+        self.assertIn("ELEMENT H", dict2cp2k(self._changed(600), cache=cache))
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertIn("ELEMENT X", dict2cp2k(self._changed(600), cache=cache))
+
+    def test_evict(self):
+        cache = SectionCache(max_entries=2)
+
+        for cutoff in (300, 400):
+            self.assertEqual(dict2cp2k(self._changed(cutoff), cache=cache), dict2cp2k(self._changed(cutoff)))
+            self.assertEqual(len(cache), 2)
+
+        self.assertEqual("\n".join(dict2line_iter(self.base, cache=cache)), dict2cp2k(self.base))
@@ -1,8 +1,15 @@
+import io
+import json
 import unittest
 
+from click.testing import CliRunner
 from parsimonious import IncompleteParseError
 
-from cp2k_tools.parser.input import CP2KInput2Dict
+from cp2k_tools.parser.input import (CP2KInput2Dict, CP2KInputLineParser, CP2KInputParser,
+                                     CoordinateBlock, BULK_MIN_LINES, CP2K_INP_BULK_GRAMMAR)
+from cp2k_tools.parser.input_cli import cli
+from cp2k_tools.generator import dict2cp2k
+from cp2k_tools.tools import json_default
 
 from . import from_test_dir
 
@@ -38,3 +45,183 @@ class TestInputParser(unittest.TestCase):
     def test_invalids(self):
         with self.assertRaises(IncompleteParseError):
             self.parser.parse("&GLOBAL\n&ENDFOO\n")
+
+
+class TestInputLineParser(TestInputParser):
+    """Run all the tests of the PEG parser with the line-oriented parser"""
+
+    def setUp(self):
+        self.parser = CP2KInputLineParser()
+
+
+class TestInputParserBackends(unittest.TestCase):
+    # inputs exercising the corner cases of the grammar
+    INPUTS = [
+        "",
+        "\n\n# comment\n",
+        "&GLOBAL\n  PROJECT Si # comment\n  RUN_TYPE  ENERGY\t!comment\n&END GLOBAL\n",
+        "&FORCE_EVAL\n&SUBSYS\n&COORD\nSCALED\nH 0.0 0 .5\nsi1 1 2 3 # x\nO\nUNIT angstrom\n&END\n&END\n&END\n",
+        "&SUBSYS\n &CELL\n  ABC [angstrom] 1.0 2.0 3.0\n  ALPHA_BETA_GAMMA [ DEG ]\n &END CELL\n&END SUBSYS\n",
+        "&KIND H\n  BASIS_SET DZVP\n  BASIS_SET AUX_FIT cFIT3\n  BASIS_SET X\n&END KIND\n&KIND 1\n&END\n",
+        "&GLOBAL\n  EXTENDED_FFT_LENGTHS\n  SEED 1_000\n  X nan inf \"a/b\" 'c' +1 -2e-3\n&END GLOBAL\n",
+        "&GLOBAL\r\n  PROJECT x\r  #c\r\n&END  GLOBAL  \r\n",
+        "&GLOBAL\n&END\n&GLOBAL\n PROJECT second\n&END\n",
+        "&GLOBAL\n&ENDGLOBAL\n",  # the remainder after &END is a keyword of the parent (none here)
+        "&A\n&B\n&ENDB\n&END\n",
+        "&GLOBAL \n&END\n",  # no trailing whitespace allowed after a section name
+        "&GLOBAL x y\n&END\n",
+        "&GLOBAL\n PROJECT\n",
+        "&GLOBAL\n&END\n&FOO\n KEY=VALUE\n&END\n",
+        "KEY VALUE\n",
+        "&GLOBAL\n&END\n# comment without final newline",
+        ]
+
+    def _parse(self, parser, content):
+        try:
+            return parser.parse(content)
+        except IncompleteParseError as exc:
+            return exc.pos
+
+    def test_same_results(self):
+        peg = CP2KInput2Dict()
+        lines = CP2KInputLineParser()
+
+        with open(from_test_dir("input_parser_test_Si.inp"), "r") as fhandle:
+            content = fhandle.read()
+
+        for inp in self.INPUTS + [content]:
+            expected = self._parse(peg, inp)
+            result = self._parse(lines, inp)
+
+            # compare the representation to also compare the order and the types of the values
+            self.assertEqual(repr(result), repr(expected), "different results for: {!r}".format(inp))
+
+    def test_backend_selection(self):
+        with open(from_test_dir("input_parser_test_Si.inp"), "r") as fhandle:
+            content = fhandle.read()
+
+        self.assertEqual(CP2KInputParser('lines').parse(io.StringIO(content)),
+                         CP2KInputParser().parse(io.StringIO(content)))
+
+        with self.assertRaises(ValueError):
+            CP2KInputParser('invalid')
+
+    def test_cli_backend(self):
+        runner = CliRunner()
+        outputs = [runner.invoke(cli, ['--backend', backend, from_test_dir("input_parser_test_Si.inp")]).output
+                   for backend in CP2KInputParser.BACKENDS]
+        self.assertTrue(outputs[0])
+        self.assertEqual(outputs[0], outputs[1])
+
+
+class TestCoordinateBlock(unittest.TestCase):
+    def setUp(self):
+        self.natoms = BULK_MIN_LINES + 10
+        self.lines = [("Si" if i % 2 else "H", 0.5*i, -1.25, 1e-3*i) for i in range(self.natoms)]
+
+        self.content = "&SUBSYS\n&COORD\n  UNIT angstrom\n"
+        self.content += "".join("  {} {!r} {!r} {!r}\n".format(s.upper(), x, y, z) for s, x, y, z in self.lines)
+        self.content += "&END COORD\n&VELOCITY\n"
+        self.content += "".join("  {!r} {!r} {!r}\n".format(x, y, -z) for _, x, y, z in self.lines)
+        self.content += "&END VELOCITY\n&END SUBSYS\n"
+
+    def test_bulk(self):
+        for parser in (CP2KInput2Dict(bulk=True), CP2KInputLineParser(bulk=True)):
+            subsys = parser.parse(self.content)['subsys']
+
+            coords = subsys['coord']['*']
+            self.assertIsInstance(coords, CoordinateBlock)
+            self.assertEqual(coords.symbols[:2], ['H', 'Si'])
+            self.assertEqual(coords.values.shape, (self.natoms, 3))
+            self.assertEqual(subsys['coord']['unit'], 'angstrom')
+
+            # the view behaves like the list of tuples
+            self.assertEqual(coords, self.lines)
+            self.assertEqual(len(coords), self.natoms)
+            self.assertEqual(coords[1], ('Si', 0.5, -1.25, 1e-3))
+            self.assertEqual(coords[-1], self.lines[-1])
+            self.assertEqual(coords[2:4], self.lines[2:4])
+            self.assertEqual(list(coords), self.lines)
+            with self.assertRaises(IndexError):
+                coords[self.natoms]
+
+            velocities = subsys['velocity']['*']
+            self.assertIsInstance(velocities, CoordinateBlock)
+            self.assertIsNone(velocities.symbols)
+            self.assertEqual(velocities[3], (1.5, -1.25, -3e-3))
+
+    def test_fallback(self):
+        # an int value makes it a line which is not stored in the block, and with it the whole section
+        content = self.content.replace("  SI 0.5 ", "  SI 1 ", 1)
+
+        for parser in (CP2KInput2Dict(bulk=True), CP2KInputLineParser(bulk=True)):
+            coords = parser.parse(content)['subsys']['coord']['*']
+            self.assertIsInstance(coords, list)
+            self.assertEqual(coords[1], ('Si', 1, -1.25, 1e-3))
+            self.assertEqual(coords[2:], self.lines[2:])
+
+    def test_small_sections(self):
+        content = "&COORD\n  H 0.0 0.0 0.5\n&END COORD\n&VELOCITY\n  -0.5 1.0 2.0\n  1e-3 -1.0 -2.0\n&END VELOCITY\n"
+
+        for parser in (CP2KInput2Dict(bulk=True), CP2KInputLineParser(bulk=True)):
+            struct = parser.parse(content)
+            self.assertEqual(struct['coord']['*'], ('H', 0.0, 0.0, 0.5))
+            self.assertEqual(struct['velocity']['*'], [(-0.5, 1.0, 2.0), (1e-3, -1.0, -2.0)])
+
+    def test_bulk_grammar(self):
+        # with bulk=True the PEG backend matches the plain lines of COORD/VELOCITY as a whole
+        tree = CP2K_INP_BULK_GRAMMAR.parse(self.content)
+
+        def names(node):
+            yield node.expr_name
+            for child in node.children:
+                for name in names(child):
+                    yield name
+
+        self.assertEqual([n for n in names(tree) if n in ('coord_run', 'velocity_run')], ['coord_run', 'velocity_run'])
+        self.assertEqual([n for n in names(tree) if n == 'kv'], ['kv'])  # only the UNIT keyword
+
+    def test_velocity_lines(self):
+        # with bulk=True the lines of VELOCITY are values only: they are not split into a keyword name and values
+        content = "&VELOCITY\n  -0.5 1.0 2.0\n  1e-3 -1.0 -2.0\n  1 2 3 # m/s\n  0.25 1.0 2.0\n&END VELOCITY\n"
+
+        for parser in (CP2KInput2Dict(bulk=True), CP2KInputLineParser(bulk=True)):
+            self.assertEqual(parser.parse(content),
+                             {'velocity': {'*': [(-0.5, 1.0, 2.0), (1e-3, -1.0, -2.0), (1, 2, 3), (0.25, 1.0, 2.0)]}})
+
+        # by default they are keywords, as parsed before the bulk mode existed
+        for parser in (CP2KInput2Dict(), CP2KInputLineParser()):
+            struct = parser.parse(content)
+            self.assertEqual(struct, {'velocity': {'-0': (0.5, 1.0, 2.0), '1e-3': (-1.0, -2.0),
+                                                   '1': (2, 3), '0': (0.25, 1.0, 2.0)}})
+            self.assertEqual(list(struct['velocity']), ['-0', '1e-3', '1', '0'])
+
+    def test_default(self):
+        # without bulk=True large sections are plain lists, which can be modified and dumped as usual
+        for parser in (CP2KInput2Dict(), CP2KInputLineParser()):
+            subsys = parser.parse(self.content)['subsys']
+
+            coords = subsys['coord']['*']
+            self.assertIsInstance(coords, list)
+            self.assertEqual(coords, self.lines)
+            self.assertNotIn('*', subsys['velocity'])
+
+            coords.append(('O', 0., 0., 0.))
+            coords[0] = ('C', 1., 1., 1.)
+            self.assertEqual(len(coords + [('O', 1., 1., 1.)]), self.natoms + 2)
+
+            data = json.loads(json.dumps(subsys))
+            self.assertEqual(data['coord']['*'][0], ['C', 1., 1., 1.])
+            self.assertEqual(data['coord']['*'][-1], ['O', 0., 0., 0.])
+
+    def test_output(self):
+        struct = CP2KInputLineParser(bulk=True).parse(self.content)
+
+        data = json.loads(json.dumps(struct, default=json_default))
+        self.assertEqual(data['subsys']['coord']['*'][1], ['Si', 0.5, -1.25, 1e-3])
+        self.assertEqual(data['subsys']['velocity']['*'][3], [1.5, -1.25, -3e-3])
+        # the lines of VELOCITY are keywords without bulk=True
+        self.assertEqual(data['subsys']['coord'],
+                         json.loads(json.dumps(CP2KInputLineParser().parse(self.content)))['subsys']['coord'])
+
+        self.assertEqual(CP2KInputLineParser(bulk=True).parse(dict2cp2k(struct) + "\n"), struct)
@@ -0,0 +1,327 @@
+# vim: set fileencoding=utf8 :
+
+import io
+import contextlib
+import os
+import json
+import math
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cp2k_tools.parser.output import CP2KOutputParser, CP2KOutputBlockParser, BlockParserReferences, dispatch_key
+from cp2k_tools.tools import json_default
+from cp2k_tools.cli import oq
+
+from . import from_test_dir
+
+class TestOutputParser(unittest.TestCase):
+    def setUp(self):
+        with open(from_test_dir('output_parser_test-C4H4S.out'), 'rb') as fhandle:
+            self.content = fhandle.read()
+
+        self.parser = CP2KOutputParser()
+        with open(from_test_dir('output_parser_test-C4H4S.out'), 'r') as fhandle:
+            self.parser.parse(fhandle)
+
+    def test_parse(self):
+        self.assertEqual(self.parser.query('.PROGRAM.ENDED AT'), '2015-07-27 15:25:56.690')
+        self.assertEqual(self.parser.query('.GLOBAL.Run type'), 'ENERGY')
+        self.assertTrue(self.parser.ended())
+
+        # the state of a parser must remain storable at any point
+        state = io.BytesIO()
+        self.parser.save_state(state)
+        state.seek(0)
+        self.assertEqual(CP2KOutputParser.load_state(state).query('.GLOBAL.Run type'), 'ENERGY')
+
+    def test_queries(self):
+        queries = ['.PROGRAM.STARTED AT', '.PROGRAM.STARTED IN', '.GLOBAL.Run type']
+
+        parser = CP2KOutputParser()
+        with open(from_test_dir('output_parser_test-C4H4S.out'), 'r') as fhandle:
+            parser.parse(fhandle, queries=queries)
+
+        for query in queries:
+            self.assertEqual(parser.query(query), self.parser.query(query))
+
+        self.assertEqual(parser.query('.SCF.step').tolist(), [])  # not needed, therefore not parsed
+
+        parser = CP2KOutputParser()
+        with open(from_test_dir('output_parser_test-C4H4S.out'), 'r') as fhandle:
+            parser.parse(fhandle, queries=['.SCF.energy[6]', '.PROGRAM.ENDED AT'])
+
+        self.assertEqual(parser.query('.SCF.energy[6]'), self.parser.query('.SCF.energy[6]'))
+        self.assertEqual(parser.query('.PROGRAM.ENDED AT'), self.parser.query('.PROGRAM.ENDED AT'))
+        self.assertEqual(parser.query('.GLOBAL'), {})  # not needed, therefore not parsed
+
+    def test_queries_runs(self):
+        # a later run appended to the same output overwrites the values of the header,
+        # the queries must not stop at the header of the first run
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        fname = os.path.join(tmpdir, 'runs.out')
+
+        second = self.content.replace(b'2015-07-27 10:41', b'2015-07-28 11:42')
+        second = second.replace(b'Run type                                                         ENERGY',
+                                b'Run type                                                   ENERGY_FORCE')
+        with open(fname, 'wb') as fhandle:
+            fhandle.write(self.content + second)
+
+        full = CP2KOutputParser()
+        with open(fname, 'r') as fhandle:
+            full.parse(fhandle)
+
+        self.assertEqual(full.query('.PROGRAM.STARTED AT'), '2015-07-28 11:42:01.390')
+        self.assertEqual(full.query('.GLOBAL.Run type'), 'ENERGY_FORCE')
+
+        queries = ['.PROGRAM.STARTED AT', '.PROGRAM.STARTED IN', '.GLOBAL.Run type', '.CP2K.version string']
+
+        for query in queries:
+            parser = CP2KOutputParser()
+            with open(fname, 'r') as fhandle:
+                parser.parse(fhandle, queries=[query])
+            self.assertEqual(parser.query(query), full.query(query))
+
+        parser = CP2KOutputParser()
+        with open(fname, 'r') as fhandle:
+            parser.parse(fhandle, queries=queries)
+        self.assertEqual([parser.query(q) for q in queries], [full.query(q) for q in queries])
+
+        # the same for the oq command, with a single file, the cache (twice, to read it), a state file and a batch
+        expected = [full.query(q) for q in queries]
+        state = os.path.join(tmpdir, 'runs.state')
+        with mock.patch.dict(os.environ, {'CP2K_TOOLS_CACHE_DIR': os.path.join(tmpdir, 'cache')}):
+            for options in (['-j', '-f', fname], ['-jc', '-f', fname], ['-jc', '-f', fname],
+                            ['-j', '-f', fname, '-s', state], ['-g', fname, '-n', '1']):
+                stdout = io.StringIO()
+                with mock.patch('sys.argv', ['oq'] + options + queries), contextlib.redirect_stdout(stdout):
+                    oq()
+
+                results = [json.loads(l) for l in stdout.getvalue().splitlines()]
+                if '-g' in options:
+                    results = results[0]['result']
+                self.assertEqual(results, expected)
+
+    def test_query_syntax(self):
+        self.assertIsInstance(self.parser.query('.'), dict)
+        self.assertEqual(self.parser.query('.PROGRAM[0]'), ('ENDED AT', '2015-07-27 15:25:56.690'))
+        self.assertEqual(self.parser.query('.PROGRAM[0][1]'), '2015-07-27 15:25:56.690')
+        self.assertEqual(self.parser.query('PROGRAM'), {})
+        self.assertEqual(self.parser.query('.NONEXISTENT.foo'), {})
+
+    def test_scf(self):
+        scf = self.parser.query('.SCF')
+
+        self.assertSequenceEqual(scf['step'].tolist(), [1, 2, 3, 4, 5, 6, 100])
+        self.assertSequenceEqual(scf['run'].tolist(), [0]*7)
+        self.assertEqual(self.parser.query('.SCF.energy[6]'), -35.2547130153)
+        self.assertEqual(scf['convergence'][0], 0.00088044)
+        self.assertTrue(math.isnan(scf['convergence'][1]))  # not printed for line search steps
+        self.assertSequenceEqual(scf['converged'].tolist(), [False])
+
+    def test_json_strict(self):
+        def strict_loads(output):
+            def reject(constant):
+                raise ValueError("invalid JSON constant: {}".format(constant))
+            return json.loads(output, parse_constant=reject)
+
+        argv = ['oq', '-j', '-f', from_test_dir('output_parser_test-C4H4S.out'),
+                '.SCF.convergence', '.SCF.convergence[1]']
+        stdout = io.StringIO()
+        with mock.patch('sys.argv', argv), contextlib.redirect_stdout(stdout):
+            oq()
+
+        convergence, line_search = [strict_loads(l) for l in stdout.getvalue().splitlines()]
+        self.assertEqual(convergence[0], 0.00088044)
+        self.assertIsNone(convergence[1])  # NaN for line search steps
+        self.assertIsNone(line_search)
+
+    def test_md(self):
+        md_output = u"""
+ MD| ***************************************************************************
+ MD| Step number                                                                1
+ MD| Time [fs]                                                         0.500000
+ MD| Conserved quantity [hartree]                           -0.171500569214E+02
+ MD| ---------------------------------------------------------------------------
+ MD|                                          Instantaneous             Averages
+ MD| CPU time per MD step [s]                            2.45                2.45
+ MD| Energy drift per atom [K]          -0.102424062700E-01   0.000000000000E+00
+ MD| Potential energy [hartree]         -0.171502335224E+02  -0.171502335224E+02
+ MD| Kinetic energy [hartree]            0.176601002917E-03   0.176601002917E-03
+ MD| Temperature [K]                                 22.303              22.303
+ MD| ***************************************************************************
+ MD| Step number                                                                2
+ MD| Time [fs]                                                         1.000000
+ MD| Conserved quantity [hartree]                           -0.171500569122E+02
+ MD| Potential energy [hartree]         -0.171502311234E+02  -0.171502323229E+02
+ MD| Kinetic energy [hartree]            0.174211200000E-03   0.175406101459E-03
+ MD| Temperature [K]                                 22.001              22.152
+"""
+        old_md_output = u"""
+ ******************************************************************************
+ ENSEMBLE TYPE                =                                            NVE
+ STEP NUMBER                  =                                              1
+ TIME [fs]                    =                                       0.500000
+ CONSERVED QUANTITY [hartree] =                          -0.171500569214E+02
+
+                                              INSTANTANEOUS             AVERAGES
+ CPU TIME [s]                 =                           2.45                2.45
+ ENERGY DRIFT PER ATOM [K]    =          -0.102424062700E-01  0.000000000000E+00
+ POTENTIAL ENERGY[hartree]    =          -0.171502335224E+02 -0.171502335224E+02
+ KINETIC ENERGY [hartree]     =           0.176601002917E-03  0.176601002917E-03
+ TEMPERATURE [K]              =                  22.303   22.303
+ ******************************************************************************
+"""
+        parser = CP2KOutputParser()
+        parser.parse(io.StringIO(md_output))
+
+        self.assertSequenceEqual(parser.query('.MD.step').tolist(), [1, 2])
+        self.assertSequenceEqual(parser.query('.MD.temperature').tolist(), [22.303, 22.001])
+        self.assertEqual(parser.query('.MD.conserved[1]'), -17.1500569122)
+        self.assertEqual(parser.query('.MD.potential[0]'), -17.1502335224)
+
+        old_parser = CP2KOutputParser()
+        old_parser.parse(io.StringIO(old_md_output))
+
+        for key, values in parser.query('.MD').items():
+            self.assertEqual(old_parser.query('.MD.{}[0]'.format(key)), values[0])
+
+    def test_dispatch(self):
+        self.assertEqual(dispatch_key(' GLOBAL| Run type    ENERGY'), '|')
+        self.assertEqual(dispatch_key(' **** **** ******  **  PROGRAM STARTED AT'), '*')
+        self.assertEqual(dispatch_key('     1 OT CG       0.15E+00'), '1')
+        self.assertEqual(dispatch_key(''), '')
+
+        class ElementParserTrace(object):
+            dispatch_keys = ('T', )
+
+            def __init__(self):
+                self._lines = []
+
+            def match(self, line):
+                return line.strip().startswith('Trace(PS)')
+
+            def parse(self, line):
+                self._lines.append(line)
+
+            def finished(self):
+                return True
+
+            def data(self):
+                return {'TRACE': self._lines}
+
+        class TraceParser(CP2KOutputParser):
+            pass
+
+        TraceParser.register(ElementParserTrace)
+        self.assertNotIn(ElementParserTrace, CP2KOutputParser.ELEMENT_PARSERS)
+
+        parser = TraceParser()
+        with open(from_test_dir('output_parser_test-C4H4S.out'), 'r') as fhandle:
+            parser.parse(fhandle)
+
+        self.assertEqual(len(parser.query('.TRACE')), 2)
+        self.assertEqual(parser.query('.PROGRAM'), self.parser.query('.PROGRAM'))
+
+    def test_incremental(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        fname = os.path.join(tmpdir, 'run.out')
+
+        parser = CP2KOutputParser()
+
+        # split within the continuation line of 'PROGRAM STARTED IN' and in the middle of a line
+        split = self.content.index(b'PROGRAM STARTED IN') + 30
+        with open(fname, 'wb') as fhandle:
+            fhandle.write(self.content[:split])
+
+        nbytes = parser.parse_incremental(fname)
+        self.assertEqual(self.content[nbytes - 1:nbytes], b'\n')
+        self.assertFalse(parser.ended())
+
+        # save and restore the state in between
+        state = io.BytesIO()
+        parser.save_state(state)
+        state.seek(0)
+        parser = CP2KOutputParser.load_state(state)
+
+        with open(fname, 'ab') as fhandle:
+            fhandle.write(self.content[split:])
+
+        self.assertEqual(parser.parse_incremental(fname), len(self.content) - nbytes)
+        self.assertEqual(parser.parse_incremental(fname), 0)
+        self.assertEqual(json.dumps(parser.query('.'), default=json_default, sort_keys=True),
+                         json.dumps(self.parser.query('.'), default=json_default, sort_keys=True))
+
+        # a replaced file gets parsed from the start again
+        with open(fname, 'wb') as fhandle:
+            fhandle.write(self.content[:split].replace(b'2015', b'2016'))
+
+        parser.parse_incremental(fname)
+        self.assertEqual(parser.query('.PROGRAM.STARTED AT'), '2016-07-27 10:41:01.390')
+        self.assertEqual(parser.query('.PROGRAM.ENDED AT'), {})
+
+    def test_follow(self):
+        parser = CP2KOutputParser()
+        updates = list(parser.follow(from_test_dir('output_parser_test-C4H4S.out'), interval=0.01, timeout=0.))
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(parser.ended())
+
+        # nothing new appeared, so nothing gets yielded
+        self.assertEqual(list(parser.follow(from_test_dir('output_parser_test-C4H4S.out'), interval=0.01, timeout=0.)), [])
+
+
+class TestOutputBlockParser(unittest.TestCase):
+    def setUp(self):
+        with open(from_test_dir('output_parser_test-C4H4S.out'), 'r') as fhandle:
+            self.content = fhandle.read()
+
+    def test_parse(self):
+        out = CP2KOutputBlockParser().parse(self.content)
+
+        self.assertEqual(len(out['references']), 12)
+        self.assertEqual(out['references'][0]['authors'][0], 'Borstnik, U')
+
+        # bytes, mmapped and non-mmappable file handles give the same result
+        self.assertEqual(CP2KOutputBlockParser().parse(self.content.encode('utf-8')), out)
+
+        with open(from_test_dir('output_parser_test-C4H4S.out'), 'rb') as fhandle:
+            self.assertEqual(CP2KOutputBlockParser().parse_file(fhandle), out)
+
+        self.assertEqual(CP2KOutputBlockParser().parse_file(io.StringIO(self.content)), out)
+        self.assertEqual(CP2KOutputBlockParser().parse_file(io.BytesIO()), {'references': []})
+
+        # the references block must end at the following table, also for appended outputs
+        self.assertEqual(CP2KOutputBlockParser().parse(self.content*2), out)
+
+    def test_spans(self):
+        content, span = BlockParserReferences.search(self.content)
+        self.assertIn('R E F E R E N C E S', self.content[span[0]:span[1]])
+
+        # the old interface returns the output without the parsed block
+        parsed, rest = BlockParserReferences.parse(self.content)
+        self.assertEqual(parsed, content)
+        self.assertEqual(rest, self.content[:span[0]] + self.content[span[1]:])
+
+        class BlockParserEverything:
+            name = 'everything'
+
+            @staticmethod
+            def empty():
+                return 0
+
+            @classmethod
+            def search(cls, buf, pos=0, endpos=None):
+                return endpos - pos, (pos, endpos)
+
+        # blocks claimed by a previous block parser are skipped by the following ones
+        parser = CP2KOutputBlockParser()
+        parser._bparsers.insert(0, BlockParserEverything)
+
+        out = parser.parse(self.content)
+        self.assertEqual(out, {'everything': len(self.content), 'references': []})
+
+        # nothing to claim for any of the block parsers
+        self.assertEqual(parser.parse(''), {'everything': 0, 'references': []})
@@ -0,0 +1,252 @@
+# vim: set fileencoding=utf8 :
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cp2k_tools.pdos import (energy_mesh, broaden, read_pdos, group_pdos_files, batch_broaden,
+                             write_table, save_table)
+
+PDOS_TEMPLATE = u"""\
+# Projected DOS for atomic kind {} at iteration step i = 0, E(Fermi) =    -0.150000 a.u.
+#     MO Eigenvalue [a.u.]      Occupation            s           py           pz           px
+       1         -0.800000        2.000000      0.90000      0.01000      0.02000      0.03000
+       2         -0.300000        2.000000      0.10000      0.30000      0.30000      0.30000
+       3          0.100000        0.000000      0.00000      0.40000      0.20000      0.{}0000
+"""
+
+class TestBroaden(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.sigma = 0.02
+        self.de = 0.001
+        self.eigenvalues = rng.uniform(-1., 1., 500)
+        self.weights = rng.uniform(0., 1., (500, 3))
+        self.xmesh = energy_mesh(self.eigenvalues, self.sigma, self.de)
+
+        # the loop over the mesh points, as done originally by the cp2k_pdos.py script
+        fact = self.de/(self.sigma*np.sqrt(2.0*np.pi))
+        self.expected = np.zeros((len(self.xmesh), 3))
+        for idx in range(len(self.xmesh)):
+            func = np.exp(-(self.xmesh[idx]-self.eigenvalues)**2/(2.0*self.sigma**2))*fact
+            self.expected[idx] = func.dot(self.weights)
+
+    def test_energy_mesh(self):
+        self.assertLessEqual(self.xmesh[0], np.min(self.eigenvalues) - 10*self.sigma)
+        self.assertGreaterEqual(self.xmesh[-1], np.max(self.eigenvalues) + 10*self.sigma)
+        self.assertAlmostEqual(self.xmesh[1] - self.xmesh[0], self.de, places=5)
+
+    def test_exact_methods(self):
+        for method in ('direct', 'window'):
+            ymesh = broaden(self.eigenvalues, self.weights, self.xmesh, self.sigma, method, de=self.de)
+            self.assertEqual(ymesh.shape, self.expected.shape)
+            np.testing.assert_allclose(ymesh, self.expected, rtol=1e-12, atol=1e-14)
+
+    def test_fft(self):
+        ymesh = broaden(self.eigenvalues, self.weights, self.xmesh, self.sigma, 'fft', de=self.de)
+        self.assertEqual(ymesh.shape, self.expected.shape)
+
+        # the stated accuracy of the fft method
+        error = np.max(np.abs(ymesh - self.expected))/np.max(self.expected)
+        self.assertLess(error, (self.de/self.sigma)**2/8)
+
+    def test_single_column(self):
+        ymesh = broaden(self.eigenvalues, self.weights[:, 0], self.xmesh, self.sigma, de=self.de)
+        self.assertEqual(ymesh.shape, (len(self.xmesh), ))
+        np.testing.assert_allclose(ymesh, self.expected[:, 0], rtol=1e-12, atol=1e-14)
+
+    def test_blocks(self):
+        import cp2k_tools.pdos
+
+        # force many small blocks, including blocks without any eigenvalues in the window
+        limit = cp2k_tools.pdos._BLOCK_ELEMENTS
+        cp2k_tools.pdos._BLOCK_ELEMENTS = 1000
+        try:
+            for method in ('direct', 'window'):
+                ymesh = broaden(self.eigenvalues, self.weights, self.xmesh, self.sigma, method, de=self.de)
+                np.testing.assert_allclose(ymesh, self.expected, rtol=1e-12, atol=1e-14)
+        finally:
+            cp2k_tools.pdos._BLOCK_ELEMENTS = limit
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+            broaden(self.eigenvalues, self.weights[:-1], self.xmesh, self.sigma)
+
+        with self.assertRaises(ValueError):
+            broaden(self.eigenvalues, self.weights, self.xmesh, self.sigma, 'invalid')
+
+        with self.assertRaises(ValueError):
+            broaden(self.eigenvalues, self.weights, self.xmesh[:1], self.sigma)
+
+
+class TestTable(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.xmesh = np.linspace(-10., 10., 1001)
+        self.ymesh = rng.uniform(0., 2., (1001, 4))
+        self.ymesh[0, 0] = -0.0
+        self.headers = ['s', 'py', 'pz', 'px']
+        self.tmpdir = tempfile.mkdtemp()
+
+        # the output loop of the cp2k_pdos.py script
+        self.expected = ("{:>16}" + " {:>16}"*4 + "\n").format("Energy_[eV]", *self.headers)
+        for idx in range(len(self.xmesh)):
+            self.expected += ("{:16.8f}" + " {:16.8f}"*4 + "\n").format(self.xmesh[idx], *self.ymesh[idx, :])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_table(self):
+        import cp2k_tools.pdos
+
+        fhandle = io.StringIO()
+        write_table(fhandle, self.xmesh, self.ymesh, self.headers)
+        self.assertEqual(fhandle.getvalue(), self.expected)
+
+        # the result must not depend on how the lines got split into chunks
+        limit = cp2k_tools.pdos._WRITE_CHUNK_ELEMENTS
+        cp2k_tools.pdos._WRITE_CHUNK_ELEMENTS = 7
+        try:
+            fhandle = io.StringIO()
+            write_table(fhandle, self.xmesh, self.ymesh)
+            self.assertEqual(fhandle.getvalue(), self.expected.split('\n', 1)[1])
+        finally:
+            cp2k_tools.pdos._WRITE_CHUNK_ELEMENTS = limit
+
+        with self.assertRaises(TypeError):
+            write_table(io.StringIO(), self.xmesh[1:], self.ymesh)
+
+        with self.assertRaises(TypeError):
+            write_table(io.StringIO(), self.xmesh, self.ymesh, self.headers[1:])
+
+    def test_save_table(self):
+        import gzip
+
+        filename = os.path.join(self.tmpdir, 'pdos.dat.gz')
+        save_table(filename, self.xmesh, self.ymesh, self.headers)
+        with gzip.open(filename, 'rb') as fhandle:
+            self.assertEqual(fhandle.read().decode('utf8'), self.expected)
+
+        filename = os.path.join(self.tmpdir, 'pdos.npy')
+        save_table(filename, self.xmesh, self.ymesh, self.headers)
+        table = np.load(filename)
+        np.testing.assert_array_equal(table[:, 0], self.xmesh)
+        np.testing.assert_array_equal(table[:, 1:], self.ymesh)
+
+        # the format given explicitly, without the extension being added
+        filename = os.path.join(self.tmpdir, 'pdos')
+        save_table(filename, self.xmesh, self.ymesh, self.headers, 'npz')
+        with np.load(filename) as archive:
+            np.testing.assert_array_equal(archive['energy'], self.xmesh)
+            np.testing.assert_array_equal(archive['pdos'], self.ymesh)
+            self.assertEqual(archive['headers'].tolist(), self.headers)
+
+        filename = os.path.join(self.tmpdir, 'pdos.dat')
+        save_table(filename, self.xmesh, self.ymesh, self.headers)
+        with io.open(filename, 'r') as fhandle:
+            self.assertEqual(fhandle.read(), self.expected)
+
+        with self.assertRaises(ValueError):
+            save_table(filename, self.xmesh, self.ymesh, fmt='invalid')
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.filenames = []
+        for run in ('run1', 'run2'):
+            os.mkdir(os.path.join(self.tmpdir, run))
+            for kind, element in ((10, 'O'), (2, 'H'), (1, 'C')):
+                for spin in ('BETA', 'ALPHA'):
+                    filename = os.path.join(self.tmpdir, run, 'proj-{}_k{}-1.pdos'.format(spin, kind))
+                    with io.open(filename, 'w') as fhandle:
+                        fhandle.write(PDOS_TEMPLATE.format(element, kind % 10))
+                    self.filenames.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_pdos(self):
+        element, efermi, header, data = read_pdos(io.StringIO(PDOS_TEMPLATE.format('C', 1)))
+        self.assertEqual(element, 'C')
+        self.assertEqual(efermi, -0.15)
+        self.assertEqual(header, ['MO', 'Eigenvalue [a.u.]', 'Occupation', 's', 'py', 'pz', 'px'])
+        np.testing.assert_array_equal(data, np.loadtxt(io.StringIO(PDOS_TEMPLATE.format('C', 1))))
+
+        with self.assertRaises(ValueError):
+            read_pdos(io.StringIO(u"not a PDOS file\n"))
+
+        with self.assertRaises(ValueError):
+            read_pdos(io.StringIO(PDOS_TEMPLATE.format('C', 1) + u"  4  0.3\n"))
+
+        # an invalid value must not silently truncate the data
+        with self.assertRaises(ValueError):
+            read_pdos(io.StringIO(PDOS_TEMPLATE.format('C', 1) + u"  x  0.3  2.0  0.1  0.1  0.1  0.1\n"))
+
+    def test_read_pdos_readers(self):
+        # np.loadtxt (numpy >= 1.23) and the conversion in one go must give the same
+        import cp2k_tools.pdos
+
+        header = u"\n".join(PDOS_TEMPLATE.format('C', 1).splitlines()[:2]) + u"\n"
+        tables = [PDOS_TEMPLATE.format('C', 1), header + PDOS_TEMPLATE.format('C', 1).splitlines()[2] + u"\n", header]
+
+        fast = cp2k_tools.pdos._FAST_LOADTXT
+        try:
+            results = []
+            for cp2k_tools.pdos._FAST_LOADTXT in (True, False):
+                results.append([read_pdos(io.StringIO(table))[3] for table in tables])
+
+                with self.assertRaises(ValueError):
+                    read_pdos(io.StringIO(header + u"  1  0.3  2.0  0.1  0.1  0.1\n"*5))
+        finally:
+            cp2k_tools.pdos._FAST_LOADTXT = fast
+
+        for fast_data, data, shape in zip(results[0], results[1], [(3, 7), (1, 7), (0, 7)]):
+            self.assertEqual(fast_data.shape, shape)
+            np.testing.assert_array_equal(fast_data, data)
+
+    def test_group_pdos_files(self):
+        groups = group_pdos_files(self.filenames + ['other.pdos'])
+
+        self.assertEqual(list(groups), [os.path.join(self.tmpdir, 'run1', 'proj-1'),
+                                        os.path.join(self.tmpdir, 'run2', 'proj-1'), 'other'])
+
+        # ordered by the kind number and spin, alpha first
+        self.assertEqual([os.path.basename(f) for f in groups[os.path.join(self.tmpdir, 'run1', 'proj-1')]],
+                         ['proj-ALPHA_k1-1.pdos', 'proj-BETA_k1-1.pdos', 'proj-ALPHA_k2-1.pdos',
+                          'proj-BETA_k2-1.pdos', 'proj-ALPHA_k10-1.pdos', 'proj-BETA_k10-1.pdos'])
+        self.assertEqual(groups['other'], ['other.pdos'])
+
+        # the PDOS printed at different steps (of an MD or GEO_OPT) are separate calculations
+        filenames = [os.path.join('md', 'proj-k{}-{}.pdos'.format(kind, step)) for step in (1, 2) for kind in (1, 2)]
+        groups = group_pdos_files(filenames)
+        self.assertEqual(list(groups.items()), [(os.path.join('md', 'proj-1'), filenames[:2]),
+                                                (os.path.join('md', 'proj-2'), filenames[2:])])
+
+    def test_batch_broaden(self):
+        groups = group_pdos_files(self.filenames)
+
+        serial = list(batch_broaden(groups, workers=1))
+        parallel = list(batch_broaden(groups, workers=2))
+
+        self.assertEqual([r[0] for r in serial], list(groups))
+        self.assertEqual([r[0] for r in parallel], list(groups))
+
+        for (calculation, efermi, xmesh, ymesh, headers), result in zip(serial, parallel):
+            self.assertEqual(efermi, -0.15)
+            self.assertEqual(ymesh.shape, (len(xmesh), 6*4))
+            self.assertEqual(headers[:5], ['C_alpha_s', 'C_alpha_py', 'C_alpha_pz', 'C_alpha_px', 'C_beta_s'])
+            self.assertEqual(headers[-1], 'O_beta_px')
+
+            np.testing.assert_array_equal(result[2], xmesh)
+            np.testing.assert_array_equal(result[3], ymesh)
+
+            # each block of columns is the broadening of a single file on the common mesh
+            with open(groups[calculation][-1], 'r') as fhandle:
+                _, _, _, data = read_pdos(fhandle)
+            np.testing.assert_allclose(ymesh[:, -4:], broaden(data[:, 1], data[:, 3:], xmesh, 0.02, de=0.001))
@@ -2,9 +2,12 @@
 
 import unittest
 
+import numpy as np
 from click.testing import CliRunner
 
-from cp2k_tools.parser.xyz_cli import xyz_restart_cleaner
+from cp2k_tools.parser.xyz import XYZParser
+from cp2k_tools.parser.xyz_cli import xyz_restart_cleaner, xyz2store
+from cp2k_tools.parser.xyz_store import XYZStore
 
 from . import from_test_dir
 
@@ -19,7 +22,51 @@ class TestXYZCLI(unittest.TestCase):
 
             output_msg = [
                 "WARNING: found earlier restart point than previous one, can not drop already flushed frames",
-                "found restart point @4, dropping 2 frames, flushing 0",
+                "found restart point @4, dropping 1 frames, flushing 0",  # the number of frames actually dropped
                 "flushing remaining 2 frames",
                 ]
             self.assertSequenceEqual(result.output.splitlines(), output_msg)
+
+            with open(from_test_dir("xyz_parser_test-cp2k-output.xyz"), 'rb') as fhandle:
+                expected = fhandle.read().splitlines(True)[7:]  # the first frame has been dropped
+
+            with open("foo.xyz", 'rb') as fhandle:
+                self.assertEqual(fhandle.read(), b"".join(expected))
+
+    def test_max_frames(self):
+        with self.runner.isolated_filesystem():
+            result = self.runner.invoke(xyz_restart_cleaner,
+                                        [from_test_dir("xyz_parser_test-cp2k-output.xyz"), "foo.xyz",
+                                         "--max-frames", "1"])
+
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(result.output.splitlines()[-1], "flushing remaining 1 frames")
+
+            with open(from_test_dir("xyz_parser_test-cp2k-output.xyz"), 'rb') as fhandle:
+                expected = fhandle.read().splitlines(True)[7:]
+
+            with open("foo.xyz", 'rb') as fhandle:
+                self.assertEqual(fhandle.read(), b"".join(expected))
+
+    def test_xyz2store(self):
+        source = from_test_dir("xyz_parser_test-simple_multiframe_file.xyz")
+
+        with self.runner.isolated_filesystem():
+            result = self.runner.invoke(xyz2store, [source, "traj", "--single"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(result.output, "traj: 3 frames of 5 atoms\n")
+
+            result = self.runner.invoke(xyz2store, [source, "traj", "--append"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(result.output, "traj: 6 frames of 5 atoms\n")
+
+            store = XYZStore("traj")
+            self.assertEqual(store.coords.dtype, np.float32)
+
+            with open(source, 'rb') as fhandle:
+                coords, _, _ = XYZParser.parse_arrays(fhandle)
+            self.assertTrue(np.allclose(store[3:], coords))
+
+            # the store exists already
+            result = self.runner.invoke(xyz2store, [source, "traj"])
+            self.assertNotEqual(result.exit_code, 0)
@@ -0,0 +1,73 @@
+# vim: set fileencoding=utf8 :
+
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from cp2k_tools.parser.xyz import XYZParser
+from cp2k_tools.generator.xyz import XYZGenerator
+
+from . import from_test_dir
+
+class TestXYZGenerator(unittest.TestCase):
+    def setUp(self):
+        with open(from_test_dir('xyz_parser_test-cp2k-output.xyz'), 'r') as fhandle:
+            content = fhandle.read()
+
+        self.frames = XYZParser.parse(content)
+        self.coords, self.symbols, self.comments = XYZParser.parse_arrays(content)
+
+    def _write(self, *args, **kwargs):
+        fhandle = io.StringIO()
+        XYZGenerator().write(*args + (fhandle, ), **kwargs)
+        return fhandle.getvalue()
+
+    def test_write_arrays(self):
+        expected = self._write(self.frames)
+
+        output = io.StringIO()
+        XYZGenerator().write_arrays(self.coords, self.symbols, output, self.comments)
+        self.assertEqual(output.getvalue(), expected)
+
+        # the result must not depend on how the frames got split into chunks
+        raw = io.BytesIO()
+        output = io.BufferedWriter(raw)
+        XYZGenerator().write_arrays(self.coords, self.symbols, output, self.comments, chunk_size=1)
+        output.flush()
+        self.assertEqual(raw.getvalue(), expected.encode('utf-8'))
+
+        # unbuffered binary file handles are not BufferedIOBase, but must get bytes as well
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'output.xyz')
+            with open(filename, 'wb', buffering=0) as output:
+                XYZGenerator().write_arrays(self.coords, self.symbols, output, self.comments)
+            with open(filename, 'rb') as fhandle:
+                self.assertEqual(fhandle.read(), expected.encode('utf-8'))
+
+    def test_write_arrays_random(self):
+        rng = np.random.RandomState(42)
+        coords = rng.uniform(-1000, 1000, (7, 13, 3))
+        coords[0, 0, 0] = -0.
+        coords[1, 2, 1] = 1e-12
+        symbols = rng.choice(['H', 'C', 'Na', 'Uuo'], 13)
+
+        frames = [{'comment': '%i %%' % num,
+                   'atoms': [(sym, tuple(pos)) for sym, pos in zip(symbols, frame)]}
+                  for num, frame in enumerate(coords)]
+
+        output = io.StringIO()
+        XYZGenerator().write_arrays(coords, symbols, output, [f['comment'] for f in frames], chunk_size=1000)
+        self.assertEqual(output.getvalue(), self._write(frames))
+
+    def test_write_arrays_mismatch(self):
+        with self.assertRaises(TypeError):
+            XYZGenerator().write_arrays(self.coords, self.symbols[1:], io.StringIO())
+
+        with self.assertRaises(TypeError):
+            XYZGenerator().write_arrays(self.coords, self.symbols, io.StringIO(), self.comments[1:])
+
+        with self.assertRaises(TypeError):
+            XYZGenerator().write_arrays(self.coords[0], self.symbols, io.StringIO())
@@ -1,8 +1,13 @@
 # vim: set fileencoding=utf8 :
 
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
-from cp2k_tools.parser.xyz import XYZParser
+from cp2k_tools.parser import xyz
+from cp2k_tools.parser.xyz import XYZParser, XYZFrameIndex
 
 from . import from_test_dir
 
@@ -37,3 +42,232 @@ class TestXYZParser(unittest.TestCase):
         with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'rb') as fhandle:
             parsed = XYZParser.parse(fhandle)
             self.assertTrue(parsed)
+
+    def test_arrays(self):
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'rb') as fhandle:
+            coords, symbols, comments = XYZParser.parse_arrays(fhandle)
+
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'r') as fhandle:
+            parsed = XYZParser.parse(fhandle.read())
+
+        self.assertEqual(coords.shape, (3, 5, 3))
+        self.assertSequenceEqual(list(symbols), ['C', 'H', 'H', 'H', 'H'])
+        self.assertSequenceEqual(comments, [e['comment'] for e in parsed])
+        self.assertSequenceEqual(coords.tolist(), [[list(a[1]) for a in e['atoms']] for e in parsed])
+
+    def test_frame_index(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        fname = os.path.join(tmpdir, 'traj.xyz')
+        shutil.copy(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), fname)
+
+        with open(fname, 'r') as fhandle:
+            parsed = XYZParser.parse(fhandle.read())
+
+        with open(fname, 'rb') as fhandle:
+            self.assertEqual(XYZParser.frame(fhandle, -1), parsed[-1])
+            self.assertEqual(XYZParser.frames(fhandle, slice(None, None, 2)), parsed[::2])
+
+        # read-only access must not leave anything behind next to the file
+        self.assertEqual(os.listdir(tmpdir), ['traj.xyz'])
+
+        with open(fname, 'rb') as fhandle:
+            index = XYZParser.index(fhandle, sidecar=True)
+            self.assertEqual(XYZParser.frames(fhandle, slice(None, None, 2), index), parsed[::2])
+
+        self.assertTrue(os.path.exists(XYZFrameIndex.sidecar_path(fname)))
+
+        with open(fname, 'rb') as fhandle:
+            fstat = os.fstat(fhandle.fileno())
+            index = XYZFrameIndex.load(fname, fstat.st_size, fstat.st_mtime)
+            self.assertEqual(len(index), 3)
+            self.assertSequenceEqual(index.comments, [e['comment'] for e in parsed])
+
+        # a changed file must invalidate the sidecar
+        with open(fname, 'ab') as fhandle:
+            fhandle.write(b"1\n\n C 0.0 0.0 0.0\n")
+
+        with open(fname, 'rb') as fhandle:
+            fstat = os.fstat(fhandle.fileno())
+            self.assertIsNone(XYZFrameIndex.load(fname, fstat.st_size, fstat.st_mtime))
+            self.assertEqual(XYZParser.frame(fhandle, -1)['natoms'], 1)
+
+    def test_last_frames(self):
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'r') as fhandle:
+            content = fhandle.read()
+
+        parsed = XYZParser.parse(content)
+
+        self.assertEqual(XYZParser.last_frame(content), parsed[-1])
+        self.assertEqual(XYZParser.last_n(content, 2), parsed[-2:])
+        self.assertEqual(XYZParser.last_n(content, 10), parsed)
+
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'rb') as fhandle:
+            self.assertEqual(XYZParser.last_frame(fhandle), parsed[-1])
+
+        # a truncated frame at the end (like left by a killed job) must be skipped
+        truncated = content + "       5\n i = 4\n  C  5.0 5.0 5.0\n  H  5.6 5.6"
+        self.assertEqual(XYZParser.last_n(truncated, 2), parsed[-2:])
+
+        # a comment line containing only a number must not be taken for a frame header
+        numeric_comments = "2\n3\n C 0.0 0.0 0.0\n H 1.0 1.0 1.0\n2\n2\n C 0.0 0.0 0.0\n H 1.0 1.0 1.0\n"
+        self.assertSequenceEqual([f['comment'] for f in XYZParser.last_n(numeric_comments, 2)], ['3', '2'])
+
+        with self.assertRaises(IndexError):
+            XYZParser.last_frame("")
+
+        # the scan stops as soon as enough frames are found
+        scanned = []
+        reverse_frame_iter = xyz._reverse_frame_iter
+
+        def counting_reverse_frame_iter(*args):
+            for block in reverse_frame_iter(*args):
+                scanned.append(block.start())
+                yield block
+
+        with mock.patch.object(xyz, '_reverse_frame_iter', counting_reverse_frame_iter):
+            self.assertEqual(XYZParser.last_frame(content), parsed[-1])
+            self.assertEqual(len(scanned), 1)
+            self.assertEqual(XYZParser.last_n(content, 0), [])
+            self.assertEqual(len(scanned), 1)
+
+    def test_comment_lines(self):
+        # commented out and blank lines within the atom lines are accepted by parse(),
+        # the header scan must not count them as atom lines
+        fname = from_test_dir('xyz_parser_test-comment_lines.xyz')
+
+        with open(fname, 'r') as fhandle:
+            parsed = XYZParser.parse(fhandle.read())
+
+        self.assertEqual(len(parsed), 4)
+        headers = [(f['natoms'], f['comment']) for f in parsed]
+
+        with open(fname, 'rb') as fhandle:
+            self.assertEqual(list(XYZParser.iter_headers(fhandle)), headers)
+            self.assertEqual(XYZParser.count_frames(fhandle), 4)
+
+            lazy = [{'natoms': natoms, 'comment': comment, 'atoms': list(atomiter)}
+                    for natoms, comment, atomiter in XYZParser.parse_iter(fhandle, lazy=True)]
+            self.assertEqual(lazy, parsed)
+
+            index = XYZParser.index(fhandle)
+            self.assertEqual(XYZParser.frames(fhandle, slice(None), index), parsed)
+
+            coords, _, comments = XYZParser.parse_arrays(fhandle)
+            self.assertEqual(comments, [f['comment'] for f in parsed])
+
+            for workers in (2, 3):
+                pcoords, _, pcomments = XYZParser.parse_arrays(fhandle, workers=workers)
+                self.assertSequenceEqual(pcoords.tolist(), coords.tolist())
+                self.assertSequenceEqual(pcomments, comments)
+
+    def test_headers(self):
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'r') as fhandle:
+            content = fhandle.read()
+
+        parsed = XYZParser.parse(content)
+        headers = [(f['natoms'], f['comment']) for f in parsed]
+
+        self.assertEqual(list(XYZParser.iter_headers(content)), headers)
+        self.assertEqual(XYZParser.count_frames(content), 3)
+
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'rb') as fhandle:
+            self.assertEqual(list(XYZParser.iter_headers(fhandle)), headers)
+            self.assertEqual(XYZParser.count_frames(fhandle), 3)
+
+        # frames with a different size than the previous one, a frame with an atom line
+        # too few (swallowing the following header) and an incomplete frame at the end
+        content = ("2\na\n C 0.0 0.0 0.0\n H 1.0 1.0 1.0\n"
+                   "2\nb\n C 0.0 0.0 0.0\n H 100.0 1.0 1.0\n"
+                   "3\nc\n C 0.0 0.0 0.0\n"
+                   "1\nd\n C 0.0 0.0 0.0\n"
+                   "2\ne\n C 0.0 0.0 0.0\n")
+        self.assertEqual(list(XYZParser.iter_headers(content)), [(2, 'a'), (2, 'b'), (3, 'c')])
+
+        # anything between frames is skipped
+        content = content.replace("2\nb\n", "garbage\n\n2\nb\n")
+        self.assertEqual(list(XYZParser.iter_headers(content)), [(2, 'a'), (2, 'b'), (3, 'c')])
+
+    def test_lazy_parse_iter(self):
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'rb') as fhandle:
+            parsed = XYZParser.parse(fhandle)
+            lazy = [{'natoms': natoms, 'comment': comment, 'atoms': list(atomiter)}
+                    for natoms, comment, atomiter in XYZParser.parse_iter(fhandle, lazy=True)]
+
+        self.assertEqual(lazy, parsed)
+
+        # the atom entries get only validated when iterating over them
+        content = "2\n\n C 0.0 0.0 0.0\n foo\n1\n\n C 0.0 0.0 0.0\n"
+        frames = list(XYZParser.parse_iter(content, lazy=True))
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(list(frames[1][2]), [('C', (0., 0., 0.))])
+
+        with self.assertRaises(TypeError):
+            list(frames[0][2])
+
+    def test_lazy_parse_iter_headers_only(self):
+        # the file must be closed properly without the atom entries being iterated over
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'rb') as fhandle:
+            nframes = 0
+            for natoms, _, _ in XYZParser.parse_iter(fhandle, lazy=True):
+                self.assertEqual(natoms, 5)
+                nframes += 1
+            self.assertEqual(nframes, 3)
+
+            frames = list(XYZParser.parse_iter(fhandle, lazy=True))
+            self.assertEqual([natoms for natoms, _, _ in frames], [5]*3)
+
+    def test_arrays_parallel(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        fname = os.path.join(tmpdir, 'traj.xyz')
+        shutil.copy(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), fname)
+
+        with open(fname, 'rb') as fhandle:
+            coords, symbols, comments = XYZParser.parse_arrays(fhandle)
+            pcoords, psymbols, pcomments = XYZParser.parse_arrays(fhandle, workers=2)
+
+        self.assertSequenceEqual(pcoords.tolist(), coords.tolist())
+        self.assertSequenceEqual(list(psymbols), list(symbols))
+        self.assertSequenceEqual(pcomments, comments)
+        self.assertEqual(os.listdir(tmpdir), ['traj.xyz'])
+
+        # the workers split the file at arbitrary byte offsets, including within the header
+        # of a frame and at comment lines containing only a number
+        with open(fname, 'wb') as fhandle:
+            for num in range(20):
+                fhandle.write("3\n{}\n".format(num % 4 if num % 2 else 'i = {}'.format(num)).encode('utf8'))
+                for atom in range(3):
+                    fhandle.write(" H {0:.1f} {1:.1f} 1.0\n".format(num, atom).encode('utf8'))
+
+        with open(fname, 'rb') as fhandle:
+            coords, symbols, comments = XYZParser.parse_arrays(fhandle)
+            self.assertEqual(coords.shape, (20, 3, 3))
+
+            for workers in (2, 3, 5):
+                pcoords, psymbols, pcomments = XYZParser.parse_arrays(fhandle, workers=workers)
+                self.assertSequenceEqual(pcoords.tolist(), coords.tolist())
+                self.assertSequenceEqual(pcomments, comments)
+
+    def test_arrays_truncated(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'rb') as fhandle:
+            content = fhandle.read()
+
+        # three complete frames followed by a 4th frame cut off after its second atom
+        fname = os.path.join(tmpdir, 'traj.xyz')
+        with open(fname, 'wb') as fhandle:
+            fhandle.write(content + b''.join(content.splitlines(True)[:4]))
+
+        with open(fname, 'rb') as fhandle:
+            errors = []
+            for workers in (1, 2):
+                with self.assertRaises(ValueError) as context:
+                    XYZParser.parse_arrays(fhandle, workers=workers)
+                errors.append(str(context.exception))
+
+        self.assertEqual(errors[0], errors[1])
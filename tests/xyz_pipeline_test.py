@@ -0,0 +1,197 @@
+# vim: set fileencoding=utf8 :
+
+import io
+import unittest
+
+import numpy as np
+from click.testing import CliRunner
+
+from cp2k_tools.parser.xyz import XYZParser
+from cp2k_tools.parser.xyz_cli import xyz_filter, xyz_restart_cleaner
+
+from . import from_test_dir
+
+
+def _trajectory(iterations, natoms=3):
+    frames = []
+    for num in iterations:
+        frames.append("%8i\n i = %8i, time = %12.3f, E = %20.10f\n" % (natoms, num, 0.5*num, -1.*num))
+        frames += [" %2s %20.10f%20.10f%20.10f\n" % ('H' if atom else 'O', num, atom, 0.5)
+                   for atom in range(natoms)]
+    return "".join(frames)
+
+
+class TestXYZPipeline(unittest.TestCase):
+    def setUp(self):
+        # a trajectory restarted at iteration 5, with iterations 5 and 6 written again
+        self.iterations = list(range(7)) + list(range(5, 10))
+        self.content = _trajectory(self.iterations)
+
+    def _iterations(self, pipeline):
+        return [frame.fields['iteration'] for frame in pipeline]
+
+    def test_unfiltered(self):
+        for content in [self.content, self.content.encode('utf8')]:
+            self.assertEqual(list(XYZParser.pipeline(content).frames()), XYZParser.parse(self.content))
+
+            coords, symbols, comments = XYZParser.pipeline(content).arrays()
+            expected = XYZParser.parse_arrays(self.content)
+            self.assertTrue(np.array_equal(coords, expected[0]))
+            self.assertEqual(symbols.tolist(), expected[1].tolist())
+            self.assertEqual(comments, expected[2])
+
+            output = io.StringIO()
+            self.assertEqual(XYZParser.pipeline(content).write(output), len(self.iterations))
+            self.assertEqual(output.getvalue(), self.content)
+
+    def test_stages(self):
+        pipeline = XYZParser.pipeline(self.content)
+
+        self.assertEqual(self._iterations(pipeline.stride(3)), self.iterations[::3])
+        self.assertEqual(self._iterations(pipeline.stride(3, 1)), self.iterations[1::3])
+        self.assertEqual(self._iterations(pipeline.dedup()), list(range(10)))
+        self.assertEqual(self._iterations(pipeline.time_window(1., 2.)), [2, 3, 4])
+        self.assertEqual(self._iterations(pipeline.time_window(stop=1.)), [0, 1, 2])
+        self.assertEqual(self._iterations(pipeline.time_window(8, field='iteration')), [8, 9])
+        self.assertEqual(self._iterations(pipeline.dedup().time_window(start=3.).stride(2)), [6, 8])
+
+        # stages return new pipelines
+        self.assertEqual(len(list(pipeline)), len(self.iterations))
+
+    def test_comment_lines(self):
+        # commented out and blank lines between the atom lines, as accepted by XYZParser.parse(...)
+        with open(from_test_dir('xyz_parser_test-comment_lines.xyz'), 'rb') as fhandle:
+            content = fhandle.read()
+
+        parsed = XYZParser.parse(content)
+
+        coords, symbols, _ = XYZParser.pipeline(content).arrays()
+        self.assertEqual(coords.shape, (4, 3, 3))
+        self.assertEqual(symbols.tolist(), ['O', 'H', 'H'])
+        self.assertEqual(coords.tolist(), [[list(atom[1]) for atom in frame['atoms']] for frame in parsed])
+
+        output = io.BytesIO()
+        self.assertEqual(XYZParser.pipeline(content).write(output), 4)
+        self.assertEqual(output.getvalue(), content)
+
+        pipeline = XYZParser.pipeline(content).atoms([2, 0])
+        self.assertEqual([frame['atoms'] for frame in pipeline.frames()],
+                         [[frame['atoms'][2], frame['atoms'][0]] for frame in parsed])
+
+        coords, symbols, _ = pipeline.arrays()
+        self.assertEqual(symbols.tolist(), ['H', 'O'])
+        self.assertEqual(coords[:, 0, 1].tolist(), [-0.7572, -0.7573, -0.7574, -0.7575])
+
+        output = io.BytesIO()
+        pipeline.write(output)
+        self.assertEqual([frame['atoms'] for frame in XYZParser.parse(output.getvalue())],
+                         [[frame['atoms'][2], frame['atoms'][0]] for frame in parsed])
+
+    def test_atoms(self):
+        pipeline = XYZParser.pipeline(self.content.encode('utf8')).stride(5).atoms([2, 0])
+
+        coords, symbols, _ = pipeline.arrays()
+        self.assertEqual(coords.shape, (3, 2, 3))
+        self.assertEqual(symbols.tolist(), ['H', 'O'])
+        self.assertEqual(coords[1, :, 1].tolist(), [2., 0.])
+
+        frame = next(iter(pipeline.atoms([1])))
+        self.assertEqual(frame.to_dict()['atoms'], [('O', (0., 0., 0.5))])
+
+        output = io.BytesIO()
+        pipeline.write(output)
+        self.assertEqual(XYZParser.parse(output.getvalue())[1]['atoms'],
+                         [('H', (5., 2., 0.5)), ('O', (5., 0., 0.5))])
+
+        with self.assertRaises(IndexError):
+            list(pipeline.atoms([2]))
+
+        # negative indices count from the end
+        pipeline = XYZParser.pipeline(self.content).stride(5)
+        self.assertEqual(list(pipeline.atoms([-1, 0]).frames()), list(pipeline.atoms([2, 0]).frames()))
+
+        output = io.StringIO()
+        pipeline.atoms([-1, 0]).write(output)
+        self.assertEqual([f['atoms'] for f in XYZParser.parse(output.getvalue())],
+                         [f['atoms'] for f in pipeline.atoms([2, 0]).frames()])
+
+        with self.assertRaises(IndexError):
+            list(pipeline.atoms([-4]))
+
+    def test_resync(self):
+        # a truncated frame at the end and garbage in between are skipped
+        content = "garbage\n" + _trajectory([0, 1]) + "\n" + _trajectory([2]) + _trajectory([3])[:-30]
+        self.assertEqual(self._iterations(XYZParser.pipeline(content)), [0, 1, 2])
+
+    def test_cli(self):
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            with open('traj.xyz', 'w') as fhandle:
+                fhandle.write(self.content)
+
+            result = runner.invoke(xyz_filter, ['traj.xyz', 'out.xyz', '--dedup', '--from-time', '1',
+                                                '--stride', '2', '--atoms', '0-1'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(result.output, "wrote 4 frames\n")
+
+            with open('out.xyz', 'r') as fhandle:
+                frames = XYZParser.parse(fhandle.read())
+
+            self.assertEqual([f['comment'] for f in frames],
+                             [" i = %8i, time = %12.3f, E = %20.10f" % (i, 0.5*i, -1.*i) for i in [2, 4, 6, 8]])
+            self.assertEqual([f['natoms'] for f in frames], [2]*4)
+
+            result = runner.invoke(xyz_filter, ['traj.xyz', 'out.xyz', '--atoms', '1,a'])
+            self.assertNotEqual(result.exit_code, 0)
+
+    def test_dedup(self):
+        pipeline = XYZParser.pipeline(self.content)
+        frames = list(pipeline)
+
+        # the frames of iterations 5 and 6 written after the restart are kept by default
+        self.assertEqual([f.start for f in pipeline.dedup()], [f.start for f in frames[:5] + frames[7:]])
+        self.assertEqual([f.start for f in pipeline.dedup(keep='first')], [f.start for f in frames[:7] + frames[9:]])
+
+        with self.assertRaises(ValueError):
+            pipeline.dedup(keep='invalid')
+
+    def test_restart_cleaner(self):
+        # frames written every 10 iterations, restarted at iteration 10
+        content = _trajectory([0, 10, 20, 10, 20, 30])
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('traj.xyz', 'w') as fhandle:
+                fhandle.write(content)
+
+            result = runner.invoke(xyz_restart_cleaner, ['traj.xyz', 'clean.xyz'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(result.output.splitlines(), ["found restart point @20, dropping 2 frames, flushing 1",
+                                                          "flushing remaining 3 frames"])
+
+            with open('clean.xyz', 'r') as fhandle:
+                self.assertEqual(fhandle.read(), _trajectory([0, 10, 20, 30]))
+
+            # a restart going back further than the frames held back
+            result = runner.invoke(xyz_restart_cleaner, ['traj.xyz', 'clean.xyz', '--max-frames', '1'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("WARNING", result.output)
+
+            with open('clean.xyz', 'r') as fhandle:
+                self.assertEqual(fhandle.read(), _trajectory([0, 10, 10, 20, 30]))
+
+    def test_cp2k_output(self):
+        with open(from_test_dir('xyz_parser_test-cp2k-output.xyz'), 'rb') as fhandle:
+            self.assertEqual(self._iterations(XYZParser.pipeline(fhandle).dedup()), [3, 4])
+            self.assertEqual(self._iterations(XYZParser.pipeline(fhandle).dedup(keep='first')), [4])
+
+            # the same as the xyz_restart_cleaner
+            output = io.BytesIO()
+            XYZParser.pipeline(fhandle).dedup().write(output)
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            runner.invoke(xyz_restart_cleaner, [from_test_dir('xyz_parser_test-cp2k-output.xyz'), 'clean.xyz'])
+            with open('clean.xyz', 'rb') as fhandle:
+                self.assertEqual(output.getvalue(), fhandle.read())
@@ -0,0 +1,78 @@
+# vim: set fileencoding=utf8 :
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cp2k_tools.parser.xyz import XYZParser
+from cp2k_tools.parser.xyz_store import XYZStore
+
+from . import from_test_dir
+
+class TestXYZStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'traj.store')
+
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'r') as fhandle:
+            self.content = fhandle.read()
+
+        self.coords, self.symbols, self.comments = XYZParser.parse_arrays(self.content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_from_xyz(self):
+        with open(from_test_dir('xyz_parser_test-simple_multiframe_file.xyz'), 'rb') as fhandle:
+            XYZStore.from_xyz(fhandle, self.path, chunk_frames=2)
+
+        store = XYZStore(self.path)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.natoms, 5)
+        self.assertIsInstance(store.coords, np.memmap)
+        self.assertTrue(np.array_equal(store.coords, self.coords))
+        self.assertTrue(np.array_equal(store[1], self.coords[1]))
+        self.assertSequenceEqual(store.symbols.tolist(), self.symbols.tolist())
+        self.assertSequenceEqual(store.comments, self.comments)
+
+        # appending a trajectory with the same atoms
+        XYZStore.from_xyz(self.content, self.path, append=True)
+        store = XYZStore(self.path)
+        self.assertEqual(len(store), 6)
+        self.assertTrue(np.array_equal(store[3:], self.coords))
+        self.assertSequenceEqual(store.comments, self.comments*2)
+
+        with self.assertRaises(TypeError):
+            XYZStore.from_xyz("2\n\nH 0.0 0.0 0.0\nH 0.0 0.0 0.74\n", self.path, append=True)
+
+    def test_append(self):
+        store = XYZStore.create(self.path, self.symbols, dtype='float32')
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.coords.shape, (0, 5, 3))
+
+        store.append(self.coords[0], [u'Ω≈ç√∫˜µ≤≥÷'])
+        store.append(self.coords[1:])
+
+        # data written by an interrupted append is ignored and overwritten
+        with open(os.path.join(self.path, XYZStore.COORDS), 'ab') as fhandle:
+            fhandle.write(b'garbage')
+        with open(os.path.join(self.path, XYZStore.COMMENTS), 'ab') as fhandle:
+            fhandle.write(b'garbage\n')
+
+        store = XYZStore(self.path)
+        self.assertEqual(store.coords.dtype, np.float32)
+        self.assertTrue(np.allclose(store.coords, self.coords))
+        self.assertSequenceEqual(store.comments, [u'Ω≈ç√∫˜µ≤≥÷', '', ''])
+
+        store.append(self.coords[:1], ['last'])
+        self.assertEqual(len(XYZStore(self.path)), 4)
+        self.assertSequenceEqual(XYZStore(self.path).comments, [u'Ω≈ç√∫˜µ≤≥÷', '', '', 'last'])
+
+        with self.assertRaises(TypeError):
+            store.append(self.coords[:, 1:])
+
+        with self.assertRaises(TypeError):
+            store.append(self.coords, ['only one'])